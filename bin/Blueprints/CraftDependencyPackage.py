@@ -4,7 +4,6 @@ from enum import unique, Enum, IntFlag
 from Blueprints.CraftPackageObject import CraftPackageObject, BlueprintException
 from Blueprints.CraftVersion import CraftVersion
 from CraftCore import CraftCore
-from Package import VirtualPackageBase
 from info import DependencyRequirementType
 
 
@@ -49,15 +48,15 @@ class CraftDependencyPackage(CraftPackageObject):
     def __resolveDependencies(self):
         CraftCore.log.debug(f"resolving package {self}")
         if not self.isCategory():
-            subinfo = self.subinfo
+            metaData = self.metaData
             if self.depenendencyType & DependencyType.Runtime:
                 self.dependencies.extend(self.__readDependenciesForChildren([(x, None) for x in self.categoryInfo.runtimeDependencies]))
-                self.dependencies.extend(self.__readDependenciesForChildren(subinfo.runtimeDependencies.items()))
+                self.dependencies.extend(self.__readDependenciesForChildren(metaData.runtimeDependencies))
             if self.depenendencyType & DependencyType.Buildtime:
                 self.dependencies.extend(self.__readDependenciesForChildren([(x, None) for x in self.categoryInfo.buildDependencies]))
-                self.dependencies.extend(self.__readDependenciesForChildren(subinfo.buildDependencies.items()))
+                self.dependencies.extend(self.__readDependenciesForChildren(metaData.buildDependencies))
             if self.depenendencyType & DependencyType.Packaging:
-                self.dependencies.extend(self.__readDependenciesForChildren(subinfo.packagingDependencies.items()))
+                self.dependencies.extend(self.__readDependenciesForChildren(metaData.packagingDependencies))
         else:
             self.dependencies.extend(self.__readDependenciesForChildren([(x, None) for x in self.children.values()]))
 
@@ -76,7 +75,7 @@ class CraftDependencyPackage(CraftPackageObject):
                                 raise BlueprintException(f"{self} requries {package}, but it is not supported on {CraftCore.compiler.compiler}",self)
                             if not bool(package.categoryInfo.platforms & CraftCore.compiler.platform):
                                 raise BlueprintException(f"{self} requries {package}, but it is not supported on {CraftCore.compiler.platform}",self)
-                            if package.isIgnored() or isinstance(package.instance, VirtualPackageBase.VirtualPackageBase):
+                            if package.isIgnored() or package.metaData.isVirtual:
                                 raise BlueprintException(f"{self} requries {package}, but it is ignored",self)
 
                     if requiredVersion and requiredVersion != None and CraftVersion(package.version) < CraftVersion(requiredVersion):
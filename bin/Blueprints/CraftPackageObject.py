@@ -24,8 +24,11 @@
 
 import copy
 import configparser
+import datetime
+import hashlib
 import importlib
 import os
+import pickle
 import re
 
 import utils
@@ -35,7 +38,8 @@ from CraftOS.osutils import OsUtils
 
 
 class CategoryPackageObject(object):
-    def __init__(self, localPath : str):
+    def __init__(self, localPath : str, general : dict=None):
+        """general: the content of the General section of the info.ini in localPath, None if there is no info.ini"""
         self.localPath = localPath
         self.description = ""
         self.webpage = ""
@@ -50,11 +54,10 @@ class CategoryPackageObject(object):
         self.runtimeDependencies = []
         self.buildDependencies = []
 
-        ini = os.path.join(self.localPath, "info.ini")
-        if os.path.exists(ini):
+        if general is not None:
             self.valid = True
             info = configparser.ConfigParser()
-            info.read(ini)
+            info.read_dict({"General": general})
             general = info["General"]
             self.displayName = general.get("displayName", "")
             self.description = general.get("description", "")
@@ -79,6 +82,16 @@ class CategoryPackageObject(object):
             self.pathOverride = general.get("pathOverride", None)
             self.forceOverride = general.get("forceOverride", False)
 
+    @staticmethod
+    def readInfo(localPath : str) -> dict:
+        """returns the raw General section of the info.ini in localPath or None"""
+        ini = os.path.join(localPath, "info.ini")
+        if not os.path.exists(ini):
+            return None
+        info = configparser.ConfigParser()
+        info.read(ini)
+        return dict(info.items("General", raw=True))
+
     @property
     def isActive(self) -> bool:
         if not CraftCore.compiler.platform & self.platforms:
@@ -89,6 +102,118 @@ class CategoryPackageObject(object):
             return False
         return True
 
+class BlueprintMetaData(object):
+    """The information about a blueprint needed to resolve dependencies and to search for packages.
+    Cached in CraftCache so the blueprint doesn't need to be loaded if it didn't change."""
+    def __init__(self, instance):
+        from Package.VirtualPackageBase import VirtualPackageBase
+        subinfo = instance.subinfo
+        self.runtimeDependencies = list(subinfo.runtimeDependencies.items())
+        self.buildDependencies = list(subinfo.buildDependencies.items())
+        self.packagingDependencies = list(subinfo.packagingDependencies.items())
+        self.targets = list(subinfo.targets.keys())
+        self.svnTargets = list(subinfo.svnTargets.keys())
+        self.defaultTarget = subinfo.defaultTarget
+        self.version = instance.version
+        self.isVirtual = isinstance(instance, VirtualPackageBase)
+
+        self.displayName = subinfo.displayName
+        self.description = subinfo.description
+        self.tags = subinfo.tags
+        self.webpage = subinfo.webpage
+
+
+class BlueprintIndex(object):
+    """Persistent listing of the blueprint roots.
+    A root is only scanned again if the mtime of one of its directories or info.ini files changed."""
+    _version = 1
+
+    def __init__(self):
+        self.version = BlueprintIndex._version
+        # root -> (stamps, listing)
+        # stamps: path -> mtime of all directories and info.ini files of the root
+        # listing: directory -> (sub directories, py files, General section of the info.ini or None)
+        self.roots = {}
+        self.changed = False
+
+    @staticmethod
+    def _indexFile():
+        return os.path.join(CraftStandardDirs.etcDir(), "blueprints.index")
+
+    @staticmethod
+    def load():
+        indexFile = BlueprintIndex._indexFile()
+        if os.path.exists(indexFile):
+            try:
+                with open(indexFile, "rb") as f:
+                    index = pickle.load(f)
+                if index.version == BlueprintIndex._version:
+                    index.changed = False
+                    return index
+            except Exception as e:
+                CraftCore.log.debug(f"Failed to load the blueprint index: {e}")
+        return BlueprintIndex()
+
+    def save(self):
+        if not self.changed or not os.path.isdir(CraftStandardDirs.etcDir()):
+            return
+        indexFile = BlueprintIndex._indexFile()
+        try:
+            with open(f"{indexFile}.tmp", "wb") as f:
+                pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f"{indexFile}.tmp", indexFile)
+            self.changed = False
+        except Exception as e:
+            CraftCore.log.warning(f"Failed to save the blueprint index: {e}")
+
+    @staticmethod
+    def _isUpToDate(stamps : dict) -> bool:
+        try:
+            for path, mtime in stamps.items():
+                if os.stat(path).st_mtime_ns != mtime:
+                    CraftCore.log.debug(f"Blueprint index is outdated: {path} changed")
+                    return False
+        except FileNotFoundError as e:
+            CraftCore.log.debug(f"Blueprint index is outdated: {e}")
+            return False
+        return True
+
+    @staticmethod
+    def _scan(blueprintRoot : str) -> (dict, dict):
+        stamps = {}
+        listing = {}
+        toScan = [blueprintRoot]
+        while toScan:
+            path = toScan.pop()
+            subDirs = []
+            recipes = []
+            general = None
+            stamps[path] = os.stat(path).st_mtime_ns
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        if not CraftPackageObject._isDirIgnored(entry.name):
+                            subDirs.append(entry.name)
+                    elif entry.name.endswith(".py"):
+                        recipes.append(entry.name)
+                    elif entry.name == "info.ini":
+                        stamps[utils.normalisePath(entry.path)] = entry.stat().st_mtime_ns
+                        general = CategoryPackageObject.readInfo(path)
+            listing[path] = (subDirs, recipes, general)
+            toScan += [utils.normalisePath(os.path.join(path, d)) for d in subDirs]
+        return stamps, listing
+
+    def listing(self, blueprintRoot : str) -> dict:
+        if blueprintRoot in self.roots:
+            stamps, listing = self.roots[blueprintRoot]
+            if BlueprintIndex._isUpToDate(stamps):
+                return listing
+        CraftCore.log.debug(f"Indexing blueprints in {blueprintRoot}")
+        self.roots[blueprintRoot] = BlueprintIndex._scan(blueprintRoot)
+        self.changed = True
+        return self.roots[blueprintRoot][1]
+
+
 class CraftPackageObject(object):
     __rootPackage = None
     __rootDirectories = []
@@ -117,6 +242,7 @@ class CraftPackageObject(object):
         self.categoryInfo = None # type:CategoryPackageObject
         self._version = None
         self._instance = None
+        self._metaData = None
         self.__path = None
         self.__blueprintRoot = None
 
@@ -170,7 +296,7 @@ class CraftPackageObject(object):
         return package
 
     @staticmethod
-    def _expandChildren(path, parent, blueprintRoot):
+    def _expandChildren(path, parent, blueprintRoot, listing):
         if path:
             path = utils.normalisePath(path)
             name = path.rsplit("/", 1)[-1]
@@ -185,40 +311,40 @@ class CraftPackageObject(object):
         else:
             raise Exception("Unreachable")
         package.__blueprintRoot = blueprintRoot
+        subDirs, recipes, general = listing[path]
 
         if not package.categoryInfo:
-            package.categoryInfo = CategoryPackageObject(path)
+            package.categoryInfo = CategoryPackageObject(path, general)
             if not package.categoryInfo.valid and package.parent:
                 if package.parent.__blueprintRoot == package.__blueprintRoot:
                     # we actually need a copy
                     package.categoryInfo = copy.copy(package.parent.categoryInfo)
                     if not package.categoryInfo.valid:
-                        package.categoryInfo = CategoryPackageObject(blueprintRoot)
-
-        for f in os.listdir(path):
+                        package.categoryInfo = CategoryPackageObject(blueprintRoot, listing[blueprintRoot][2])
+
+        for f in subDirs:
+            fPath = os.path.join(path, f)
+            child = CraftPackageObject._expandChildren(fPath, package, blueprintRoot, listing)
+            if child:
+                if f in package.children:
+                    existingNode = package.children[f]
+                    if not existingNode.isCategory():
+                        CraftCore.log.warning(
+                            f"Blueprint clash detected: Ignoring {child.source} in favour of {existingNode.source}")
+                        continue
+                    else:
+                        #merge with existing node
+                        existingNode.children.update(child.children)
+                else:
+                    package.children[f] = child
+        for f in recipes:
             fPath = os.path.abspath(os.path.join(path, f))
-            if os.path.isdir(fPath):
-                if not CraftPackageObject._isDirIgnored(f):
-                    child = CraftPackageObject._expandChildren(fPath, package, blueprintRoot)
-                    if child:
-                        if f in package.children:
-                            existingNode = package.children[f]
-                            if not existingNode.isCategory():
-                                CraftCore.log.warning(
-                                    f"Blueprint clash detected: Ignoring {child.source} in favour of {existingNode.source}")
-                                continue
-                            else:
-                                #merge with existing node
-                                existingNode.children.update(child.children)
-                        else:
-                            package.children[f] = child
-            elif f.endswith(".py"):
-                if package.source:
-                    raise BlueprintException(f"Multiple py files in one directory: {package.source} and {f}", package)
-                if f[:-3] != package.name:
-                    raise BlueprintException(f"Recipes must match the name of the directory: {fPath}", package)
-                package.source = fPath
-                CraftPackageObject._allLeaves[package.path] = package
+            if package.source:
+                raise BlueprintException(f"Multiple py files in one directory: {package.source} and {f}", package)
+            if f[:-3] != package.name:
+                raise BlueprintException(f"Recipes must match the name of the directory: {fPath}", package)
+            package.source = fPath
+            CraftPackageObject._allLeaves[package.path] = package
         if package.children and package.source:
             raise BlueprintException(f"{package} has has children but also a recipe {package.source}!", package)
 
@@ -285,14 +411,16 @@ class CraftPackageObject(object):
         if not CraftPackageObject.__rootPackage:
             CraftPackageObject.__rootPackage = root = CraftPackageObject()
             root.name = "/"
+            index = BlueprintIndex.load()
             for blueprintRoot in CraftPackageObject.rootDirectories():
                 if not os.path.isdir(blueprintRoot):
                     CraftCore.log.warning(f"{blueprintRoot} does not exist")
                     continue
                 blueprintRoot = utils.normalisePath(os.path.abspath(blueprintRoot))
                 # create a dummy package to load its children
-                child = CraftPackageObject._expandChildren(None, root, blueprintRoot)
+                child = CraftPackageObject._expandChildren(None, root, blueprintRoot, index.listing(blueprintRoot))
                 root.children.update(child.children)
+            index.save()
             CraftPackageObject.__regiserNodes(root)
         return CraftPackageObject.__rootPackage
 
@@ -314,6 +442,38 @@ class CraftPackageObject(object):
                 raise BlueprintException("Failed to find package", self)
         return self._instance
 
+    def _metaDataKey(self) -> str:
+        import options
+        from VersionInfo import VersionInfo
+        key = hashlib.sha256()
+        # the blueprint and the version.ini files providing its targets
+        for fileName in [self.source] + VersionInfo.versionIniFiles(self):
+            key.update(fileName.encode())
+            with open(fileName, "rb") as f:
+                key.update(f.read())
+        for x in [str(CraftCore.compiler), str(datetime.date.today()), str(self.categoryInfo.patchLevel),
+                  CraftCore.settings.signature(), options.UserOptions.get(self).settingsSignature()]:
+            key.update(x.encode())
+        return key.hexdigest()
+
+    @property
+    def metaData(self) -> BlueprintMetaData:
+        if self.isCategory():
+            return None
+        if not self._metaData:
+            useCache = CraftCore.settings.getboolean("Blueprints", "CacheMetaData", True)
+            if useCache and not self._instance:
+                cached = CraftCore.cache.blueprintMetaData.get(self.path)
+                if cached and cached[0] == self._metaDataKey():
+                    CraftCore.log.debug(f"Using cached meta data for {self}")
+                    self._metaData = cached[1]
+                    return self._metaData
+            self._metaData = BlueprintMetaData(self.instance)
+            if useCache:
+                # the key is computed after the blueprint was loaded as it might have registered options
+                CraftCore.cache.blueprintMetaData[self.path] = (self._metaDataKey(), self._metaData)
+        return self._metaData
+
     @property
     def isInstalled(self) -> bool:
         # using the version here might cause a recursion...
@@ -343,7 +503,7 @@ class CraftPackageObject(object):
         if self.isCategory():
             return None
         if not self._version:
-            self._version = self.instance.version
+            self._version = self.metaData.version
         return self._version
 
     def __eq__(self, other):
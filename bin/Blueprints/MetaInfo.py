@@ -47,7 +47,7 @@ class MetaInfo(object):
     def __get(self, name):
         out = None
         if not self.__package.isCategory():
-            out = getattr(self.__package.subinfo, name)
+            out = getattr(self.__package.metaData, name)
         if not out:
             out = getattr(self.__package.categoryInfo, name)
         return out
@@ -74,6 +74,6 @@ class MetaInfo(object):
             if self._versionInfo:
                 return self._versionInfo.tags() + self._versionInfo.tarballs() + self._versionInfo.branches()
         else:
-            return list(self.__package.subinfo.svnTargets.keys()) + list(self.__package.subinfo.targets.keys())
+            return self.__package.metaData.svnTargets + self.__package.metaData.targets
         return []
 
@@ -36,11 +36,13 @@ from pathlib import Path
 from CraftBase import *
 from CraftOS.osutils import OsUtils
 from Utils import CodeSign
+from Utils.CraftImageScanner import CraftImageScanner
+from Utils.CraftRelocator import CraftRelocator
 
 
 class BuildSystemBase(CraftBase):
     """provides a generic interface for build systems and implements all stuff for all build systems"""
-    PatchableFile = {".service", ".pc", ".pri", ".prl", ".cmake", ".conf", ".sh", ".bat", ".cmd", ".ini", ".pl", ".pm", ".la", ".py"}
+    PatchableFile = CraftImageScanner.PatchableFile
 
     def __init__(self, typeName=""):
         """constructor"""
@@ -181,44 +183,15 @@ class BuildSystemBase(CraftBase):
             oldPaths = [oldPaths]
         elif not oldPaths:
             oldPaths = [self.subinfo.buildPrefix]
-
-        oldPaths = [Path(x).as_posix() for x in oldPaths]
-        newValue = Path(newPath).as_posix().encode()
-        for fileName in files:
-            if not os.path.exists(fileName):
-                CraftCore.log.warning(f"File {fileName} not found.")
-                return False
-            with open(fileName, "rb") as f:
-                content = f.read()
-            dirty = False
-            for oldPath in oldPaths:
-                assert os.path.isabs(oldPath)
-                # allow front and back slashes
-                oldPathPat = oldPath.replace("/", r"[/\\]+")
-                # capture firs seperator
-                oldPathPat = oldPathPat.replace(r"[/\\]+", r"(/+|\\+)", 1)
-                oldPathPat = f"({oldPathPat})"
-                oldPathPat = re.compile(oldPathPat.encode())
-                for match in set(oldPathPat.findall(content)):
-                    dirty = True
-                    oldPath = match[0]
-                    newPath = newValue.replace(b"/", match[1])
-                    if oldPath != newPath:
-                        CraftCore.log.info(f"Patching {fileName}: replacing {oldPath} with {newPath}")
-                        content = content.replace(oldPath, newPath)
-                    else:
-                        CraftCore.log.debug(f"Skip Patching {fileName}:  prefix is unchanged {newPath}")
-            if dirty:
-                with utils.makeTemporaryWritable(fileName):
-                    with open(fileName, "wb") as f:
-                        f.write(content)
-        return True
+        return CraftRelocator(oldPaths, newPath).relocate(files)
 
     def internalPostInstall(self):
         if not super().internalPostInstall():
             return False
+        # classify the files once, the scan is shared by all post install steps
+        image = CraftImageScanner.scan(self.installDir())
         # fix absolute symlinks
-        for sym in utils.filterDirectoryContent(self.installDir(), lambda x, root: x.is_symlink(), lambda x, root: True, allowBadSymlinks=True):
+        for sym in image.symlinks:
             target = Path(os.readlink(sym))
             if target.is_absolute():
                 sym = Path(sym)
@@ -234,14 +207,10 @@ class BuildSystemBase(CraftBase):
         if CraftCore.compiler.isWindows:
             oldPrefixes += [OsUtils.toMSysPath(self.subinfo.buildPrefix)]
 
-        files = utils.filterDirectoryContent(self.installDir(),
-                                             whitelist=lambda x, root: Path(x).suffix in BuildSystemBase.PatchableFile,
-                                             blacklist=lambda x, root: True)
-
-        if not self.patchInstallPrefix(files, oldPrefixes, newPrefix):
+        if not self.patchInstallPrefix(image.patchable, oldPrefixes, newPrefix):
             return False
 
-        binaryFiles = list(utils.filterDirectoryContent(self.installDir(), lambda x, root: utils.isBinary(x.path), lambda x, root: True))
+        binaryFiles = image.binaries
         if (CraftCore.compiler.isMacOS
                 and os.path.isdir(self.installDir())):
             for f in binaryFiles:
@@ -297,8 +266,7 @@ class BuildSystemBase(CraftBase):
                             utils.copyFile(pdb, pdbDestination, linkOnly=False)
                 else:
                     if not self.subinfo.options.package.disableStriping:
-                        for f in binaryFiles:
-                            utils.strip(f)
+                        utils.stripFiles(binaryFiles)
 
             # sign the binaries if we can
             if CraftCore.compiler.isWindows and CraftCore.settings.getboolean("CodeSigning", "SignCache", False):
@@ -14,6 +14,7 @@ from CraftStandardDirs import CraftStandardDirs
 from Blueprints import CraftPackageObject
 from CraftDebug import deprecated
 from Blueprints.CraftPackageObject import CraftPackageObject
+from Utils.CraftMirrors import CraftMirrors
 from Utils.CraftShortPath import CraftShortPath
 from CraftOS.osutils import OsUtils
 
@@ -235,16 +236,29 @@ class CraftBase(object):
             return None
         return os.path.join(cacheDir, version, *CraftCore.compiler.signature, self.buildType())
 
-    def cacheRepositoryUrls(self) -> [str]:
+    @staticmethod
+    def cacheObjectsLocation(cacheLocation : str) -> str:
+        """ returns the object store of the chunked caches in cacheLocation, the local path or url of a cache
+        the store is shared by all compilers and build types of a cache version """
+        depth = len(CraftCore.compiler.signature) + 1
+        if "://" in cacheLocation:
+            return "/".join(cacheLocation.rstrip("/").split("/")[:-depth] + ["objects"])
+        return str(Path(cacheLocation).parents[depth - 1] / "objects")
+
+    def cacheRepositoryUrls(self, sortMirrors : bool=False) -> [str]:
+        """ if sortMirrors is set the repositories of a build type are ordered by the speed of their mirror """
         version = self.cacheVersion()
         buildType = [self.buildType()]
         if self.buildType() == "RelWithDebInfo":
             buildType += ["Release"]
         elif self.buildType() == "Release":
             buildType += ["RelWithDebInfo"]
+        repositoryUrls = CraftCore.settings.getList("Packager", "RepositoryUrl")
+        if sortMirrors:
+            repositoryUrls = CraftMirrors.sort(repositoryUrls)
         out = []
         for bt in buildType:
-            out += ["/".join([url if not url.endswith("/") else url[0:-1], version, *CraftCore.compiler.signature, bt]) for url in CraftCore.settings.getList("Packager", "RepositoryUrl")]
+            out += ["/".join([url if not url.endswith("/") else url[0:-1], version, *CraftCore.compiler.signature, bt]) for url in repositoryUrls]
         return out
 
     def internalPostInstall(self):
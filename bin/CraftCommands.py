@@ -21,6 +21,7 @@
 # LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
 # OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
 # SUCH DAMAGE.
+import concurrent.futures
 import subprocess
 import tempfile
 import glob
@@ -31,8 +32,9 @@ import urllib
 import CraftBase
 from Blueprints.CraftDependencyPackage import CraftDependencyPackage, DependencyType
 from Blueprints.CraftVersion import CraftVersion
-from Blueprints.CraftPackageObject import CraftPackageObject
+from Blueprints.CraftPackageObject import CraftPackageObject, BlueprintException
 from Utils.CraftTitleUpdater import CraftTitleUpdater
+from Utils.CraftPrefetcher import CraftPrefetcher
 from Utils import CraftTimer
 from options import *
 
@@ -63,11 +65,26 @@ def doExec(package, action):
         return ret
 
 
+def packageActions(package, buildAction, directTargets) -> [str]:
+    """ returns the list of actions executed for buildAction """
+    if buildAction == "all":
+        actions = ["fetch", "unpack", "compile", "cleanimage", "install", "post-install"]
+        if CraftCore.settings.getboolean("ContinuousIntegration", "ClearBuildFolder", False):
+            actions += ["cleanbuild"]
+        actions += ["qmerge", "post-qmerge"]
+        if CraftCore.settings.getboolean("Packager", "CreateCache"):
+            onlyDirect = CraftCore.settings.getboolean("Packager", "CacheDirectTargetsOnly")
+            if not onlyDirect or (onlyDirect and package in directTargets):
+                actions += ["package"]
+        return actions
+    elif buildAction == "update":
+        return ["update"]
+    return [buildAction]
+
 # in general it would be nice to handle this with inheritance, but actually we don't wan't a blueprint to be able to change the behaviour of "all"...
 def handlePackage(package, buildAction, directTargets):
     with CraftTimer.Timer(f"HandlePackage {package}", 3) as timer:
         success = True
-        actions = []
         timer.hook = lambda : utils.notify(f"Craft {buildAction} {'succeeded' if success else 'failed'}", f"{package} after {timer}", buildAction)
         CraftCore.debug.debug_line()
         CraftCore.debug.step(f"Handling package: {package}, action: {buildAction}")
@@ -76,20 +93,7 @@ def handlePackage(package, buildAction, directTargets):
             if CraftCore.settings.getboolean("Packager", "UseCache", "False"):
                 if doExec(package, "fetch-binary"):
                     return True
-            if buildAction == "all":
-                actions = ["fetch", "unpack", "compile", "cleanimage", "install", "post-install"]
-                if CraftCore.settings.getboolean("ContinuousIntegration", "ClearBuildFolder", False):
-                    actions += ["cleanbuild"]
-                actions += ["qmerge", "post-qmerge"]
-                if CraftCore.settings.getboolean("Packager", "CreateCache"):
-                    onlyDirect = CraftCore.settings.getboolean("Packager", "CacheDirectTargetsOnly")
-                    if not onlyDirect or (onlyDirect and package in directTargets):
-                        actions += ["package"]
-            elif buildAction == "update":
-                actions = ["update"]
-        else:
-            actions = [buildAction]
-        for action in actions:
+        for action in packageActions(package, buildAction, directTargets):
             success = doExec(package, action)
             if not success:
                 return False
@@ -293,14 +297,14 @@ def shelve(target : str):
     return True
 
 
-def packageIsOutdated(package):
-    installed = CraftCore.installdb.getInstalledPackages(package)
+def packageIsOutdated(package, installed=None):
+    """installed: the entry of InstallDB.getInstalledVersions for package"""
+    if installed is None:
+        installed = CraftCore.installdb.getInstalledVersions([package]).get(package.path, [])
     if not installed:
         return True
-    for pack in installed:
-        version = pack.getVersion()
+    for version, _, cacheVersion in installed:
         if not version: continue
-        cacheVersion = pack.getCacheVersion()
         if cacheVersion and cacheVersion != CraftBase.CraftBase.cacheVersion():
             # can only happen for packages installed from cache
             return True
@@ -333,6 +337,171 @@ def invoke(command : str, directTargets : [CraftPackageObject]) -> bool:
         CraftCore.debug.printOut(instance)
     return True
 
+# the part of the "all" pipeline that only touches the build and image dir of a package,
+# those actions can be run in a separate Craft process
+ParallelActions = ["fetch", "unpack", "compile", "cleanimage", "install", "post-install"]
+
+def craftCommand(actions : [str], package : CraftPackageObject, args) -> [str]:
+    """ returns a command line to run actions on package in a new Craft process """
+    command = [sys.executable, sys.argv[0], "--buildtype", args.buildType]
+    for option in args.options:
+        command += ["--options", option]
+    if args.offline:
+        command += ["--offline"]
+    if args.ciMode:
+        command += ["--ci-mode"]
+    if args.srcDir:
+        command += ["--src-dir", args.srcDir]
+    if args.noCache:
+        command += ["--no-cache"]
+    if args.useCache:
+        command += ["--use-cache"]
+    if args.createCache:
+        command += ["--create-cache"]
+    if args.stayQuiet:
+        command += ["--stayquiet"]
+    # the default verbosity is read from the settings again
+    verbose = args.verbose - int(CraftCore.settings.get("CraftDebug", "Verbose", "0"))
+    if verbose > 0:
+        command += ["-" + "v" * verbose]
+    if args.target and package in CraftCore.state.directTargets:
+        command += ["--target", args.target]
+    command += [f"--{x}" for x in actions]
+    return command + [package.path]
+
+def _runCraftProcess(command : [str], logFile : Path) -> bool:
+    env = dict(os.environ)
+    env["CRAFT_LOG_FILE"] = str(logFile)
+    utils.createDir(logFile.parent)
+    CraftCore.log.debug(f"executing command: {command}")
+    process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env,
+                             errors="backslashreplace", universal_newlines=True)
+    if process.returncode != 0:
+        CraftCore.log.info(process.stdout)
+        CraftCore.log.info(f"Full log: {logFile}")
+        return False
+    CraftCore.log.debug(process.stdout)
+    return True
+
+def dependencyGraph(packages : [CraftDependencyPackage]) -> {CraftDependencyPackage : {CraftDependencyPackage}}:
+    """
+    Maps every package to the packages in packages it depends on.
+    Dependencies that are not part of packages are skipped, but their dependencies are still taken into account.
+    """
+    scheduled = set(packages)
+    graph = {}
+    def collect(package, visited, out):
+        for dep in package.dependencies:
+            if dep in visited:
+                continue
+            visited.add(dep)
+            if dep in scheduled:
+                out.add(dep)
+            else:
+                collect(dep, visited, out)
+    for package in packages:
+        deps = set()
+        collect(package, {package}, deps)
+        graph[package] = deps
+    return graph
+
+def _mergePackage(package, directTargets) -> bool:
+    for action in packageActions(package, "all", directTargets):
+        if action in ParallelActions:
+            continue
+        if not doExec(package, action):
+            return False
+    return True
+
+def runParallel(packages : [CraftDependencyPackage], args, directTargets) -> bool:
+    """
+    Builds packages in up to args.jobs Craft processes.
+    A package is started as soon as all its dependencies are merged, the merge itself
+    and therefore all writes to the craft root and the install database happen in this process.
+    """
+    graph = dependencyGraph(packages)
+    pending = list(packages)
+    merged = set()
+    running = {}
+    failed = False
+    useCache = CraftCore.settings.getboolean("Packager", "UseCache", "False")
+    CraftCore.log.info(f"Building {len(pending)} packages with {args.jobs} jobs")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        while not failed:
+            for package in list(pending):
+                if len(running) >= args.jobs:
+                    break
+                if not graph[package].issubset(merged):
+                    continue
+                pending.remove(package)
+                if useCache and doExec(package, "fetch-binary"):
+                    merged.add(package)
+                    packages.remove(package)
+                    continue
+                CraftCore.debug.step(f"Start building: {package}")
+                logFile = package.instance.buildRoot() / "craft.log"
+                running[pool.submit(_runCraftProcess, craftCommand(ParallelActions, package, args), logFile)] = package
+            if not running:
+                break
+            CraftTitleUpdater.instance.updateTitle()
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                package = running.pop(future)
+                if not future.result() or not _mergePackage(package, directTargets):
+                    CraftCore.log.error(f"fatal error: package {package} all failed")
+                    failed = True
+                    continue
+                merged.add(package)
+                packages.remove(package)
+        if running:
+            CraftCore.log.info(f"Waiting for {[str(x) for x in running.values()]}")
+    if pending and not failed:
+        CraftCore.log.error(f"Failed to resolve the build order of {[str(x) for x in pending]}")
+    return not failed and not pending
+
+def restoreBinaryCaches(packages : [CraftDependencyPackage], jobs : int) -> [CraftDependencyPackage]:
+    """
+    Restores packages from the binary caches.
+    The cache entries are resolved up front, the archives are downloaded, verified and unpacked by up to jobs threads,
+    the remaining installation steps and the merge are done in the order of packages.
+    Returns the restored packages, the other packages need to be built.
+    """
+    restored = []
+    candidates = []
+    # like fetchBinary, if we are creating the cache a rebuild on a failed fetch would be suboptimal
+    creatingCache = CraftCore.settings.getboolean("Packager", "CreateCache", False)
+    for package in packages:
+        if package.isIgnored() or package.instance.subinfo.options.package.disableBinaryCache:
+            continue
+        url, latest, localArchiveAbsPath = package.instance.findBinaryCache(quiet=True)
+        if latest:
+            candidates.append((package, url, latest, localArchiveAbsPath))
+    if not candidates:
+        return restored
+    CraftCore.log.info(f"Restoring {len(candidates)} of {len(packages)} packages from the binary cache with {jobs} jobs")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="CraftCacheRestore") as pool:
+        futures = [(package, pool.submit(package.instance.unpackBinaryCache, url, latest, localArchiveAbsPath))
+                   for package, url, latest, localArchiveAbsPath in candidates]
+        for package, future in futures:
+            try:
+                unpacked = future.result()
+            except Exception as e:
+                CraftCore.log.warning(f"Failed to restore {package} from the binary cache", exc_info=e)
+                unpacked = False
+            if not unpacked:
+                if creatingCache:
+                    raise BlueprintException(f"Failed to restore {package} from the binary cache", package)
+                CraftCore.debug.step(f"{package} not restored from cache")
+                continue
+            CraftTitleUpdater.instance.updateTitle()
+            with CraftTimer.Timer(f"Restoring {package} from cache", 1):
+                CraftCore.debug.step(f"Installing {package} from cache")
+                if package.instance.installBinaryCache():
+                    restored.append(package)
+                else:
+                    CraftCore.log.warning(f"Failed to install {package} from cache")
+    return restored
+
 def run(package : [CraftPackageObject], action : str, args) -> bool:
     if package.isIgnored():
         CraftCore.log.info(f"Skipping package because it has been ignored: {package}")
@@ -371,11 +540,12 @@ def run(package : [CraftPackageObject], action : str, args) -> bool:
 
         packages = []
         if not args.resolve_deps:
+            installed = CraftCore.installdb.getInstalledVersions([item for item in depList if item.name])
             for item in depList:
                 if not item.name:
                     continue # are we a real package
                 if ((item in directTargets and (args.ignoreInstalled or (action == "update" and item.subinfo.hasSvnTarget())))
-                     or packageIsOutdated(item)):
+                     or packageIsOutdated(item, installed.get(item.path, []))):
                     packages.append(item)
                     CraftCore.log.debug(f"dependency: {item}")
                 elif item in directTargets:
@@ -391,26 +561,36 @@ def run(package : [CraftPackageObject], action : str, args) -> bool:
                 packages.remove(x)
 
         CraftTitleUpdater.usePackageProgressTitle(packages)
-        while packages:
-            info = packages[0]
-            # in case we only want to see which packages are still to be build, simply return the package name
-            if args.probe:
-                CraftCore.log.warning(f"pretending {info}: {info.version}")
-            else:
-                if CraftCore.settings.getboolean("ContinuousIntegration", "Enabled", False):
-                    CraftCore.debug.debug_line()
-                    CraftCore.log.info(f"Status: {CraftTitleUpdater.instance}")
+        restoreJobs = int(CraftCore.settings.get("Packager", "CacheRestoreJobs", "0"))
+        if (restoreJobs > 0 and not args.probe and action in ["all", "install-deps"]
+                and CraftCore.settings.getboolean("Packager", "UseCache", "False")):
+            for restored in restoreBinaryCaches(packages, restoreJobs):
+                packages.remove(restored)
+        if args.jobs > 1 and not args.probe and action in ["all", "install-deps"]:
+            if not runParallel(packages, args, directTargets):
+                return False
+        with CraftPrefetcher([] if args.probe else packages) as prefetcher:
+            while packages:
+                info = packages[0]
+                # in case we only want to see which packages are still to be build, simply return the package name
+                if args.probe:
+                    CraftCore.log.warning(f"pretending {info}: {info.version}")
                 else:
-                    CraftTitleUpdater.instance.updateTitle()
-                if action in ["install-deps"]:
-                    action = "all"
-                elif action == "update" and not info.isLatestVersionInstalled:
-                    action = "all"
-
-                if not handlePackage(info, action, directTargets=directTargets):
-                    CraftCore.log.error(f"fatal error: package {info} {action} failed")
-                    return False
-            packages.pop(0)
+                    if CraftCore.settings.getboolean("ContinuousIntegration", "Enabled", False):
+                        CraftCore.debug.debug_line()
+                        CraftCore.log.info(f"Status: {CraftTitleUpdater.instance}")
+                    else:
+                        CraftTitleUpdater.instance.updateTitle()
+                    if action in ["install-deps"]:
+                        action = "all"
+                    elif action == "update" and not info.isLatestVersionInstalled:
+                        action = "all"
+
+                    prefetcher.advance(info)
+                    if not handlePackage(info, action, directTargets=directTargets):
+                        CraftCore.log.error(f"fatal error: package {info} {action} failed")
+                        return False
+                packages.pop(0)
     else:
         for info in directTargets:
             if not handlePackage(info, action, directTargets=directTargets):
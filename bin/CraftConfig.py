@@ -175,6 +175,10 @@ class CraftConfig(object):
         if not (group, key) in self:
             self.set(group, key, value)
 
+    def signature(self) -> str:
+        """returns a string representing the current configuration"""
+        return repr([(section, sorted(self._config.items(section, raw=True))) for section in sorted(self._config.sections())])
+
     def dump(self):
         with open(self.iniPath + ".dump", 'wt+') as configfile:
             self._config.write(configfile)
@@ -4,6 +4,7 @@ from CraftConfig import *
 from CraftCore import CraftCore
 from CraftOS.osutils import OsUtils
 from CraftStandardDirs import CraftStandardDirs
+from Utils import CraftHash
 
 
 class InstallPackage(object):
@@ -69,7 +70,7 @@ class InstallPackage(object):
         """ revert all changes made to the database, use with care """
         self.cursor.connection.rollback()
 
-    def uninstall(self):
+    def uninstall(self, commit=True):
         """ really uninstall that package """
         cmd = '''DELETE FROM fileList WHERE packageId=?;'''
         InstallDB.log("executing sqlcmd '%s' with parameter %s" % (cmd, str(self.packageId)))
@@ -77,9 +78,10 @@ class InstallPackage(object):
         cmd = '''DELETE FROM packageList WHERE packageId=?;'''
         InstallDB.log("executing sqlcmd '%s' with parameter %s" % (cmd, str(self.packageId)))
         self.cursor.execute(cmd, (self.packageId,))
-        self.cursor.connection.commit()
+        if commit:
+            self.cursor.connection.commit()
 
-    def install(self):
+    def install(self, commit=True):
         """ marking the package & package file list installed """
         fileNumber = len(self.fileDict)
         # keys() and values will stay in the same order if no changes are done in between calls
@@ -94,7 +96,8 @@ class InstallPackage(object):
 
         # at last, commit all the changes so that they are committed only after everything is written to the
         # database
-        self.cursor.connection.commit()
+        if commit:
+            self.cursor.connection.commit()
 
     def getRevision(self):
         self.cursor.execute("SELECT revision FROM packageList WHERE packageId == ?", (self.packageId,))
@@ -118,7 +121,7 @@ class InstallDB(object):
         checking its installation status.
         In case the database doesn't exist if the constructor is called, a new database is constructed
     """
-    SCHEMA_VERSION = 1
+    SCHEMA_VERSION = 5
 
     def __init__(self, filename=None):
         if filename == None:
@@ -159,11 +162,11 @@ class InstallDB(object):
 
     def isInstalled(self,  package, version=None):
         """ returns whether a package is installed. If version is empty, all versions will be checked. """
-        cmd = '''SELECT * FROM packageList'''
+        cmd = '''SELECT packageId FROM packageList'''
         stmt, params = self.__constructWhereStmt(
             {'prefix': None, 'packagePath': package, 'version': version})
         cmd += stmt
-        cmd += ''';'''
+        cmd += ''' LIMIT 1;'''
         InstallDB.log("executing sqlcmd '%s' with parameters: %s" % (cmd, tuple(params)))
 
         cursor = self.connection.cursor()
@@ -210,6 +213,134 @@ class InstallDB(object):
             values.append(row[0])
         return values
 
+    def getInstalledVersions(self, packages) -> {str : [(str, str, str)]}:
+        """ returns a dict mapping the path of the installed packages in packages to
+            a list of (version, revision, cacheVersion) tuples.
+        """
+        out = {}
+        paths = list({str(package) for package in packages})
+        cursor = self.connection.cursor()
+        # stay below the limit of sql variables
+        for i in range(0, len(paths), 500):
+            chunk = paths[i:i + 500]
+            cmd = f'''SELECT packagePath, version, revision, cacheVersion FROM packageList WHERE packagePath IN ({", ".join(["?"] * len(chunk))}) ORDER BY packageId;'''
+            InstallDB.log(f"executing sqlcmd {cmd!r} with parameters: {chunk}")
+            cursor.execute(cmd, chunk)
+            for path, version, revision, cacheVersion in cursor.fetchall():
+                out.setdefault(path, []).append((version, revision, cacheVersion))
+        cursor.close()
+        return out
+
+    @staticmethod
+    def _fileSignature(path) -> str:
+        stat = os.lstat(path)
+        # the ctime changes with every modification and can't be set, so a reused inode is not mistaken for the old file
+        return f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}:{stat.st_ctime_ns}"
+
+    def __getStoredDigests(self, signatures, algorithm) -> {str : str}:
+        out = {}
+        signatures = list(signatures)
+        cursor = self.connection.cursor()
+        for i in range(0, len(signatures), 500):
+            chunk = signatures[i:i + 500]
+            cmd = f'''SELECT signature, fileHash FROM hashStore WHERE algorithm=? AND signature IN ({", ".join(["?"] * len(chunk))});'''
+            cursor.execute(cmd, [algorithm.name] + chunk)
+            out.update(cursor.fetchall())
+        cursor.close()
+        return out
+
+    def __storeDigests(self, digests : {str : str}, algorithm):
+        if not digests:
+            return
+        cmd = '''INSERT OR REPLACE INTO hashStore (signature, algorithm, fileHash) VALUES (?, ?, ?)'''
+        InstallDB.log(f"executing sqlcmd {cmd!r} {len(digests)} times")
+        self.connection.executemany(cmd, [(signature, algorithm.name, digest) for signature, digest in digests.items()])
+        self.connection.commit()
+
+    def digestFiles(self, paths : [str], algorithm=CraftHash.HashAlgorithm.SHA256) -> {str : str}:
+        """ returns a dict mapping paths to their digest
+            only files that changed since their digest was stored are read
+        """
+        links = []
+        signatures = {}
+        for path in paths:
+            if os.path.islink(path):
+                # cheap, and the target might change without changing the link
+                links.append(path)
+            else:
+                signatures[path] = InstallDB._fileSignature(path)
+        out = CraftHash.digestFiles(links, algorithm)
+        known = self.__getStoredDigests(set(signatures.values()), algorithm)
+        toRead = {}
+        for path, signature in signatures.items():
+            if signature in known:
+                out[path] = known[signature]
+            elif signature not in toRead:
+                toRead[signature] = path
+        read = CraftHash.digestFiles(toRead.values(), algorithm)
+        new = {signature: read[path] for signature, path in toRead.items()}
+        for path, signature in signatures.items():
+            if signature in new:
+                out[path] = new[signature]
+        InstallDB.log(f"digestFiles: {len(new)} of {len(signatures)} files needed to be read")
+        self.__storeDigests(new, algorithm)
+        return out
+
+    def addDigests(self, digests : {str : str}, algorithm=CraftHash.HashAlgorithm.SHA256):
+        """ stores the known digests of files, for example of the copies of a file """
+        self.__storeDigests({InstallDB._fileSignature(path): digest for path, digest in digests.items() if not os.path.islink(path)}, algorithm)
+
+    def removeDigests(self, paths : [str]):
+        """ forget the digests of files that are about to be removed """
+        signatures = []
+        for path in paths:
+            if not os.path.islink(path):
+                stat = os.lstat(path)
+                # keep the digest if the file is still referenced by a different hard link
+                if stat.st_nlink <= 1:
+                    signatures.append((InstallDB._fileSignature(path),))
+        if signatures:
+            self.connection.executemany('''DELETE FROM hashStore WHERE signature=?''', signatures)
+            self.connection.commit()
+
+    def addMergeJournal(self, package, stagingDir) -> int:
+        """ starts the journal of a merge of package, returns the id of the journal """
+        cursor = self.connection.cursor()
+        cmd = '''INSERT INTO mergeJournal (journalId, packagePath, stagingDir, state) VALUES (?, ?, ?, ?)'''
+        params = (None, package.path, stagingDir, "staging")
+        InstallDB.log(f"executing sqlcmd {cmd!r} with parameters: {params}")
+        cursor.execute(cmd, params)
+        self.connection.commit()
+        return cursor.lastrowid
+
+    def addMergeJournalFiles(self, journalId, files : [(str, bool, bool)], state : str):
+        """ records the (filename, staged, backup) entries of a merge and changes its state """
+        cmd = '''INSERT INTO mergeJournalFiles (journalId, filename, staged, backup) VALUES (?, ?, ?, ?)'''
+        InstallDB.log(f"executing sqlcmd {cmd!r} {len(files)} times")
+        self.connection.executemany(cmd, [(journalId, filename, staged, backup) for filename, staged, backup in files])
+        self.setMergeJournalState(journalId, state)
+
+    def setMergeJournalState(self, journalId, state : str):
+        """ changes the state of a merge journal and commits all pending changes of the database """
+        self.connection.execute('''UPDATE mergeJournal SET state=? WHERE journalId=?''', (state, journalId))
+        self.connection.commit()
+
+    def getMergeJournals(self) -> [(int, str, str, str)]:
+        """ returns the (journalId, packagePath, stagingDir, state) of the unfinished merges """
+        cursor = self.connection.cursor()
+        cursor.execute('''SELECT journalId, packagePath, stagingDir, state FROM mergeJournal ORDER BY journalId;''')
+        return cursor.fetchall()
+
+    def getMergeJournalFiles(self, journalId) -> [(str, bool, bool)]:
+        cursor = self.connection.cursor()
+        cursor.execute('''SELECT filename, staged, backup FROM mergeJournalFiles WHERE journalId=?;''', (journalId,))
+        return [(filename, bool(staged), bool(backup)) for filename, staged, backup in cursor.fetchall()]
+
+    def removeMergeJournal(self, journalId):
+        self.connection.execute('''DELETE FROM mergeJournalFiles WHERE journalId=?''', (journalId,))
+        self.connection.execute('''DELETE FROM mergeJournal WHERE journalId=?''', (journalId,))
+        self.connection.commit()
+
     def getPackagesForFileSearch(self, filename):
         """ returns a list of tuple(InstallPackage(), filename) for packages providing a given file """
 
@@ -247,6 +378,7 @@ class InstallDB(object):
             if not os.path.exists(CraftStandardDirs.etcBlueprintDir()):
                 os.makedirs(CraftStandardDirs.etcBlueprintDir())
             self.connection = sqlite3.connect(self.dbfilename)
+            self.__setPragmas()
             cursor = self.connection.cursor()
 
             # first, create the required tables
@@ -254,21 +386,62 @@ class InstallDB(object):
                                prefix TEXT, packagePath TEXT, version TEXT, revision TEXT, cacheVersion TEXT)''')
             cursor.execute('''CREATE TABLE fileList (fileId INTEGER PRIMARY KEY AUTOINCREMENT,
                                packageId INTEGER, filename TEXT, fileHash TEXT)''')
+            self.__createIndexes(cursor)
+            self.__createHashStore(cursor)
+            self.__createMergeJournal(cursor)
             cursor.execute(f'''PRAGMA user_version={InstallDB.SCHEMA_VERSION};''')
             self.connection.commit()
         else:
             self.connection = sqlite3.connect(self.dbfilename)
+            self.__setPragmas()
             self.__migrateDatabase()
 
+    def __setPragmas(self):
+        # the write ahead log allows to read while a different process is writing
+        # and only needs to sync on checkpoints, normal is safe in that mode
+        self.connection.execute('''PRAGMA journal_mode=WAL;''')
+        self.connection.execute('''PRAGMA synchronous=NORMAL;''')
+
+    @staticmethod
+    def __createIndexes(cursor):
+        cursor.execute('''CREATE INDEX IF NOT EXISTS packageList_packagePath ON packageList (packagePath);''')
+        cursor.execute('''CREATE INDEX IF NOT EXISTS fileList_packageId ON fileList (packageId);''')
+        cursor.execute('''CREATE INDEX IF NOT EXISTS fileList_filename ON fileList (filename);''')
+
+    @staticmethod
+    def __createHashStore(cursor):
+        # the digests of files identified by their device, inode, size, mtime and ctime
+        cursor.execute('''CREATE TABLE IF NOT EXISTS hashStore (signature TEXT, algorithm TEXT, fileHash TEXT,
+                          PRIMARY KEY (signature, algorithm))''')
+
+    @staticmethod
+    def __createMergeJournal(cursor):
+        # the journal of the transactional merges, see CraftMergeJournal
+        cursor.execute('''CREATE TABLE IF NOT EXISTS mergeJournal (journalId INTEGER PRIMARY KEY AUTOINCREMENT,
+                          packagePath TEXT, stagingDir TEXT, state TEXT)''')
+        cursor.execute('''CREATE TABLE IF NOT EXISTS mergeJournalFiles (journalId INTEGER, filename TEXT,
+                          staged INTEGER, backup INTEGER)''')
 
     def __migrateDatabase(self):
         cursor = self.connection.cursor()
         cursor.execute('''PRAGMA user_version;''')
         version = cursor.fetchall()[0][0]
+        if version == InstallDB.SCHEMA_VERSION:
+            return
         # TODO: drop prefix from packageList (will break compat)
         if version < 1:
             cursor.execute('''ALTER TABLE packageList ADD COLUMN cacheVersion TEXT;''')
+        if version < 2:
+            self.__createIndexes(cursor)
+        if version < 3:
+            self.__createHashStore(cursor)
+        if version < 4:
+            self.__createMergeJournal(cursor)
+        if version < 5:
+            # the signatures don't contain the ctime
+            cursor.execute('''DELETE FROM hashStore;''')
         cursor.execute(f'''PRAGMA user_version={InstallDB.SCHEMA_VERSION};''')
+        self.connection.commit()
 
 
 def printInstalled():
@@ -1,6 +1,7 @@
 #
 # copyright (c) 2009 Ralf Habacker <ralf.habacker@freenet.de>
 #
+import json
 from pathlib import Path
 
 from CraftBase import *
@@ -8,9 +9,13 @@ from CraftCompiler import *
 from InstallDB import *
 from Blueprints.CraftPackageObject import *
 from Utils import CraftHash, GetFiles, CraftChoicePrompt
+from Utils.CraftArchive import CraftArchive
 from Utils.CraftManifest import CraftManifest
+from Utils.CraftCopyEngine import CraftCopyEngine
+from Utils.CraftMergeJournal import CraftMergeJournal
+from Utils.CraftMirrors import CraftMirrors
+from Utils.CraftObjectStore import CraftObjectStore
 
-import json
 
 class PackageBase(CraftBase):
     """
@@ -32,10 +37,18 @@ class PackageBase(CraftBase):
     def __init__(self):
         CraftCore.log.debug("PackageBase.__init__ called")
         CraftBase.__init__(self)
+        # the archive and the file list of a binary cache that is installed without the image dir
+        self.__directCacheInstall = None
 
     def qmerge(self):
         """mergeing the imagedirectory into the filesystem"""
         ## \todo is this the optimal place for creating the post install scripts ?
+        CraftMergeJournal.recover()
+        incremental = self.package.isInstalled and CraftCore.settings.getboolean("General", "IncrementalMerge", False)
+        if CraftCore.settings.getboolean("General", "AtomicMerge", False):
+            return self._atomicQmerge(incremental)
+        if incremental:
+            return self._incrementalQmerge()
 
         if self.package.isInstalled:
             self.unmerge()
@@ -49,7 +62,7 @@ class PackageBase(CraftBase):
 
         revision = self.sourceRevision()
         package = CraftCore.installdb.addInstalled(self.package, self.version, revision=revision)
-        fileList = self.getFileListFromDirectory(CraftCore.standardDirs.craftRoot(), copiedFiles)
+        fileList = self.getFileListFromDirectory(CraftCore.standardDirs.craftRoot(), copiedFiles, sourceDir=self.imageDir())
         package.addFiles(fileList)
         package.install()
 
@@ -59,9 +72,119 @@ class PackageBase(CraftBase):
 
         return True
 
+    def _incrementalMergePlan(self, installed) -> ([(str, str)], [str], [(str, str)]):
+        """ compares the image with the installed files
+            returns the file list of the image, the files that need to be copied
+            and the installed files that are replaced or vanished """
+        root = CraftCore.standardDirs.craftRoot()
+        imageFiles = []
+        if Path(self.imageDir()).exists():
+            _, imageFiles = CraftCopyEngine.listTree(self.imageDir())
+        fileList = self.getFileListFromDirectory(self.imageDir(), imageFiles)
+        oldFiles = []
+        for package in installed:
+            oldFiles.extend(package.getFilesWithHashes())
+        oldHashes = dict((os.path.normcase(filename), filehash) for filename, filehash in oldFiles)
+
+        # files that are identical in the old and the new version, and weren't modified since
+        candidates = {}
+        for filename, filehash in fileList:
+            fullPath = os.path.join(root, filename)
+            if oldHashes.get(os.path.normcase(filename)) == filehash and (os.path.isfile(fullPath) or os.path.islink(fullPath)):
+                candidates[fullPath] = filehash
+        algorithm = CraftHash.HashAlgorithm.SHA256
+        currentHashes = CraftCore.installdb.digestFiles(candidates.keys(), algorithm)
+        unchanged = set(os.path.normcase(os.path.relpath(path, root)) for path, filehash in candidates.items()
+                        if algorithm.stringPrefix() + currentHashes[path] == filehash)
+
+        toCopy = [filename for filename, _ in fileList if os.path.normcase(filename) not in unchanged]
+        toUnmerge = [(filename, filehash) for filename, filehash in oldFiles if os.path.normcase(filename) not in unchanged]
+        CraftCore.log.info(f"Merging {len(toCopy)} of {len(fileList)} files, {len(unchanged)} files are unchanged")
+        return fileList, toCopy, toUnmerge
+
+    @staticmethod
+    def _addCopiedDigests(destDir, fileList, copiedFiles):
+        """ the copies have the same digests as the files in the image """
+        algorithm = CraftHash.HashAlgorithm.SHA256
+        digests = dict(fileList)
+        CraftCore.installdb.addDigests(dict((os.path.join(destDir, filename), digests[filename][len(algorithm.stringPrefix()):])
+                                            for filename in copiedFiles), algorithm)
+
+    def _incrementalQmerge(self) -> bool:
+        """ only replace the changed files and remove the vanished files of the installed version,
+            identical files are not touched and keep their timestamps """
+        root = CraftCore.standardDirs.craftRoot()
+        installed = CraftCore.installdb.getInstalledPackages(self.package)
+        fileList, toCopy, toUnmerge = self._incrementalMergePlan(installed)
+        self.unmergeFileList(root, toUnmerge)
+        if Path(self.imageDir()).exists():
+            dirs, _ = CraftCopyEngine.listTree(self.imageDir())
+            for d in dirs:
+                utils.createDir(os.path.join(root, os.path.relpath(d, self.imageDir())))
+        engine = CraftCopyEngine(linkOnly=CraftCore.settings.getboolean("General", "UseHardlinks", False))
+        if not engine.copyFiles([(os.path.join(self.imageDir(), filename), os.path.join(root, filename)) for filename in toCopy]):
+            return False
+        self._addCopiedDigests(root, fileList, toCopy)
+
+        for package in installed:
+            package.uninstall(commit=False)
+        package = CraftCore.installdb.addInstalled(self.package, self.version, revision=self.sourceRevision())
+        package.addFiles(fileList)
+        if (CraftCore.settings.getboolean("Packager", "CreateCache") or
+            CraftCore.settings.getboolean("Packager", "UseCache")):
+            package.setCacheVersion(self.cacheVersion())
+        package.install()
+        return True
+
+    def _atomicQmerge(self, incremental=False) -> bool:
+        """ merge the image through a staging dir, the craft root and the install database are only
+            changed if the whole merge succeeds, an interrupted merge is rolled back on the next run """
+        root = CraftCore.standardDirs.craftRoot()
+        journal = CraftMergeJournal.begin(self.package)
+        try:
+            installed = CraftCore.installdb.getInstalledPackages(self.package)
+            if incremental:
+                fileList, toCopy, oldFiles = self._incrementalMergePlan(installed)
+                engine = CraftCopyEngine(linkOnly=CraftCore.settings.getboolean("General", "UseHardlinks", False))
+                if not engine.copyFiles([(os.path.join(self.imageDir(), filename), os.path.join(journal.imageDir, filename)) for filename in toCopy]):
+                    journal.rollback()
+                    return False
+                self._addCopiedDigests(journal.imageDir, fileList, toCopy)
+            else:
+                stagedFiles = []
+                if Path(self.imageDir()).exists():
+                    if not utils.copyDir(self.imageDir(), journal.imageDir, copiedFiles=stagedFiles):
+                        journal.rollback()
+                        return False
+                fileList = self.getFileListFromDirectory(journal.imageDir, stagedFiles, sourceDir=self.imageDir())
+                toCopy = [filename for filename, _ in fileList]
+                oldFiles = []
+                for package in installed:
+                    oldFiles.extend(package.getFilesWithHashes())
+            removedFiles = [os.path.relpath(x, root) for x in self.unmergeCandidates(root, oldFiles)]
+            if not journal.swap(toCopy, removedFiles):
+                return False
+
+            for package in installed:
+                package.uninstall(commit=False)
+            package = CraftCore.installdb.addInstalled(self.package, self.version, revision=self.sourceRevision())
+            package.addFiles(fileList)
+            package.install(commit=False)
+            if (CraftCore.settings.getboolean("Packager", "CreateCache") or
+                CraftCore.settings.getboolean("Packager", "UseCache")):
+                package.setCacheVersion(self.cacheVersion())
+        except Exception as e:
+            CraftCore.log.error(f"Failed to merge {self}", exc_info=e)
+            journal.rollback()
+            return False
+        # from here on an interruption is finished by CraftMergeJournal.recover
+        journal.commit()
+        return True
+
     def unmerge(self):
         """unmergeing the files from the filesystem"""
         CraftCore.log.debug("Packagebase unmerge called")
+        CraftMergeJournal.recover()
         packageList = CraftCore.installdb.getInstalledPackages(self.package)
         for package in packageList:
             fileList = package.getFilesWithHashes()
@@ -74,121 +197,276 @@ class PackageBase(CraftBase):
         basepath = os.path.join(self.installDir())
         utils.createImportLibs(pkgName, basepath)
 
-    def fetchBinary(self, downloadRetriesLeft=3) -> bool:
-        if self.subinfo.options.package.disableBinaryCache:
-            return False
-        for url in [self.cacheLocation()] + self.cacheRepositoryUrls():
+    def findBinaryCache(self, quiet: bool=False) -> (str, object, str):
+        """ returns the url, the manifest entry and the local archive path of the first cache providing our version """
+        log = CraftCore.log.debug if quiet else CraftCore.log.info
+        for url in [self.cacheLocation()] + self.cacheRepositoryUrls(sortMirrors=True):
             CraftCore.log.debug(f"Trying to restore {self} from cache: {url}.")
-            if url == self.cacheLocation():
-                fileUrl = f"{url}/manifest.json"
-                if os.path.exists(fileUrl):
-                    with open(fileUrl, "rt", encoding="UTF-8") as f:
-                        manifest = CraftManifest.fromJson(json.load(f))
-                else:
-                    continue
-            else:
-                manifest = CraftManifest.fromJson(CraftCore.cache.cacheJsonFromUrl(f"{url}/manifest.json"))
-            fileEntry = manifest.get(str(self)).files
+            if url == self.cacheLocation() and not (os.path.exists(f"{url}/manifest.json") or CraftManifest.isSharded(url)):
+                continue
+            fileEntry = CraftManifest.getEntry(url, str(self)).files
             files = []
             for f in fileEntry:
                 if f.version == self.version:
                     files.append(f)
             if not files:
-                CraftCore.log.info(f"Could not find {self}={self.version} in {url}")
+                log(f"Could not find {self}={self.version} in {url}")
                 continue
             latest = files[0]
 
             if latest.configHash and latest.configHash != self.subinfo.options.dynamic.configHash():
-                CraftCore.log.info("Failed to restore package, configuration missmatch")
+                log("Failed to restore package, configuration missmatch")
                 # try next cache
                 continue
 
-            # if we are creating the cache, a rebuild on a failed fetch would be suboptimal
-            createingCache = CraftCore.settings.getboolean("Packager", "CreateCache", False)
-
             if url != self.cacheLocation():
                 downloadFolder = self.cacheLocation(os.path.join(CraftCore.standardDirs.downloadDir(), "cache"))
             else:
                 downloadFolder = self.cacheLocation()
-            localArchiveAbsPath = OsUtils.toNativePath(os.path.join(downloadFolder, latest.fileName))
-            localArchivePath, localArchiveName = os.path.split(localArchiveAbsPath)
+                if not os.path.isfile(os.path.join(downloadFolder, latest.fileName)):
+                    continue
+            return url, latest, OsUtils.toNativePath(os.path.join(downloadFolder, latest.fileName))
+        return None, None, None
 
+    def _binaryCacheFileUrl(self, url : str, entry) -> str:
+        fileName = entry.fileName
+        if CraftCore.compiler.isWindows:
+            fileName = fileName.replace("\\", "/")
+        return f"{url}/{fileName}"
 
-            if url != self.cacheLocation():
-                if not os.path.exists(localArchiveAbsPath):
-                    os.makedirs(localArchivePath, exist_ok=True)
-                    fileName = latest.fileName
-                    if CraftCore.compiler.isWindows:
-                        fileName = fileName.replace("\\", "/")
-                    fUrl = f"{url}/{fileName}"
-                    # try it up to 3 times
-                    retries = 3
-                    while True:
-                        if GetFiles.getFile(fUrl, localArchivePath, localArchiveName):
-                            break
-                        msg = f"Failed to fetch {fUrl}"
-                        retries -= 1
-                        if not retries:
-                            if createingCache:
-                                raise BlueprintException(msg, self.package)
-                            else:
-                                CraftCore.log.warning(msg)
-                            return False
-            elif not os.path.isfile(localArchiveAbsPath):
-                continue
+    def _binaryCacheMirrorUrls(self, url : str, entry) -> [str]:
+        """ returns the urls of entry on url and, if we race mirrors, on the other repositories that provide the same file """
+        out = [self._binaryCacheFileUrl(url, entry)]
+        if CraftCore.settings.getboolean("General", "MirrorRace", False):
+            for mirror in self.cacheRepositoryUrls():
+                if mirror != url and any(f.checksum == entry.checksum for f in CraftManifest.getEntry(mirror, str(self)).files):
+                    out.append(self._binaryCacheFileUrl(mirror, entry))
+        return out
 
-            if not CraftHash.checkFilesDigests(localArchivePath, [localArchiveName],
-                                               digests=latest.checksum,
-                                               digestAlgorithm=CraftHash.HashAlgorithm.SHA256):
-                msg = f"Hash did not match, {localArchiveName} might be corrupted"
-                CraftCore.log.warning(msg)
-                if downloadRetriesLeft and CraftChoicePrompt.promptForChoice("Do you want to delete the files and redownload them?",
-                                                     [("Yes", True), ("No", False)],
-                                                     default="Yes"):
-                    return utils.deleteFile(localArchiveAbsPath) and self.fetchBinary(downloadRetriesLeft=downloadRetriesLeft-1)
-                if createingCache:
-                    raise BlueprintException(msg, self.package)
+    def prefetch(self) -> bool:
+        """ downloads the files needed by fetch-binary or fetch in advance
+        called from a worker thread of the CraftPrefetcher """
+        if CraftCore.settings.getboolean("Packager", "UseCache", "False") and not self.subinfo.options.package.disableBinaryCache:
+            url, latest, localArchiveAbsPath = self.findBinaryCache(quiet=True)
+            if latest:
+                if url == self.cacheLocation() or os.path.exists(localArchiveAbsPath):
+                    return True
+                localArchivePath, localArchiveName = os.path.split(localArchiveAbsPath)
+                return GetFiles.prefetchFile(self._binaryCacheFileUrl(url, latest), localArchivePath, localArchiveName)
+        return self.prefetchSources()
+
+    def fetchBinary(self, downloadRetriesLeft=3) -> bool:
+        if self.subinfo.options.package.disableBinaryCache:
+            return False
+        url, latest, localArchiveAbsPath = self.findBinaryCache()
+        if not latest:
+            return False
+        # if we are creating the cache, a rebuild on a failed fetch would be suboptimal
+        createingCache = CraftCore.settings.getboolean("Packager", "CreateCache", False)
+        localArchivePath, localArchiveName = os.path.split(localArchiveAbsPath)
+
+        if url != self.cacheLocation():
+            if not os.path.exists(localArchiveAbsPath):
+                os.makedirs(localArchivePath, exist_ok=True)
+                fUrls = self._binaryCacheMirrorUrls(url, latest)
+                # try it up to 3 times
+                retries = 3
+                while True:
+                    if CraftMirrors.getFile(fUrls, localArchivePath, localArchiveName):
+                        break
+                    msg = f"Failed to fetch {fUrls[0]}"
+                    retries -= 1
+                    if not retries:
+                        if createingCache:
+                            raise BlueprintException(msg, self.package)
+                        else:
+                            CraftCore.log.warning(msg)
+                        return False
+
+        if not CraftHash.checkFilesDigests(localArchivePath, [localArchiveName],
+                                           digests=latest.checksum,
+                                           digestAlgorithm=CraftHash.HashAlgorithm.SHA256):
+            msg = f"Hash did not match, {localArchiveName} might be corrupted"
+            CraftCore.log.warning(msg)
+            if downloadRetriesLeft and CraftChoicePrompt.promptForChoice("Do you want to delete the files and redownload them?",
+                                                 [("Yes", True), ("No", False)],
+                                                 default="Yes"):
+                return utils.deleteFile(localArchiveAbsPath) and self.fetchBinary(downloadRetriesLeft=downloadRetriesLeft-1)
+            if createingCache:
+                raise BlueprintException(msg, self.package)
+            return False
+        return self._unpackBinaryCache(url, latest, localArchiveAbsPath) and self.installBinaryCache()
+
+    def _unpackBinaryCache(self, url, latest, localArchiveAbsPath) -> bool:
+        self.subinfo.buildPrefix = latest.buildPrefix
+        self.subinfo.isCachedBuild = True
+        localArchivePath, localArchiveName = os.path.split(localArchiveAbsPath)
+        fileList = self._binaryCacheFileList(url, latest, localArchiveAbsPath)
+        if fileList is not None:
+            # installBinaryCache extracts the archive directly into the craft root
+            self.__directCacheInstall = (latest.codec, localArchiveAbsPath, fileList)
+            return True
+        self.__directCacheInstall = None
+        if not self.cleanImage():
+            return False
+        if latest.codec == "chunked":
+            if url == self.cacheLocation():
+                return CraftObjectStore(self.cacheObjectsLocation(url)).restore(localArchiveAbsPath, self.imageDir())
+            # the objects of remote caches are downloaded next to the indices
+            localCache = self.cacheLocation(os.path.join(CraftCore.standardDirs.downloadDir(), "cache"))
+            return CraftObjectStore(self.cacheObjectsLocation(localCache)).restore(localArchiveAbsPath, self.imageDir(), url=self.cacheObjectsLocation(url))
+        return utils.unpackFile(localArchivePath, localArchiveName, self.imageDir(), codec=latest.codec)
+
+    def unpackBinaryCache(self, url, latest, localArchiveAbsPath) -> bool:
+        """ download, verify and unpack the binary cache found by findBinaryCache
+        called from a worker thread of the bulk cache restore, installBinaryCache completes the installation """
+        localArchivePath, localArchiveName = os.path.split(localArchiveAbsPath)
+        if url != self.cacheLocation():
+            fUrls = self._binaryCacheMirrorUrls(url, latest)
+            for _ in range(3):
+                if CraftMirrors.getFile(fUrls, localArchivePath, localArchiveName, fetch=GetFiles.prefetchFile):
+                    break
+            else:
+                CraftCore.log.warning(f"Failed to fetch {fUrls[0]}")
                 return False
-            self.subinfo.buildPrefix = latest.buildPrefix
-            self.subinfo.isCachedBuild = True
-            if not (self.cleanImage()
-                    and utils.unpackFile(localArchivePath, localArchiveName, self.imageDir())
-                    and self.internalPostInstall()
-                    and self.postInstall()
-                    and self.qmerge()
+        if not CraftHash.checkFilesDigests(localArchivePath, [localArchiveName],
+                                           digests=latest.checksum,
+                                           digestAlgorithm=CraftHash.HashAlgorithm.SHA256):
+            CraftCore.log.warning(f"Hash did not match, {localArchiveName} might be corrupted")
+            if url != self.cacheLocation():
+                utils.deleteFile(localArchiveAbsPath)
+            return False
+        return self._unpackBinaryCache(url, latest, localArchiveAbsPath)
+
+    def _binaryCacheFileList(self, url, latest, localArchiveAbsPath) -> [(str, str)]:
+        """ returns the file list stored next to the archive if the archive can be installed without the image dir
+            this is only possible if the files don't need to be relocated or modified by the blueprint """
+        if not CraftCore.settings.getboolean("Packager", "DirectCacheInstall", False) or not latest.fileList:
+            return None
+        if (CraftCore.settings.getboolean("General", "AtomicMerge", False)
+                or CraftCore.settings.getboolean("General", "IncrementalMerge", False)):
+            return None
+        if (CraftCore.compiler.isMacOS
+                or not latest.buildPrefix
+                or OsUtils.toUnixPath(latest.buildPrefix) != OsUtils.toUnixPath(CraftCore.standardDirs.craftRoot())
+                or type(self).postInstall is not CraftBase.postInstall):
+            return None
+        # the symlinks of tar archives are replaced by copies, we don't want to do that for the whole craft root
+        if CraftCore.compiler.isWindows and CraftArchive.isTarArchive(latest.fileName):
+            return None
+        localArchivePath = os.path.dirname(localArchiveAbsPath)
+        fileListName = os.path.basename(latest.fileList)
+        if url != self.cacheLocation():
+            fileListUrl = f"{url}/{latest.fileList}"
+            if not GetFiles.prefetchFile(fileListUrl, localArchivePath, fileListName):
+                CraftCore.log.debug(f"Failed to fetch {fileListUrl}")
+                return None
+        if not CraftHash.checkFilesDigests(localArchivePath, [fileListName],
+                                           digests=latest.fileListChecksum,
+                                           digestAlgorithm=CraftHash.HashAlgorithm.SHA256):
+            CraftCore.log.warning(f"Hash did not match, {fileListName} might be corrupted")
+            if url != self.cacheLocation():
+                utils.deleteFile(os.path.join(localArchivePath, fileListName))
+            return None
+        with open(os.path.join(localArchivePath, fileListName), "rt", encoding="UTF-8") as f:
+            data = json.load(f)
+        if data.get("version") != 1:
+            return None
+        return [tuple(x) for x in data["files"]]
+
+    def _installBinaryCacheDirectly(self, codec, localArchiveAbsPath, fileList) -> bool:
+        """ extract the binary cache into the craft root, the digests are taken from the file list """
+        root = CraftCore.standardDirs.craftRoot()
+        CraftMergeJournal.recover()
+        if self.package.isInstalled:
+            self.unmerge()
+        localArchivePath, localArchiveName = os.path.split(localArchiveAbsPath)
+        if not utils.unpackFile(localArchivePath, localArchiveName, root, codec=codec):
+            return False
+
+        algorithm = CraftHash.HashAlgorithm.SHA256
+        prefix = algorithm.stringPrefix()
+        CraftCore.installdb.addDigests(dict((os.path.join(root, filename), filehash[len(prefix):])
+                                            for filename, filehash in fileList if filehash.startswith(prefix)), algorithm)
+        package = CraftCore.installdb.addInstalled(self.package, self.version, revision=self.sourceRevision())
+        package.addFiles(fileList)
+        package.setCacheVersion(self.cacheVersion())
+        package.install()
+        return True
+
+    def installBinaryCache(self) -> bool:
+        """ install the unpacked binary cache """
+        if self.__directCacheInstall:
+            directCacheInstall, self.__directCacheInstall = self.__directCacheInstall, None
+            return (self._installBinaryCacheDirectly(*directCacheInstall)
                     and self.internalPostQmerge()
-                    and self.postQmerge()):
-                return False
-            return True
-        return False
+                    and self.postQmerge())
+        return (self.internalPostInstall()
+                and self.postInstall()
+                and self.qmerge()
+                and self.internalPostQmerge()
+                and self.postQmerge())
 
     @staticmethod
-    def getFileListFromDirectory(imagedir, filePaths):
-        """ create a file list containing hashes """
-        ret = []
-
+    def getFileListFromDirectory(imagedir, filePaths, sourceDir=None):
+        """ create a file list containing hashes
+            if the files are copies of the files in sourceDir the digests of the originals are used """
         algorithm = CraftHash.HashAlgorithm.SHA256
+        if sourceDir:
+            sources = {filePath: os.path.join(sourceDir, os.path.relpath(filePath, imagedir)) for filePath in filePaths}
+            sourceDigests = CraftCore.installdb.digestFiles(sources.values(), algorithm)
+            digests = {filePath: sourceDigests[source] for filePath, source in sources.items()}
+            CraftCore.installdb.addDigests(digests, algorithm)
+        else:
+            digests = CraftCore.installdb.digestFiles(filePaths, algorithm)
+
+        ret = []
         for filePath in filePaths:
             relativeFilePath = os.path.relpath(filePath, imagedir)
-            digest = algorithm.stringPrefix() + CraftHash.digestFile(filePath, algorithm)
-            ret.append((relativeFilePath, digest))
+            ret.append((relativeFilePath, algorithm.stringPrefix() + digests[filePath]))
         return ret
 
     @staticmethod
-    def unmergeFileList(rootdir, fileList):
-        """ delete files in the fileList if has matches """
+    def unmergeCandidates(rootdir, fileList) -> [str]:
+        """ returns the files in the fileList that are unchanged and can be removed """
+        # compute all digests at once, unchanged files are not read again
+        toCheck = {}
+        for filename, filehash in fileList:
+            fullPath = os.path.join(rootdir, os.path.normcase(filename))
+            if filehash and (os.path.isfile(fullPath) or os.path.islink(fullPath)):
+                algorithm = CraftHash.HashAlgorithm.getAlgorithmFromPrefix(filehash)
+                toCheck.setdefault(algorithm, []).append(fullPath)
+        currentHashes = {}
+        for algorithm, paths in toCheck.items():
+            for path, digest in CraftCore.installdb.digestFiles(paths, algorithm).items():
+                currentHashes[path] = algorithm.stringPrefix() + digest
+
+        toRemove = []
         for filename, filehash in fileList:
             fullPath = os.path.join(rootdir, os.path.normcase(filename))
             if os.path.isfile(fullPath) or os.path.islink(fullPath):
-                if filehash:
-                    algorithm = CraftHash.HashAlgorithm.getAlgorithmFromPrefix(filehash)
-                    currentHash = algorithm.stringPrefix() + CraftHash.digestFile(fullPath, algorithm)
-                if not filehash or currentHash == filehash:
-                    OsUtils.rm(fullPath, True)
+                if not filehash or currentHashes[fullPath] == filehash:
+                    toRemove.append(fullPath)
                 else:
                     CraftCore.log.warning(
                         f"We can't remove {fullPath} as its hash has changed,"
                         f" that usually implies that the file was modified or replaced")
+        return toRemove
+
+    @staticmethod
+    def unmergeFileList(rootdir, fileList):
+        """ delete files in the fileList if has matches """
+        toRemove = PackageBase.unmergeCandidates(rootdir, fileList)
+        CraftCore.installdb.removeDigests(toRemove)
+        toRemove = set(toRemove)
+
+        for filename, filehash in fileList:
+            fullPath = os.path.join(rootdir, os.path.normcase(filename))
+            if fullPath in toRemove:
+                OsUtils.rm(fullPath, True)
+            elif os.path.isfile(fullPath) or os.path.islink(fullPath):
+                # modified file
+                pass
             elif not os.path.isdir(fullPath) and os.path.lexists(fullPath):
                 CraftCore.log.debug(f"Remove a dead symlink {fullPath}")
                 OsUtils.rm(fullPath, True)
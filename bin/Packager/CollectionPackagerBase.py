@@ -33,6 +33,9 @@ from Blueprints.CraftDependencyPackage import DependencyType, CraftDependencyPac
 from Blueprints.CraftPackageObject import *
 from Package.SourceOnlyPackageBase import *
 from Utils import CodeSign
+from Utils.CraftCopyEngine import CraftCopyEngine
+from Utils.CraftFileMatcher import CraftFileMatcher
+from Utils.CraftImageScanner import CraftImageScanner
 
 
 def toRegExp(fname, targetName) -> re:
@@ -200,16 +203,16 @@ class CollectionPackagerBase(PackagerBase):
         """ return False if file is not blacklisted, and True if it is blacklisted """
         if blackList is None:
             blackList = self.blacklist
-        CraftCore.log.debug(f"Start filtering: {message}")
-        _blacklists = set([lambda filename, root: utils.regexFileFilter(filename, root, blackList)])
+        # the patterns are combined once per list
+        if CraftFileMatcher.get(tuple(blackList)).match(utils.relativeEntryPath(filename, root)):
+            return True
         if message == "blacklisted":
-            _blacklists.update(self._blacklist_filters)
+            filters = self._blacklist_filters
         elif message == "whitelisted":
-            _blacklists.update(self._whitelist_filters)
-        for b in _blacklists:
-            if b(filename, root):
-                return True
-        return False
+            filters = self._whitelist_filters
+        else:
+            filters = []
+        return any(f(filename, root) for f in filters)
 
     def _filterQtBuildType(self, filename):
         if not self.__deployQtSdk:
@@ -247,21 +250,25 @@ class CollectionPackagerBase(PackagerBase):
             # files from the cache are already signed
             doSign = os.path.samefile(srcDir, self.imageDir())
 
+        engine = CraftCopyEngine(linkOnly=False)
+        files = []
         for entry in utils.filterDirectoryContent(srcDir, self.whitelisted, self.blacklisted, handleAppBundleAsFile=True):
             if not self._filterQtBuildType(entry):
                 continue
             entry_target = os.path.join(destDir, os.path.relpath(entry, srcDir))
             if os.path.isfile(entry) or os.path.islink(entry):
-                if not utils.copyFile(entry, entry_target, linkOnly=False):
-                    return False
-                if utils.isBinary(entry_target):
-                    if doSign:
-                        filesToSign.append(entry_target)
+                files.append((entry, entry_target))
             else:
                 # .app or .dSYM
                 assert CraftCore.compiler.isMacOS
-                if not utils.copyDir(entry, entry_target, linkOnly=False):
+                if not engine.copyTree(entry, entry_target):
                     return False
+        if not engine.copyFiles(files):
+            return False
+        CraftCore.log.debug(f"Copied {srcDir} -> {destDir}: {engine}")
+        if doSign:
+            binaries = set(CraftImageScanner.scan(srcDir).binaries)
+            filesToSign = [target for source, target in files if os.path.abspath(source) in binaries]
         if filesToSign:
             if not CodeSign.signWindows(filesToSign):
                 return False
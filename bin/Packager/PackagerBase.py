@@ -12,6 +12,8 @@ from CraftBase import *
 
 from Utils import CraftHash
 from Utils.CraftManifest import *
+from Utils.CraftCopyEngine import CraftCopyEngine
+from Utils.CraftObjectStore import CraftObjectStore
 
 from CraftDebug import deprecated
 
@@ -77,19 +79,27 @@ class PackagerBase(CraftBase):
     def createPackage(self):
         utils.abstract()
 
-    def _generateManifest(self, destDir, archiveName, manifestLocation=None, manifestUrls=None):
+    def _generateManifest(self, destDir, archiveName, manifestLocation=None, manifestUrls=None, codec=None, fileList=None):
         if not manifestLocation:
             manifestLocation = destDir
-        manifestLocation = os.path.join(manifestLocation, "manifest.json")
         archiveFile = os.path.join(destDir, archiveName)
 
         name = archiveName if not os.path.isabs(archiveName) else os.path.relpath(archiveName, destDir)
 
-        manifest = CraftManifest.load(manifestLocation, urls=manifestUrls)
-        entry = manifest.get(str(self))
-        entry.addFile(name, CraftHash.digestFile(archiveFile, CraftHash.HashAlgorithm.SHA256), version=self.version, config=self.subinfo.options.dynamic)
-
-        manifest.dump(manifestLocation)
+        entryFile = CraftManifestEntryFile(name, CraftHash.digestFile(archiveFile, CraftHash.HashAlgorithm.SHA256), version=self.version, codec=codec)
+        entryFile.configHash = self.subinfo.options.dynamic.configHash()
+        if fileList:
+            entryFile.fileList = os.path.relpath(fileList, destDir)
+            if CraftCore.compiler.isWindows:
+                entryFile.fileList = entryFile.fileList.replace("\\", "/")
+            entryFile.fileListChecksum = CraftHash.digestFile(fileList, CraftHash.HashAlgorithm.SHA256)
+        CraftManifest.addEntryFile(manifestLocation, str(self), entryFile, urls=manifestUrls)
+
+        if CraftCore.settings.getboolean("Packager", "LegacyManifest", True):
+            manifestFile = os.path.join(manifestLocation, "manifest.json")
+            manifest = CraftManifest.load(manifestFile, urls=manifestUrls)
+            manifest.get(str(self)).files.insert(0, entryFile)
+            manifest.dump(manifestFile)
 
     @property
     def archiveExtension(self):
@@ -99,9 +109,12 @@ class PackagerBase(CraftBase):
                 extension = ".tar.xz"
             else:
                 extension = ".tar.7z"
+        elif extension == ".tar.zst" and not CraftCore.cache.findApplication("zstd"):
+            CraftCore.log.warning("zstd is not installed, falling back to tar.xz")
+            extension = ".tar.xz"
         return extension
 
-    def _createArchive(self, archiveName, sourceDir, destDir, createDigests=True) -> bool:
+    def _createArchive(self, archiveName, sourceDir, destDir, createDigests=True, createFileList=False) -> bool:
         archiveName = str((Path(destDir) / archiveName))
         if not utils.compress(archiveName, sourceDir):
             return False
@@ -114,11 +127,38 @@ class PackagerBase(CraftBase):
                     CraftCore.log.warning(f"Creating new cache, if you want to extend an existing cache, set \"[ContinuousIntegration]UpdateRepository = True\"")
                     manifestUrls = None
                 self._generateManifest(destDir, archiveName, manifestLocation=self.cacheLocation(),
-                                       manifestUrls=manifestUrls)
+                                       manifestUrls=manifestUrls,
+                                       fileList=self._createFileList(archiveName, sourceDir) if createFileList else None)
             else:
                 self._generateManifest(destDir, archiveName)
                 CraftHash.createDigestFiles(archiveName)
         return True
 
+    def _createFileList(self, archiveName, sourceDir) -> str:
+        """ store the files of the archive with their digests next to it,
+            this allows to install a binary cache without the image dir """
+        fileList = f"{archiveName}.filelist.json"
+        _, files = CraftCopyEngine.listTree(sourceDir)
+        algorithm = CraftHash.HashAlgorithm.SHA256
+        # the image is temporary, so we don't store the digests in the install database
+        digests = CraftHash.digestFiles(files, algorithm)
+        with open(fileList, "wt", encoding="UTF-8") as f:
+            json.dump({"version": 1,
+                       "files": [[os.path.relpath(x, sourceDir), algorithm.stringPrefix() + digests[x]] for x in files]}, f)
+        return fileList
+
+    def _createChunkedCache(self, indexName, sourceDir, destDir) -> bool:
+        """ add the files of sourceDir to the object store of the cache and describe them in the index indexName """
+        indexFile = str(Path(destDir) / indexName)
+        store = CraftObjectStore(self.cacheObjectsLocation(self.cacheLocation()))
+        if not store.createIndex(sourceDir, indexFile):
+            return False
+        if CraftCore.settings.getboolean("ContinuousIntegration", "UpdateRepository", False):
+            manifestUrls = [self.cacheRepositoryUrls()[0]]
+        else:
+            manifestUrls = None
+        self._generateManifest(destDir, indexFile, manifestLocation=self.cacheLocation(), manifestUrls=manifestUrls, codec="chunked")
+        return True
+
     def addExecutableFilter(self, pattern : str):
         pass
\ No newline at end of file
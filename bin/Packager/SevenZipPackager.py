@@ -54,7 +54,10 @@ class SevenZipPackager(PackagerBase):
         else:
             dstpath = self.packageDestinationDir()
 
-        if not self._createArchive(self.binaryArchiveName(fileType=self.archiveExtension, includePackagePath=cacheMode, includeTimeStamp=cacheMode), self.imageDir(), dstpath):
+        if cacheMode and CraftCore.settings.getboolean("Packager", "ChunkedCache", False):
+            if not self._createChunkedCache(self.binaryArchiveName(fileType=".files.json", includePackagePath=True, includeTimeStamp=True), self.imageDir(), dstpath):
+                return False
+        elif not self._createArchive(self.binaryArchiveName(fileType=self.archiveExtension, includePackagePath=cacheMode, includeTimeStamp=cacheMode), self.imageDir(), dstpath, createFileList=True):
             return False
         if not self.subinfo.options.package.packSources and CraftCore.settings.getboolean("Packager", "PackageSrc", "True"):
             return self._createArchive(self.binaryArchiveName("-src", fileType=self.archiveExtension, includePackagePath=cacheMode, includeTimeStamp=cacheMode), self.sourceDir(), dstpath)
@@ -29,7 +29,9 @@ from pathlib import Path
 
 from Source.SourceBase import *
 from Utils import CraftHash, GetFiles, CraftChoicePrompt
-from Utils.CraftManifest import CraftManifest
+from Utils.CraftManifest import CraftManifest, CraftManifestEntry
+from Utils.CraftMirrors import CraftMirrors
+from Utils.CraftStreamUnpacker import CraftStreamUnpacker
 
 from CraftCore import CraftCore
 
@@ -42,6 +44,8 @@ class ArchiveSource(SourceBase):
         SourceBase.__init__(self)
         self.__archiveDir = Path(CraftCore.standardDirs.downloadDir()) / "archives"
         self.__downloadDir = self.__archiveDir / self.package.path
+        # archives that were extracted to the work dir while they were downloaded
+        self.__streamedFiles = set()
 
     def __retry(self, downloadRetriesLeft : int, func, **kw):
         downloadRetriesLeft -= 1
@@ -51,22 +55,49 @@ class ArchiveSource(SourceBase):
             return func(downloadRetriesLeft=downloadRetriesLeft, **kw)
         return False
 
+    def __digestAlgorithm(self) -> CraftHash.HashAlgorithm:
+        if self.subinfo.hasTargetDigests():
+            _, algorithm = self.subinfo.targetDigest()
+            return algorithm
+        if self.subinfo.hasTargetDigestUrls():
+            if isinstance(self.subinfo.targetDigestUrl(), tuple):
+                _, algorithm = self.subinfo.targetDigestUrl()
+                return algorithm
+            return CraftHash.HashAlgorithm.SHA1
+        return CraftHash.HashAlgorithm.SHA256
+
+    def __getFile(self, url : str, destdir : str, filename : str, algorithm : CraftHash.HashAlgorithm=None) -> bool:
+        """ download an archive, with [General]StreamUnpack tar archives are extracted to the work dir on the fly """
+        if not CraftStreamUnpacker.canStream(url, filename):
+            return GetFiles.getFile(url, destdir, filename)
+        if not self.__streamedFiles:
+            utils.cleanDirectory(self.workDir())
+        if not CraftStreamUnpacker.getFile(url, destdir, filename, self.workDir(), algorithm or self.__digestAlgorithm()):
+            return False
+        self.__streamedFiles.add(os.path.basename(filename))
+        return True
+
     def _getFileInfoFromArchiveCache(self) -> []:
         out = []
-        for url in CraftCore.settings.getList("Packager", "ArchiveRepositoryUrl"):
-            manifest = CraftManifest.fromJson(CraftCore.cache.cacheJsonFromUrl(utils.urljoin(url, "manifest.json")))
-            files = manifest.get(str(self), compiler="all").files
+        for url in CraftMirrors.sort(CraftCore.settings.getList("Packager", "ArchiveRepositoryUrl")):
+            files = CraftManifest.getEntry(url, str(self), compiler="all").files
             if files:
                 out.append((url, files))
         return out
 
     def __fetchFromArchiveCache(self, downloadRetriesLeft : int=3):
-        for url, files in self._getFileInfoFromArchiveCache():
+        archiveCache = self._getFileInfoFromArchiveCache()
+        for url, files in archiveCache:
             self.__downloadDir.mkdir(parents=True, exist_ok=True)
             for entry in files:
                 if entry.version != self.buildTarget:
                     continue
-                if not GetFiles.getFile(utils.urljoin(url, entry.fileName), self.__archiveDir, entry.fileName):
+                # the other archive caches providing the same file are used as mirrors
+                mirrors = [utils.urljoin(url, entry.fileName)]
+                mirrors += [utils.urljoin(mirror, entry.fileName) for mirror, mirrorFiles in archiveCache
+                            if mirror != url and any(f.fileName == entry.fileName and f.checksum == entry.checksum for f in mirrorFiles)]
+                if not CraftMirrors.getFile(mirrors, self.__archiveDir, entry.fileName,
+                                            fetch=lambda *args: self.__getFile(*args, algorithm=CraftHash.HashAlgorithm.SHA256)):
                     self.__retry(downloadRetriesLeft, self.__fetchFromArchiveCache)
                 if not CraftHash.checkFilesDigests(self.__archiveDir, [entry.fileName],
                                     digests=entry.checksum,
@@ -83,11 +114,7 @@ class ArchiveSource(SourceBase):
         if self.subinfo.hasTargetDigestUrls():
             url, alg = self.subinfo.targetDigestUrl()
             archiveNames.append(self.subinfo.archiveName()[0] + CraftHash.HashAlgorithm.fileEndings().get(alg))
-        manifestLocation = os.path.join(self.__archiveDir, "manifest.json")
-        manifest = CraftManifest.load(manifestLocation, urls=CraftCore.settings.getList("Packager", "ArchiveRepositoryUrl"))
-        entry = manifest.get(str(self), compiler="all")
-        entry.files.clear()
-
+        entry = CraftManifestEntry(str(self))
         for archiveName in archiveNames:
             name = (Path(self.package.path) / archiveName).as_posix()
             archiveFile = self.__downloadDir / archiveName
@@ -96,7 +123,14 @@ class ArchiveSource(SourceBase):
             digests = CraftHash.digestFile(archiveFile, CraftHash.HashAlgorithm.SHA256)
 
             entry.addFile(name, digests, version=self.version)
-        manifest.dump(manifestLocation)
+        CraftManifest.migrate(self.__archiveDir)
+        CraftManifest.writeEntry(self.__archiveDir, entry, compiler="all")
+
+        if CraftCore.settings.getboolean("Packager", "LegacyManifest", True):
+            manifestLocation = os.path.join(self.__archiveDir, "manifest.json")
+            manifest = CraftManifest.load(manifestLocation, urls=CraftCore.settings.getList("Packager", "ArchiveRepositoryUrl"))
+            manifest.get(str(self), compiler="all").files = entry.files
+            manifest.dump(manifestLocation)
         return True
 
     def localFileNames(self):
@@ -147,6 +181,31 @@ class ArchiveSource(SourceBase):
                     return False
         return True
 
+    def __targetFiles(self):
+        # compat for scripts that provide multiple files
+        return zip(self.subinfo.target(), self.subinfo.archiveName()) if isinstance(self.subinfo.target(), list) else [(self.subinfo.target(), self.subinfo.archiveName()[0])]
+
+    def prefetchSources(self):
+        if self.noFetch or not self.subinfo.hasTarget() or not self.subinfo.target():
+            return True
+        if self.__checkFilesPresent(self.localFileNames()):
+            return True
+        files = []
+        for url, entries in self._getFileInfoFromArchiveCache():
+            files += [(utils.urljoin(url, entry.fileName), self.__archiveDir, entry.fileName) for entry in entries if entry.version == self.buildTarget]
+        if not files:
+            files = [(url, self.__downloadDir, fileName) for url, fileName in self.__targetFiles()]
+            if self.subinfo.hasTargetDigestUrls():
+                if isinstance(self.subinfo.targetDigestUrl(), tuple):
+                    url, alg = self.subinfo.targetDigestUrl()
+                    files.append((url[0], self.__downloadDir, self.subinfo.archiveName()[0] + CraftHash.HashAlgorithm.fileEndings().get(alg)))
+                else:
+                    files += [(url, self.__downloadDir, "") for url in self.subinfo.targetDigestUrl()]
+        for url, destDir, fileName in files:
+            if not GetFiles.prefetchFile(url, destDir, fileName):
+                return False
+        return True
+
     def fetch(self, downloadRetriesLeft=3):
         """fetch normal tarballs"""
         CraftCore.log.debug("ArchiveSource.fetch called")
@@ -165,10 +224,8 @@ class ArchiveSource(SourceBase):
                 if self.__fetchFromArchiveCache():
                     return True
 
-                # compat for scripts that provide multiple files
-                files = zip(self.subinfo.target(), self.subinfo.archiveName()) if isinstance(self.subinfo.target(), list) else [(self.subinfo.target(), self.subinfo.archiveName()[0])]
-                for url, fileName in files:
-                    if not GetFiles.getFile(url, self.__downloadDir, fileName):
+                for url, fileName in self.__targetFiles():
+                    if not self.__getFile(url, self.__downloadDir, fileName):
                         CraftCore.log.debug("failed to download files")
                         return False
 
@@ -187,6 +244,10 @@ class ArchiveSource(SourceBase):
         return True
 
     def __redownload(self, downloadRetriesLeft : int, filenames):
+        if self.__streamedFiles:
+            # the extracted files are as broken as the archive
+            self.__streamedFiles = set()
+            utils.cleanDirectory(self.workDir())
         for filename in filenames:
             CraftCore.log.info(f"Deleting downloaded file: {filename}")
             utils.deleteFile(self.__downloadDir / filename)
@@ -225,14 +286,18 @@ class ArchiveSource(SourceBase):
         filenames = self.localFileNames()
 
         # TODO: this might delete generated patches
-        utils.cleanDirectory(self.workDir())
+        if not self.__streamedFiles:
+            utils.cleanDirectory(self.workDir())
 
         if not self.checkDigest(3):
             return False
 
+        streamedFiles, self.__streamedFiles = self.__streamedFiles, set()
         binEndings = (".exe", ".bat", ".msi")
         for filename in filenames:
-            if filename.endswith(binEndings):
+            if filename in streamedFiles:
+                CraftCore.log.debug(f"{filename} was already unpacked during the download")
+            elif filename.endswith(binEndings):
                 filePath = os.path.abspath(os.path.join(self.__downloadDir, filename))
                 if self.subinfo.options.unpack.runInstaller:
                     _, ext = os.path.splitext(filename)
@@ -26,6 +26,7 @@
 
 # git support
 import io
+import subprocess
 
 from Source.VersionSystemSourceBase import *
 
@@ -97,6 +98,17 @@ class GitSource(VersionSystemSourceBase):
             kwargs["cwd"] = self.checkoutDir()
         return utils.system(parts, **kwargs)
 
+    def prefetchSources(self):
+        # only update existing checkouts, clone and checkout are left to fetch
+        checkoutDir = self.checkoutDir()
+        if self.noFetch or not os.path.exists(os.path.join(checkoutDir, ".git")):
+            return True
+        with io.StringIO() as tmp:
+            if not utils.system(["git", "fetch", "-q"], cwd=checkoutDir, logCommand=False, stdout=tmp, stderr=subprocess.STDOUT):
+                CraftCore.log.debug(tmp.getvalue())
+                return False
+        return True
+
     def fetch(self):
         CraftCore.debug.trace('GitSource fetch')
         # get the path where the repositories should be stored to
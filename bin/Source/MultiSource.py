@@ -36,6 +36,10 @@ class MultiSource(SourceBase):
         CraftCore.debug.trace("MultiSource fetch")
         return self._sourceClass.fetch(self)
 
+    def prefetchSources(self):
+        CraftCore.debug.trace("MultiSource prefetchSources")
+        return self._sourceClass.prefetchSources(self)
+
     def checkDigest(self, downloadRetries=3):
         CraftCore.debug.trace("MultiSource checkDigest")
         return self._sourceClass.checkDigest(self, downloadRetries)
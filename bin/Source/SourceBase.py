@@ -15,6 +15,11 @@ class SourceBase(CraftBase):
         """fetch the source from a remote host and save it into a local destination"""
         utils.abstract()
 
+    def prefetchSources(self) -> bool:
+        """download the sources in advance, this is called from a worker thread.
+        Implementations must not touch the source or build dir."""
+        return True
+
     def checkDigest(self, downloadRetries=3):
         """check source digest of the package."""
         return True
@@ -0,0 +1,183 @@
+import bz2
+import collections
+import concurrent.futures
+import gzip
+import io
+import lzma
+import os
+import re
+import shutil
+import stat
+import tarfile
+import zipfile
+
+from CraftCore import CraftCore
+from CraftOS.osutils import OsUtils
+
+
+class CraftArchive(object):
+    """
+    Extracts archives with the python standard library instead of 7za.
+    tar archives keep their symlinks, the members of zip archives are extracted in parallel.
+    """
+    _TarArchive = re.compile(r".*\.(tar|tar\.gz|tgz|tar\.bz2|tbz2?|tar\.xz|txz)$")
+    _CompressedFile = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open, ".lzma": lzma.open}
+    # the codecs used by utils.compress, everything else is handled by 7za
+    Codecs = ["tar.7z", "tar.xz", "tar.zst", "tar.gz", "7z"]
+
+    @staticmethod
+    def codecFromFileName(fileName : str) -> str:
+        fileName = fileName.lower()
+        if fileName.endswith(".tgz"):
+            return "tar.gz"
+        for codec in CraftArchive.Codecs:
+            if fileName.endswith(f".{codec}"):
+                return codec
+        return "7z"
+
+    @staticmethod
+    def isTarArchive(fileName : str) -> bool:
+        return bool(CraftArchive._TarArchive.match(fileName.lower()))
+
+    @staticmethod
+    def canExtract(fileName : str) -> bool:
+        fileName = fileName.lower()
+        return (CraftArchive.isTarArchive(fileName)
+                or fileName.endswith(".zip")
+                or os.path.splitext(fileName)[1] in CraftArchive._CompressedFile)
+
+    @staticmethod
+    def extract(fileName : str, destdir : str, jobs : int=None) -> bool:
+        """ extract fileName to destdir """
+        CraftCore.log.debug(f"Extracting {fileName} to {destdir}")
+        os.makedirs(destdir, exist_ok=True)
+        lowerName = fileName.lower()
+        try:
+            if CraftArchive.isTarArchive(lowerName):
+                with tarfile.open(fileName, "r:*") as tar:
+                    CraftArchive.extractTar(tar, destdir)
+            elif lowerName.endswith(".zip"):
+                CraftArchive._extractZip(fileName, destdir, jobs)
+            else:
+                name, ext = os.path.splitext(os.path.basename(fileName))
+                with CraftArchive._CompressedFile[ext.lower()](fileName, "rb") as src, open(os.path.join(destdir, name), "wb") as dest:
+                    shutil.copyfileobj(src, dest, 1024 * 1024)
+        except Exception as e:
+            CraftCore.log.error(f"Failed to extract {fileName}", exc_info=e)
+            return False
+        return True
+
+    @staticmethod
+    def extractTar(tar : tarfile.TarFile, destdir : str):
+        if hasattr(tarfile, "tar_filter"):
+            # refuse members outside of destdir, but keep absolute symlinks
+            tar.extractall(destdir, filter="tar")
+        else:
+            tar.extractall(destdir)
+
+    @staticmethod
+    def _extractZip(fileName : str, destdir : str, jobs : int=None):
+        destdir = os.path.realpath(destdir)
+        with zipfile.ZipFile(fileName) as archive:
+            files = []
+            links = []
+            for info in archive.infolist():
+                target = os.path.normpath(os.path.join(destdir, info.filename))
+                if os.path.commonpath([destdir, target]) != destdir:
+                    raise Exception(f"{info.filename} is outside of {destdir}")
+                mode = info.external_attr >> 16
+                if info.is_dir():
+                    os.makedirs(target, exist_ok=True)
+                elif stat.S_ISLNK(mode) and (not OsUtils.isWin() or OsUtils.supportsSymlinks()):
+                    links.append((info, target))
+                else:
+                    files.append((info, target, mode))
+
+            def extractMember(member):
+                info, target, mode = member
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with archive.open(info) as src, open(target, "wb") as dest:
+                    shutil.copyfileobj(src, dest, 1024 * 1024)
+                if mode & 0o777:
+                    os.chmod(target, mode & 0o777)
+
+            # zlib releases the gil, so the members can be decompressed in parallel
+            if jobs is None:
+                jobs = os.cpu_count() or 1
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(jobs, len(files)))) as executor:
+                list(executor.map(extractMember, files))
+            for info, target in links:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if os.path.lexists(target):
+                    os.remove(target)
+                os.symlink(archive.read(info).decode("UTF-8"), target)
+
+    class _ParallelGzipWriter(object):
+        """ compresses the written data in blocks, each block becomes a gzip member of its own """
+        BlockSize = 4 * 1024 * 1024
+
+        def __init__(self, out, jobs : int, level : int):
+            self._out = out
+            self._jobs = jobs
+            self._level = level
+            self._buffer = bytearray()
+            self._pending = collections.deque()
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+
+        def write(self, data) -> int:
+            self._buffer += data
+            while len(self._buffer) >= CraftArchive._ParallelGzipWriter.BlockSize:
+                self._submit(bytes(self._buffer[:CraftArchive._ParallelGzipWriter.BlockSize]))
+                del self._buffer[:CraftArchive._ParallelGzipWriter.BlockSize]
+            return len(data)
+
+        @staticmethod
+        def _compress(block : bytes, level : int) -> bytes:
+            # gzip.compress only accepts the mtime since python 3.8
+            with io.BytesIO() as out:
+                with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=level, mtime=0) as f:
+                    f.write(block)
+                return out.getvalue()
+
+        def _submit(self, block : bytes):
+            self._pending.append(self._executor.submit(CraftArchive._ParallelGzipWriter._compress, block, self._level))
+            # keep the memory bounded
+            while len(self._pending) > 2 * self._jobs:
+                self._out.write(self._pending.popleft().result())
+
+        def close(self):
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+            while self._pending:
+                self._out.write(self._pending.popleft().result())
+
+        def shutdown(self):
+            """ stops the workers, blocks that were not written yet are discarded """
+            for future in self._pending:
+                future.cancel()
+            self._pending.clear()
+            self._executor.shutdown()
+
+    @staticmethod
+    def compressTarGz(archive : str, source : str, jobs : int=None, level : int=None) -> bool:
+        """ create a tar.gz of source, the blocks are compressed in parallel """
+        if not jobs:
+            jobs = os.cpu_count() or 1
+        try:
+            with open(archive, "wb") as out:
+                writer = CraftArchive._ParallelGzipWriter(out, jobs, level if level is not None else 6)
+                try:
+                    with tarfile.open(fileobj=writer, mode="w|") as tar:
+                        if os.path.isfile(source):
+                            tar.add(source, arcname=os.path.basename(source))
+                        else:
+                            for name in sorted(os.listdir(source)):
+                                tar.add(os.path.join(source, name), arcname=name)
+                    writer.close()
+                finally:
+                    writer.shutdown()
+        except Exception as e:
+            CraftCore.log.error(f"Failed to create {archive}", exc_info=e)
+            return False
+        return True
@@ -8,6 +8,7 @@ import subprocess
 import tempfile
 import time
 import urllib.error
+import urllib.parse
 import urllib.request
 import sys
 from pathlib import Path
@@ -18,15 +19,19 @@ from Blueprints.CraftVersion import CraftVersion
 from CraftOS.osutils import OsUtils
 from CraftStandardDirs import CraftStandardDirs
 from Utils import GetFiles
+from Utils.CraftHttpCache import CraftHttpCache
 
 class CraftCache(object):
     RE_TYPE = re.Pattern if sys.version_info >= (3,7) else re._pattern_type
-    _version = 9
+    _version = 12
     _cacheLifetime = (60 * 60 * 24) * 1  # days
 
     class NonPersistentCache(object):
         def __init__(self):
             self.applicationLocations = {}
+            # url -> parsed content
+            self.jsonCache = {}
+            self.httpCache = None
 
     def __init__(self):
         self.version = CraftCache._version
@@ -36,9 +41,12 @@ class CraftCache(object):
         self._helpCache = {}
         self._versionCache = {}
         self._nightlyVersions = {}
-        self._jsonCache = {}
         # defined in blueprintSearch
         self.availablePackages = None
+        # defined in CraftPackageObject, package path -> (key, BlueprintMetaData)
+        self.blueprintMetaData = {}
+        # defined in CraftMirrors, host -> latency, throughput and failures
+        self.mirrorStats = {}
 
         # non persistent cache
         self._nonPersistentCache = CraftCache.NonPersistentCache()
@@ -82,17 +90,45 @@ class CraftCache(object):
                 return
             if isinstance(CraftCore.cache, AutoImport):
                 return
-            with open(CraftCache._cacheFile(), "wb") as f:
-                pick = pickle.Pickler(f, protocol=pickle.HIGHEST_PROTOCOL)
-                pick.dump(CraftCore.cache)
+            # the parallel craft processes save the cache as well, never expose a partially written file
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(CraftCache._cacheFile()), prefix="cache.pickle.")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pick = pickle.Pickler(f, protocol=pickle.HIGHEST_PROTOCOL)
+                    pick.dump(CraftCore.cache)
+                os.replace(tmp, CraftCache._cacheFile())
+            except BaseException:
+                os.remove(tmp)
+                raise
         except Exception as e:
             CraftCore.log.warning(f"Failed to save cache {e}", exc_info=e, stack_info=True)
-            os.remove(CraftCache._cacheFile())
 
     def clear(self):
         CraftCore.log.debug("Clear utils cache")
         CraftCore.cache = CraftCache()
 
+    @staticmethod
+    def _which(app, path=None) -> str:
+        # on Windows shutil.which looks in the current directory first, we don't want to find things in the build dir etc
+        # changing the directory is no option as we are used from multiple threads
+        if not OsUtils.isWin() or os.path.dirname(app):
+            return shutil.which(app, path=path)
+        if path is None:
+            path = os.environ.get("PATH", os.defpath)
+        pathExt = os.environ.get("PATHEXT", "").split(os.pathsep)
+        if any(app.lower().endswith(ext.lower()) for ext in pathExt if ext):
+            names = [app]
+        else:
+            names = [app + ext for ext in pathExt if ext]
+        for dir in path.split(os.pathsep):
+            if not dir:
+                continue
+            for name in names:
+                candidate = os.path.join(dir, name)
+                if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+                    return candidate
+        return None
+
     def findApplication(self, app, path=None, forceCache:bool=False) -> str:
         if app in self._nonPersistentCache.applicationLocations:
             appLocation = self._nonPersistentCache.applicationLocations[app]
@@ -101,11 +137,7 @@ class CraftCache(object):
             else:
                 self._helpCache.clear()
 
-        # don't look in the build dir etc
-        _cwd = os.getcwd()
-        os.chdir(CraftCore.standardDirs.craftRoot())
-        appLocation = shutil.which(app, path=path)
-        os.chdir(_cwd)
+        appLocation = CraftCache._which(app, path=path)
 
         if appLocation:
             if OsUtils.isWin():
@@ -175,24 +207,41 @@ class CraftCache(object):
         CraftCore.log.debug(f"getVersion: {app}[{appVersion}]")
         return appVersion
 
+    def _cacheFromUrl(self, url, parse, default):
+        if os.path.isfile(url):
+            with open(url, "rt", encoding="UTF-8") as jsonFile:
+                # don't cache local manifest
+                return parse(jsonFile.read())
+        jsonCache = self._nonPersistentCache.jsonCache
+        if urllib.parse.urlparse(url).scheme in {"http", "https"}:
+            if not self._nonPersistentCache.httpCache:
+                self._nonPersistentCache.httpCache = CraftHttpCache(os.path.join(CraftStandardDirs.etcDir(), "http-cache"))
+            data = self._nonPersistentCache.httpCache.get(url)
+            if data is None:
+                return default
+            # only parse the data again if it changed
+            if url not in jsonCache or jsonCache[url][0] is not data:
+                jsonCache[url] = (data, parse(data.decode("UTF-8")))
+                CraftCore.log.debug(f"cacheJsonFromUrl: {url}\n{data}")
+            return jsonCache[url][1]
+        if not url in jsonCache:
+            with tempfile.TemporaryDirectory() as tmp:
+                if not GetFiles.getFile(url, tmp, "manifest.json", quiet=True):
+                    return default
+                with open(os.path.join(tmp, "manifest.json"), "rt", encoding="UTF-8") as jsonFile:
+                    data = jsonFile.read()
+                    jsonCache[url] = (data, parse(data))
+                    CraftCore.log.debug(f"cacheJsonFromUrl: {url}\n{data}")
+        return jsonCache[url][1]
+
     def cacheJsonFromUrl(self, url, timeout=10) -> object:
         CraftCore.log.debug(f"Fetch Json: {url}")
-        if not url in self._jsonCache:
-            if os.path.isfile(url):
-                with open(url, "rt", encoding="UTF-8") as jsonFile:
-                    # don't cache local manifest
-                    return json.loads(jsonFile.read())
-            else:
-                with tempfile.TemporaryDirectory() as tmp:
-                    if not GetFiles.getFile(url, tmp, "manifest.json", quiet=True):
-                        # TODO: provide the error code and only cache 404...
-                        self._jsonCache[url] = {}
-                        return {}
-                    with open(os.path.join(tmp, "manifest.json"), "rt", encoding="UTF-8") as jsonFile:
-                        data = jsonFile.read()
-                        self._jsonCache[url] = json.loads(data)
-                        CraftCore.log.debug(f"cacheJsonFromUrl: {url}\n{data}")
-        return self._jsonCache.get(url, {})
+        return self._cacheFromUrl(url, json.loads, {})
+
+    def cacheJsonLinesFromUrl(self, url, timeout=10) -> [object]:
+        """ fetches a file containing one json document per line """
+        CraftCore.log.debug(f"Fetch Json lines: {url}")
+        return self._cacheFromUrl(url, lambda data: [json.loads(line) for line in data.splitlines() if line.strip()], [])
 
     def getNightlyVersionsFromUrl(self, url, pattern, timeout=10) -> [str]:
         """
@@ -0,0 +1,193 @@
+import concurrent.futures
+import errno
+import os
+import shutil
+import threading
+import time
+
+from CraftCore import CraftCore
+from CraftOS.osutils import OsUtils
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class CraftCopyEngine(object):
+    """
+    Copies files with the cheapest method supported by the file system:
+    reflink (FICLONE), hard link if linkOnly is set, copy_file_range/sendfile and finally a plain copy.
+    """
+    # _IOW(0x94, 9, int) from linux/fs.h
+    FICLONE = 0x40049409
+    BlockSize = 1024 * 1024
+
+    # (source device, destination device) pairs that don't support reflinks
+    _noReflink = set()
+
+    def __init__(self, linkOnly=False, jobs : int=None):
+        self.linkOnly = linkOnly
+        self.jobs = jobs or int(CraftCore.settings.get("General", "CopyJobs", str(os.cpu_count() or 1)))
+        self.files = 0
+        self.bytes = 0
+        self.methods = {}
+        self._lock = threading.Lock()
+        self._startTime = None
+
+    def __str__(self):
+        duration = max(time.perf_counter() - self._startTime, 0.001) if self._startTime else 0.001
+        methods = ", ".join([f"{method}: {count}" for method, count in sorted(self.methods.items())])
+        return (f"{self.files} files, {self.bytes / 1024 / 1024:.1f} MiB in {duration:.2f}s "
+                f"({self.files / duration:.0f} files/s, {self.bytes / 1024 / 1024 / duration:.1f} MiB/s) [{methods}]")
+
+    def _count(self, method : str, size : int):
+        with self._lock:
+            self.files += 1
+            self.bytes += size
+            self.methods[method] = self.methods.get(method, 0) + 1
+
+    @staticmethod
+    def _reflink(fsrc, fdst) -> bool:
+        if not fcntl or not OsUtils.isLinux():
+            return False
+        devices = (os.fstat(fsrc.fileno()).st_dev, os.fstat(fdst.fileno()).st_dev)
+        if devices in CraftCopyEngine._noReflink:
+            return False
+        try:
+            fcntl.ioctl(fdst.fileno(), CraftCopyEngine.FICLONE, fsrc.fileno())
+            return True
+        except OSError as e:
+            if e.errno in {errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.EPERM}:
+                CraftCopyEngine._noReflink.add(devices)
+            return False
+
+    @staticmethod
+    def _mightReflink(src : str, dest : str) -> bool:
+        if not fcntl or not OsUtils.isLinux():
+            return False
+        devices = (os.stat(src).st_dev, os.stat(os.path.dirname(os.path.abspath(dest))).st_dev)
+        return devices not in CraftCopyEngine._noReflink
+
+    @staticmethod
+    def _copyData(fsrc, fdst, size : int) -> str:
+        if CraftCopyEngine._reflink(fsrc, fdst):
+            return "reflink"
+        for name in ["copy_file_range", "sendfile"]:
+            function = getattr(os, name, None)
+            if not function or not OsUtils.isLinux():
+                continue
+            try:
+                offset = 0
+                while offset < size:
+                    if name == "sendfile":
+                        copied = function(fdst.fileno(), fsrc.fileno(), offset, min(size - offset, 1024 * 1024 * 1024))
+                    else:
+                        copied = function(fsrc.fileno(), fdst.fileno(), size - offset, offset, offset)
+                    if copied == 0:
+                        break
+                    offset += copied
+                if offset == size:
+                    return name
+            except OSError:
+                pass
+            fdst.seek(0)
+            fdst.truncate()
+        fsrc.seek(0)
+        shutil.copyfileobj(fsrc, fdst, CraftCopyEngine.BlockSize)
+        return "copy"
+
+    def copyFile(self, src, dest) -> bool:
+        """copy src to dest, dest is the full path of the new file and its parent must exist"""
+        src = str(src)
+        dest = str(dest)
+        try:
+            if os.path.lexists(dest):
+                CraftCore.log.warning(f"Overriding:\t{dest} with\n\t\t{src}")
+                if os.path.abspath(src) == os.path.abspath(dest):
+                    CraftCore.log.error(f"Can't copy a file into itself {src}=={dest}")
+                    return False
+                OsUtils.rm(dest, True)
+            # don't link to links
+            if os.path.islink(src):
+                shutil.copy2(src, dest, follow_symlinks=False)
+                self._count("symlink", 0)
+                return True
+            size = os.path.getsize(src)
+            if self.linkOnly:
+                # only create the file for a reflink if the devices might support it
+                if CraftCopyEngine._mightReflink(src, dest):
+                    with open(src, "rb") as fsrc:
+                        with open(dest, "wb") as fdst:
+                            reflinked = CraftCopyEngine._reflink(fsrc, fdst)
+                    if reflinked:
+                        shutil.copystat(src, dest)
+                        self._count("reflink", size)
+                        return True
+                    os.remove(dest)
+                try:
+                    os.link(src, dest)
+                    self._count("hardlink", 0)
+                    return True
+                except Exception:
+                    CraftCore.log.warning(f"Failed to create hardlink {dest} for {src}")
+            with open(src, "rb") as fsrc:
+                with open(dest, "wb") as fdst:
+                    method = CraftCopyEngine._copyData(fsrc, fdst, size)
+            shutil.copystat(src, dest)
+            self._count(method, 0 if method == "reflink" else size)
+        except Exception as e:
+            CraftCore.log.error(f"Failed to copy file:\n{src} to\n{dest}", exc_info=e)
+            return False
+        return True
+
+    def copyFiles(self, files : [(str, str)]) -> bool:
+        """copy a list of (src, dest) pairs in parallel"""
+        if self._startTime is None:
+            self._startTime = time.perf_counter()
+        files = list(files)
+        for _, dest in files:
+            parent = os.path.dirname(str(dest))
+            if parent and not os.path.isdir(parent):
+                os.makedirs(parent, exist_ok=True)
+        if len(files) < 2 or self.jobs < 2:
+            return all(self.copyFile(src, dest) for src, dest in files)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            return all(executor.map(lambda x: self.copyFile(*x), files))
+
+    @staticmethod
+    def listTree(srcdir) -> ([str], [str]):
+        """ returns the directories and the files below srcdir, symlinks to directories are listed as files """
+        dirs = []
+        files = []
+        toVisit = [str(srcdir)]
+        while toVisit:
+            with os.scandir(toVisit.pop()) as scan:
+                for entry in scan:
+                    if entry.is_dir() and not entry.is_symlink():
+                        dirs.append(entry.path)
+                        toVisit.append(entry.path)
+                    else:
+                        files.append(entry.path)
+        return dirs, files
+
+    def copyTree(self, srcdir, destdir, copiedFiles : [str]=None) -> bool:
+        """copy the content of srcdir into destdir, symlinks are copied without resolving them"""
+        if self._startTime is None:
+            self._startTime = time.perf_counter()
+        srcdir = str(srcdir)
+        destdir = str(destdir)
+        try:
+            dirs, files = CraftCopyEngine.listTree(srcdir)
+            for d in [srcdir] + dirs:
+                os.makedirs(os.path.join(destdir, os.path.relpath(d, srcdir)), exist_ok=True)
+        except Exception as e:
+            CraftCore.log.error(f"Failed to copy dir:\n{srcdir} to\n{destdir}", exc_info=e)
+            return False
+        files = [(f, os.path.join(destdir, os.path.relpath(f, srcdir))) for f in files]
+        if not self.copyFiles(files):
+            return False
+        if copiedFiles is not None:
+            copiedFiles.extend([dest for _, dest in files])
+        CraftCore.log.debug(f"Copied {srcdir} to {destdir}: {self}")
+        return True
@@ -0,0 +1,241 @@
+import concurrent.futures
+import hashlib
+import http.client
+import os
+import ssl
+import sys
+import threading
+import urllib.parse
+
+from CraftCore import CraftCore
+from Utils import CraftHash
+
+
+class CraftDownloader(object):
+    """
+    Downloads files over http(s) without external tools.
+    The connections to a host are kept alive and shared by all downloads,
+    interrupted downloads are resumed and the SHA256 digest is computed while the file is written.
+    Large files are downloaded in chunks over multiple connections if the server supports ranges.
+    """
+    BlockSize = 1024 * 1024
+    ChunkThreshold = 32 * 1024 * 1024
+    MaxRedirects = 50
+
+    _instance = None
+    _instanceLock = threading.Lock()
+
+    def __init__(self, connections : int=None):
+        self.connections = connections or int(CraftCore.settings.get("General", "DownloadConnections", "4"))
+        # (scheme, netloc) -> idle connections
+        self._pool = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def instance() -> "CraftDownloader":
+        with CraftDownloader._instanceLock:
+            if not CraftDownloader._instance:
+                CraftDownloader._instance = CraftDownloader()
+            return CraftDownloader._instance
+
+    @staticmethod
+    def _sslContext():
+        cert = os.path.join(CraftCore.standardDirs.etcDir(), "cacert.pem")
+        if os.path.exists(cert):
+            return ssl.create_default_context(cafile=cert)
+        return ssl.create_default_context()
+
+    def _connection(self, key : (str, str), reuse : bool=True) -> (http.client.HTTPConnection, bool):
+        if reuse:
+            with self._lock:
+                idle = self._pool.get(key)
+                if idle:
+                    return idle.pop(), True
+        scheme, netloc = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=60, context=CraftDownloader._sslContext()), False
+        return http.client.HTTPConnection(netloc, timeout=60), False
+
+    def _release(self, key : (str, str), connection : http.client.HTTPConnection, response : http.client.HTTPResponse):
+        if response.will_close or not response.isclosed():
+            connection.close()
+            return
+        with self._lock:
+            self._pool.setdefault(key, []).append(connection)
+
+    def close(self):
+        with self._lock:
+            for connections in self._pool.values():
+                for connection in connections:
+                    connection.close()
+            self._pool = {}
+
+    def _request(self, url : str, headers : {str : str}) -> (http.client.HTTPResponse, http.client.HTTPConnection, (str, str), str):
+        """ sends a GET request for url following redirects, returns the response, its connection, the pool key and the final url """
+        headers = dict(headers)
+        headers.setdefault("User-Agent", "Craft")
+        headers.setdefault("Accept-Encoding", "identity")
+        for _ in range(CraftDownloader.MaxRedirects):
+            parsedUrl = urllib.parse.urlparse(url)
+            key = (parsedUrl.scheme, parsedUrl.netloc)
+            path = parsedUrl.path or "/"
+            if parsedUrl.query:
+                path += f"?{parsedUrl.query}"
+            connection, reused = self._connection(key)
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                if not reused:
+                    raise
+                # the server closed the idle connection
+                connection, _ = self._connection(key, reuse=False)
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+            if response.status in {301, 302, 303, 307, 308}:
+                location = response.getheader("Location")
+                response.read()
+                self._release(key, connection, response)
+                url = urllib.parse.urljoin(url, location)
+                continue
+            return response, connection, key, url
+        raise http.client.HTTPException(f"Too many redirects for {url}")
+
+    class _Progress(object):
+        def __init__(self, url : str, total : int, done : int, quiet : bool):
+            self.name = os.path.basename(urllib.parse.urlparse(url).path)
+            self.total = total
+            self.done = done
+            self.quiet = quiet or CraftCore.debug.verbose() < 0
+            self._lock = threading.Lock()
+            self._lastPercent = -1
+
+        def update(self, size : int):
+            with self._lock:
+                self.done += size
+                if self.quiet:
+                    return
+                if self.total:
+                    percent = int(self.done * 100 / self.total)
+                    if percent != self._lastPercent:
+                        self._lastPercent = percent
+                        sys.stdout.write(f"\r{self.name}: {percent}% of {self.total / 1024 / 1024:.1f} MiB")
+                        sys.stdout.flush()
+                else:
+                    sys.stdout.write(f"\r{self.name}: {self.done / 1024 / 1024:.1f} MiB")
+                    sys.stdout.flush()
+
+        def finish(self):
+            if not self.quiet:
+                sys.stdout.write("\n")
+                sys.stdout.flush()
+
+    def download(self, url : str, destdir : str, filename : str, quiet : bool=False, sinks : [callable]=None) -> bool:
+        """ download url to destdir/filename
+        the sinks are called with the content of the file, block by block and in order """
+        dest = os.path.join(destdir, filename)
+        part = f"{dest}.part"
+        try:
+            return self._download(url, dest, part, quiet, sinks or [])
+        except Exception as e:
+            CraftCore.log.warning(f"Failed to download {url}: {e}")
+            return False
+
+    def _download(self, url : str, dest : str, part : str, quiet : bool, sinks : [callable]) -> bool:
+        offset = os.path.getsize(part) if os.path.isfile(part) else 0
+        headers = {}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        response, connection, key, finalUrl = self._request(url, headers)
+        try:
+            if response.status == 416 and offset:
+                response.read()
+            else:
+                return self._receive(url, dest, part, quiet, sinks, offset, response, connection, finalUrl)
+        finally:
+            # the connection is only reused if the response was read completely
+            self._release(key, connection, response)
+        # the partial file is invalid, start over
+        os.remove(part)
+        return self._download(url, dest, part, quiet, sinks)
+
+    def _receive(self, url : str, dest : str, part : str, quiet : bool, sinks : [callable], offset : int,
+                 response : http.client.HTTPResponse, connection : http.client.HTTPConnection, finalUrl : str) -> bool:
+        if response.status not in {200, 206}:
+            CraftCore.log.warning(f"Failed to download {url}: {response.status} {response.reason}")
+            response.read()
+            return False
+        if CraftCore.settings.getboolean("ContinuousIntegration", "Enabled", False):
+            CraftCore.log.info(f"Downloaded from: {urllib.parse.urlparse(finalUrl).netloc}")
+        if response.status == 200:
+            offset = 0
+        length = response.getheader("Content-Length")
+        total = offset + int(length) if length is not None else None
+
+        if (not sinks and response.status == 200 and total and total >= CraftDownloader.ChunkThreshold and self.connections > 1
+                and response.getheader("Accept-Ranges") == "bytes"):
+            connection.close()
+            return self._downloadChunks(finalUrl, dest, total, quiet)
+
+        hash = hashlib.sha256()
+        if offset:
+            CraftCore.log.debug(f"Resuming {url} at {offset} bytes")
+            with open(part, "rb") as f:
+                for block in iter(lambda: f.read(CraftDownloader.BlockSize), b""):
+                    hash.update(block)
+                    for sink in sinks:
+                        sink(block)
+        progress = CraftDownloader._Progress(url, total, offset, quiet)
+        with open(part, "ab" if offset else "wb") as f:
+            for block in iter(lambda: response.read(CraftDownloader.BlockSize), b""):
+                f.write(block)
+                hash.update(block)
+                for sink in sinks:
+                    sink(block)
+                progress.update(len(block))
+        progress.finish()
+        if total is not None and progress.done != total:
+            CraftCore.log.warning(f"Incomplete download of {url}: {progress.done} of {total} bytes")
+            return False
+        os.replace(part, dest)
+        CraftHash.addKnownDigest(dest, CraftHash.HashAlgorithm.SHA256, hash.hexdigest())
+        return True
+
+    def _downloadChunks(self, url : str, dest : str, total : int, quiet : bool) -> bool:
+        # the chunks are written out of order, so this file can't be resumed like a .part file
+        chunksFile = f"{dest}.chunks"
+        with open(chunksFile, "wb") as f:
+            f.truncate(total)
+        chunkSize = -(-total // self.connections)
+        progress = CraftDownloader._Progress(url, total, 0, quiet)
+
+        def downloadChunk(start : int) -> bool:
+            end = min(start + chunkSize, total) - 1
+            response, connection, key, _ = self._request(url, {"Range": f"bytes={start}-{end}"})
+            try:
+                if response.status != 206:
+                    CraftCore.log.warning(f"Failed to download bytes {start}-{end} of {url}: {response.status} {response.reason}")
+                    return False
+                written = 0
+                with open(chunksFile, "r+b") as f:
+                    f.seek(start)
+                    for block in iter(lambda: response.read(CraftDownloader.BlockSize), b""):
+                        f.write(block)
+                        written += len(block)
+                        progress.update(len(block))
+                return written == end - start + 1
+            finally:
+                self._release(key, connection, response)
+
+        CraftCore.log.debug(f"Downloading {url} with {self.connections} connections")
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.connections) as executor:
+                ok = all(executor.map(downloadChunk, range(0, total, chunkSize)))
+        finally:
+            progress.finish()
+        if not ok:
+            os.remove(chunksFile)
+            return False
+        os.replace(chunksFile, dest)
+        return True
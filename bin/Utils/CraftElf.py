@@ -0,0 +1,121 @@
+import os
+import struct
+
+from CraftCore import CraftCore
+
+
+class CraftElf(object):
+    """
+    Reads the dynamic section of an ELF file: the needed libraries, the rpath, the runpath and the soname.
+    Only the headers and the dynamic section are read, the results are memoized by the path and the mtime of the file.
+    """
+    _Magic = b"\x7FELF"
+
+    PT_LOAD = 1
+    PT_DYNAMIC = 2
+
+    DT_NULL = 0
+    DT_NEEDED = 1
+    DT_STRTAB = 5
+    DT_SONAME = 14
+    DT_RPATH = 15
+    DT_RUNPATH = 29
+
+    __cache = {}
+
+    def __init__(self):
+        self.needed = []
+        self.rpath = []
+        self.runpath = []
+        self.soname = None
+
+    @staticmethod
+    def read(path : str) -> "CraftElf":
+        """ returns None if path is not an ELF file """
+        path = os.path.realpath(path)
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+        cached = CraftElf.__cache.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+        try:
+            with open(path, "rb") as f:
+                elf = CraftElf._parse(f)
+        except (OSError, struct.error, ValueError) as e:
+            CraftCore.log.debug(f"Failed to parse {path}: {e}")
+            elf = None
+        CraftElf.__cache[path] = (key, elf)
+        return elf
+
+    @staticmethod
+    def _parse(f) -> "CraftElf":
+        ident = f.read(16)
+        if len(ident) < 16 or ident[:4] != CraftElf._Magic:
+            return None
+        is64 = ident[4] == 2
+        endian = "<" if ident[5] == 1 else ">"
+        if is64:
+            header = struct.unpack(f"{endian}HHIQQQIHHHHHH", f.read(48))
+            programHeader = f"{endian}IIQQQQQQ"
+        else:
+            header = struct.unpack(f"{endian}HHIIIIIHHHHHH", f.read(36))
+            programHeader = f"{endian}IIIIIIII"
+        phoff, phentsize, phnum = header[4], header[8], header[9]
+
+        loads = []
+        dynamic = None
+        for i in range(phnum):
+            f.seek(phoff + i * phentsize)
+            fields = struct.unpack(programHeader, f.read(struct.calcsize(programHeader)))
+            if is64:
+                pType, _, offset, vaddr, _, filesz, _, _ = fields
+            else:
+                pType, offset, vaddr, _, filesz, _, _, _ = fields
+            if pType == CraftElf.PT_LOAD:
+                loads.append((vaddr, offset, filesz))
+            elif pType == CraftElf.PT_DYNAMIC:
+                dynamic = (offset, filesz)
+        out = CraftElf()
+        if not dynamic:
+            # a static binary
+            return out
+
+        entry = f"{endian}qQ" if is64 else f"{endian}iI"
+        entrySize = struct.calcsize(entry)
+        f.seek(dynamic[0])
+        data = f.read(dynamic[1])
+        entries = []
+        for i in range(0, len(data) - entrySize + 1, entrySize):
+            tag, value = struct.unpack_from(entry, data, i)
+            if tag == CraftElf.DT_NULL:
+                break
+            entries.append((tag, value))
+
+        strtab = next((value for tag, value in entries if tag == CraftElf.DT_STRTAB), None)
+        if strtab is None:
+            return out
+        # the string table is referenced by its address, map it to the file offset
+        strtabOffset = next((offset + strtab - vaddr for vaddr, offset, filesz in loads if vaddr <= strtab < vaddr + filesz), None)
+        if strtabOffset is None:
+            raise ValueError("the string table is not part of a loaded segment")
+
+        def string(index):
+            f.seek(strtabOffset + index)
+            value = b""
+            while b"\0" not in value:
+                block = f.read(256)
+                if not block:
+                    break
+                value += block
+            return value.split(b"\0", 1)[0].decode("utf-8", "replace")
+
+        for tag, value in entries:
+            if tag == CraftElf.DT_NEEDED:
+                out.needed.append(string(value))
+            elif tag == CraftElf.DT_RPATH:
+                out.rpath += string(value).split(":")
+            elif tag == CraftElf.DT_RUNPATH:
+                out.runpath += string(value).split(":")
+            elif tag == CraftElf.DT_SONAME:
+                out.soname = string(value)
+        return out
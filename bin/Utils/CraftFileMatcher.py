@@ -0,0 +1,169 @@
+import functools
+import re
+
+from Utils.CraftCache import CraftCache
+
+
+class CraftFileMatcher(object):
+    """
+    Matches relative paths against a list of regular expressions, like searching them one after another.
+    Anchored alternatives that are a literal, a literal followed by .* or .* followed by a literal
+    are looked up in a set or compared by their prefix or suffix, the others are combined in one expression.
+    """
+    _Special = set(".^$*+?{}[]|()\\")
+
+    def __init__(self, patterns : [CraftCache.RE_TYPE]):
+        # keyed by whether the patterns ignore the case
+        self._exact = {False: set(), True: set()}
+        self._prefixes = {False: set(), True: set()}
+        self._suffixes = {False: set(), True: set()}
+        fallback = {}
+        # the search functions of the expressions that are not indexed
+        self._regex = []
+        for pattern in patterns:
+            # patterns that can't be split are used as they are
+            if re.search(r"\\\d|\(\?[^:]", pattern.pattern):
+                self._regex.append(pattern.search)
+                continue
+            ignoreCase = bool(pattern.flags & re.IGNORECASE)
+            for alternative in CraftFileMatcher._splitAlternatives(CraftFileMatcher._unwrap(pattern.pattern)):
+                if not self._index(alternative, ignoreCase):
+                    fallback.setdefault(pattern.flags, []).append(alternative)
+        for flags, alternatives in fallback.items():
+            regex = re.compile("|".join(f"(?:{x})" for x in alternatives), flags)
+            # if all alternatives are anchored only the start of the path needs to be tried
+            anchored = not flags & re.MULTILINE and all(x.startswith("^") for x in alternatives)
+            self._regex.append(regex.match if anchored else regex.search)
+        # the indices that are not empty
+        self._indices = [(ignoreCase, self._exact[ignoreCase], tuple(self._prefixes[ignoreCase]), tuple(self._suffixes[ignoreCase]))
+                         for ignoreCase in [False, True]
+                         if self._exact[ignoreCase] or self._prefixes[ignoreCase] or self._suffixes[ignoreCase]]
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def get(patterns : (CraftCache.RE_TYPE,)) -> "CraftFileMatcher":
+        """ returns a shared matcher for the tuple of patterns """
+        return CraftFileMatcher(patterns)
+
+    def match(self, path : str) -> bool:
+        for ignoreCase, exact, prefixes, suffixes in self._indices:
+            key = path.lower() if ignoreCase else path
+            if key in exact or key.startswith(prefixes) or key.endswith(suffixes):
+                return True
+        return any(search(path) for search in self._regex)
+
+    def _index(self, alternative : str, ignoreCase : bool) -> bool:
+        """ adds the alternative to the literal indices, returns False if it is not supported """
+        if len(alternative) < 2 or alternative[0] != "^" or alternative[-1] != "$" or alternative[-2] == "\\":
+            return False
+        body = alternative[1:-1]
+        out = None
+        if body.startswith(".*"):
+            literal = CraftFileMatcher._literal(body[2:])
+            if literal is not None:
+                out = self._suffixes, [literal]
+        elif body.endswith(".*") and not body.endswith("\\.*"):
+            literal = CraftFileMatcher._literal(body[:-2])
+            if literal is not None:
+                out = self._prefixes, [literal]
+        else:
+            # a literal with an optional literal suffix, like bin/foo(\.exe)?
+            optional = re.fullmatch(r"(.*)\(([^()]*)\)\?", body)
+            if optional:
+                literal, suffix = CraftFileMatcher._literal(optional.group(1)), CraftFileMatcher._literal(optional.group(2))
+                if literal is not None and suffix is not None:
+                    out = self._exact, [literal, literal + suffix]
+            else:
+                literal = CraftFileMatcher._literal(body)
+                if literal is not None:
+                    out = self._exact, [literal]
+        if not out:
+            return False
+        index, literals = out
+        if ignoreCase:
+            literals = [x.lower() for x in literals]
+        index[ignoreCase].update(literals)
+        return True
+
+    @staticmethod
+    def _literal(pattern : str) -> str:
+        """ returns the string matched by pattern, None if pattern is not a plain ascii literal """
+        out = []
+        i = 0
+        while i < len(pattern):
+            c = pattern[i]
+            if c == "\\":
+                if i + 1 == len(pattern) or pattern[i + 1].isalnum():
+                    return None
+                c = pattern[i + 1]
+                i += 1
+            elif c in CraftFileMatcher._Special:
+                return None
+            if ord(c) >= 128:
+                return None
+            out.append(c)
+            i += 1
+        return "".join(out)
+
+    @staticmethod
+    def _splitAlternatives(pattern : str) -> [str]:
+        """ splits pattern at the | that are not part of a group or a character class """
+        out = []
+        depth = 0
+        start = 0
+        inClass = False
+        i = 0
+        while i < len(pattern):
+            c = pattern[i]
+            if c == "\\":
+                i += 1
+            elif inClass:
+                if c == "]":
+                    inClass = False
+            elif c == "[":
+                inClass = True
+                # a ] at the start of the class is a literal
+                if pattern[i + 1:i + 2] == "^":
+                    i += 1
+                if pattern[i + 1:i + 2] == "]":
+                    i += 1
+            elif c == "(":
+                depth += 1
+            elif c == ")":
+                depth -= 1
+            elif c == "|" and depth == 0:
+                out.append(pattern[start:i])
+                start = i + 1
+            i += 1
+        out.append(pattern[start:])
+        return out
+
+    @staticmethod
+    def _unwrap(pattern : str) -> str:
+        """ removes a group enclosing the whole pattern """
+        if not pattern.startswith("(") or pattern.startswith("(?") or not pattern.endswith(")"):
+            return pattern
+        depth = 0
+        inClass = False
+        i = 0
+        while i < len(pattern):
+            c = pattern[i]
+            if c == "\\":
+                i += 1
+            elif inClass:
+                if c == "]":
+                    inClass = False
+            elif c == "[":
+                inClass = True
+                if pattern[i + 1:i + 2] == "^":
+                    i += 1
+                if pattern[i + 1:i + 2] == "]":
+                    i += 1
+            elif c == "(":
+                depth += 1
+            elif c == ")":
+                depth -= 1
+                if depth == 0:
+                    return pattern[1:-1] if i == len(pattern) - 1 else pattern
+            i += 1
+        return pattern
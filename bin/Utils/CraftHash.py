@@ -1,4 +1,6 @@
+import concurrent.futures
 import hashlib
+import mmap
 import os
 import re
 from enum import Enum
@@ -43,20 +45,69 @@ def digestString(string : str, algorithm=HashAlgorithm.SHA256)-> str:
     hash.update(bytes(string, "UTF-8"))
     return hash.hexdigest()
 
-def digestFile(filepath, algorithm=HashAlgorithm.SHA256):
-    """ digests a file """
-    blockSize = 65536
+_BlockSize = 1024 * 1024
+_MMapThreshold = 16 * 1024 * 1024
+
+def _digestFile(filepath, algorithm : HashAlgorithm) -> str:
     hash = getattr(hashlib, algorithm.name.lower())()
     if os.path.islink(filepath):
         hash.update(os.readlink(filepath).encode("utf-8"))
     else:
         with open(filepath, "rb") as hashFile:
-            buffer = hashFile.read(blockSize)
-            while len(buffer) > 0:
-                hash.update(buffer)
-                buffer = hashFile.read(blockSize)
+            size = os.fstat(hashFile.fileno()).st_size
+            if size >= _MMapThreshold:
+                with mmap.mmap(hashFile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    hash.update(data)
+            else:
+                # hashlib releases the gil for large updates, so use large blocks
+                buffer = hashFile.read(_BlockSize)
+                while len(buffer) > 0:
+                    hash.update(buffer)
+                    buffer = hashFile.read(_BlockSize)
     return hash.hexdigest()
 
+# digests that are already known, for example because they were computed during the download
+# path -> (signature, algorithm, digest)
+_knownDigests = {}
+
+def _fileSignature(stat) -> tuple:
+    # a rewrite with the same size and a restored mtime still changes the ctime, a replaced file changes the inode
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns)
+
+def addKnownDigest(filepath, algorithm : HashAlgorithm, digest : str):
+    """ remember the digest of filepath until the file is modified """
+    _knownDigests[os.path.abspath(filepath)] = (_fileSignature(os.stat(filepath)), algorithm, digest)
+
+def _knownDigest(filepath, algorithm : HashAlgorithm) -> str:
+    known = _knownDigests.get(os.path.abspath(filepath))
+    if known and known[1] == algorithm and not os.path.islink(filepath):
+        if _fileSignature(os.stat(filepath)) == known[0]:
+            return known[2]
+    return None
+
+def digestFiles(filepaths, algorithm=HashAlgorithm.SHA256, jobs : int=None) -> {str : str}:
+    """ digests multiple files in parallel, returns a dict mapping the paths to their digest """
+    out = {}
+    toDigest = []
+    for path in filepaths:
+        known = _knownDigest(path, algorithm)
+        if known:
+            out[path] = known
+        else:
+            toDigest.append(path)
+    if len(toDigest) < 2:
+        out.update({path: _digestFile(path, algorithm) for path in toDigest})
+        return out
+    if not jobs:
+        jobs = os.cpu_count() or 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(jobs, len(toDigest))) as executor:
+        out.update(zip(toDigest, executor.map(lambda path: _digestFile(path, algorithm), toDigest)))
+    return out
+
+def digestFile(filepath, algorithm=HashAlgorithm.SHA256):
+    """ digests a file """
+    return digestFiles([filepath], algorithm)[filepath]
+
 
 def checkFilesDigests(downloaddir, filenames, digests=None, digestAlgorithm=HashAlgorithm.SHA1):
     """check digest of (multiple) files specified by 'filenames' from 'downloaddir'"""
@@ -65,6 +116,9 @@ def checkFilesDigests(downloaddir, filenames, digests=None, digestAlgorithm=Hash
     else:
         digestList = [digests]
 
+    # digest all files with a given digest at once
+    currentHashes = digestFiles({os.path.join(downloaddir, filename) for digests, filename in zip(digestList, filenames) if digests != None},
+                                digestAlgorithm)
     for digests, filename in zip(digestList, filenames):
         pathName = os.path.join(downloaddir, filename)
         CraftCore.log.debug(f"checking digest of: {pathName}")
@@ -90,7 +144,7 @@ def checkFilesDigests(downloaddir, filenames, digests=None, digestAlgorithm=Hash
                     return False
                     # digest provided in digests parameter
         else:
-            currentHash = digestFile(pathName, digestAlgorithm)
+            currentHash = currentHashes[pathName]
             if len(digests) != len(currentHash) or digests.find(currentHash) == -1:
                 CraftCore.log.error("%s hash for file %s (%s) does not match (%s)" % (
                     digestAlgorithm.name, pathName, currentHash, digests))
@@ -109,9 +163,7 @@ def createDigestFiles(path, algorithms=None):
 
 
 def printFilesDigests(downloaddir, filenames, buildTarget, algorithm=HashAlgorithm.SHA256):
-    digests = []
-    for filename in filenames:
-        if not filename == "":
-            digests.append(digestFile(os.path.join(downloaddir, filename), algorithm))
+    paths = [os.path.join(downloaddir, filename) for filename in filenames if not filename == ""]
+    digests = list(digestFiles(paths, algorithm).values())
     if digests:
         CraftCore.log.info(f"Digests for {buildTarget}: ({digests}, CraftHash.{algorithm})")
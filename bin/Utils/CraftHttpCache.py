@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import re
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from CraftCore import CraftCore
+
+
+class CraftHttpCache(object):
+    """
+    A disk cache for small files like manifests.
+    Entries are reused for their time to live, which is taken from the Cache-Control header of the server
+    or [General]HttpCacheTtl, afterwards they are revalidated with their ETag or Last-Modified date.
+    Failed requests are cached for [General]HttpCacheNegativeTtl seconds.
+    """
+
+    def __init__(self, cacheDir : str):
+        self.cacheDir = cacheDir
+        self.ttl = int(CraftCore.settings.get("General", "HttpCacheTtl", str(60 * 60)))
+        self.negativeTtl = int(CraftCore.settings.get("General", "HttpCacheNegativeTtl", str(5 * 60)))
+        # url -> (expires, data), successful fetches are reused for the lifetime of the process
+        self._memory = {}
+        self._lock = threading.Lock()
+        self._urlLocks = {}
+
+    def _paths(self, url : str) -> (str, str):
+        name = hashlib.sha256(url.encode("UTF-8")).hexdigest()
+        return os.path.join(self.cacheDir, f"{name}.json"), os.path.join(self.cacheDir, f"{name}.data")
+
+    def _loadMeta(self, url : str) -> dict:
+        metaPath, _ = self._paths(url)
+        try:
+            with open(metaPath, "rt", encoding="UTF-8") as f:
+                meta = json.load(f)
+            if meta.get("url") == url:
+                return meta
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def _loadData(self, url : str) -> bytes:
+        _, dataPath = self._paths(url)
+        try:
+            with open(dataPath, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _store(self, url : str, meta : dict, data : bytes=None):
+        metaPath, dataPath = self._paths(url)
+        os.makedirs(self.cacheDir, exist_ok=True)
+        if data is not None:
+            with open(f"{dataPath}.tmp", "wb") as f:
+                f.write(data)
+            os.replace(f"{dataPath}.tmp", dataPath)
+        meta["url"] = url
+        with open(f"{metaPath}.tmp", "wt", encoding="UTF-8") as f:
+            json.dump(meta, f)
+        os.replace(f"{metaPath}.tmp", metaPath)
+
+    def _maxAge(self, headers) -> int:
+        cacheControl = headers.get("Cache-Control", "")
+        if "no-cache" in cacheControl or "no-store" in cacheControl:
+            return 0
+        match = re.search(r"max-age=(\d+)", cacheControl)
+        if match:
+            return int(match.group(1))
+        return self.ttl
+
+    @staticmethod
+    def _sslContext():
+        cert = os.path.join(CraftCore.standardDirs.etcDir(), "cacert.pem")
+        if os.path.exists(cert):
+            return ssl.create_default_context(cafile=cert)
+        return None
+
+    def _request(self, url : str, meta : dict, revalidate : bool) -> (int, dict, bytes):
+        request = urllib.request.Request(url, headers={"User-Agent": "Craft"})
+        if revalidate:
+            if meta.get("etag"):
+                request.add_header("If-None-Match", meta["etag"])
+            if meta.get("lastModified"):
+                request.add_header("If-Modified-Since", meta["lastModified"])
+        try:
+            with urllib.request.urlopen(request, timeout=30, context=CraftHttpCache._sslContext()) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, None
+
+    def _remember(self, url : str, expires : float, data : bytes):
+        self._memory[url] = (expires if data is None else float("inf"), data)
+
+    def get(self, url : str) -> bytes:
+        """ returns the content of url or None if it can't be fetched """
+        with self._lock:
+            urlLock = self._urlLocks.setdefault(url, threading.Lock())
+        with urlLock:
+            now = time.time()
+            cached = self._memory.get(url)
+            if cached and cached[0] > now:
+                return cached[1]
+
+            meta = self._loadMeta(url)
+            data = self._loadData(url) if meta and meta.get("status") == 200 else None
+            offline = CraftCore.settings.getboolean("General", "WorkOffline", False)
+            if meta and (meta.get("expires", 0) > now or offline):
+                CraftCore.log.debug(f"Using cached {url}")
+                self._remember(url, meta["expires"], data)
+                return data
+            if offline:
+                return None
+
+            try:
+                status, headers, body = self._request(url, meta, revalidate=data is not None)
+            except Exception as e:
+                # network errors are transient, prefer stale data
+                CraftCore.log.debug(f"Failed to fetch {url}: {e}")
+                self._memory[url] = (now + self.negativeTtl, data)
+                return data
+
+            if status == 304 and data is not None:
+                CraftCore.log.debug(f"{url} was not modified")
+                meta["expires"] = now + self._maxAge(headers)
+                self._store(url, meta)
+            elif status == 200:
+                CraftCore.log.debug(f"Fetched {url}")
+                data = body
+                meta = {"status": status,
+                        "etag": headers.get("ETag"),
+                        "lastModified": headers.get("Last-Modified"),
+                        "expires": now + self._maxAge(headers)}
+                self._store(url, meta, data)
+            else:
+                CraftCore.log.debug(f"Failed to fetch {url}: {status}")
+                if status >= 500 and data is not None:
+                    # keep using the old data until the server is back
+                    self._memory[url] = (now + self.negativeTtl, data)
+                    return data
+                data = None
+                meta = {"status": status, "expires": now + self.negativeTtl}
+                self._store(url, meta)
+            self._remember(url, meta["expires"], data)
+            return data
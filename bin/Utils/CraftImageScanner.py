@@ -0,0 +1,99 @@
+import os
+import stat
+import time
+
+from CraftCore import CraftCore
+
+
+class CraftImageScanner(object):
+    """
+    Walks an image once and classifies its entries as symlinks, patchable files, binaries and debug symbols.
+    The result is cached per image and reused as long as no entry was added to or removed from one of its directories.
+    """
+    # files that can contain the install prefix
+    PatchableFile = {".service", ".pc", ".pri", ".prl", ".cmake", ".conf", ".sh", ".bat", ".cmd", ".ini", ".pl", ".pm", ".la", ".py"}
+
+    # https://en.wikipedia.org/wiki/List_of_file_signatures
+    _MachO64 = b"\xCF\xFA\xED\xFE"
+    _Elf = b"\x7F\x45\x4C\x46"
+
+    # the resolution of the directory timestamps of some file systems
+    _TimestampResolution = 2 * 10**9
+
+    __cache = {}
+
+    def __init__(self, root : str):
+        self.root = root
+        self.files = []
+        self.symlinks = []
+        self.patchable = []
+        self.binaries = []
+        self.debugSymbols = []
+        # directory -> mtime, an added or removed entry changes the mtime of its directory
+        self._dirs = {}
+        self._scan()
+
+    @staticmethod
+    def scan(root : str) -> "CraftImageScanner":
+        root = os.path.abspath(root)
+        scanner = CraftImageScanner.__cache.get(root)
+        if not scanner or not scanner._isValid():
+            scanner = CraftImageScanner(root)
+            CraftImageScanner.__cache[root] = scanner
+        return scanner
+
+    def _isValid(self) -> bool:
+        if not self._dirs:
+            return not os.path.isdir(self.root)
+        try:
+            # a directory changed shortly before the scan might change again without a new timestamp
+            return all(os.stat(path).st_mtime_ns == mtime and mtime < self._scanTime - CraftImageScanner._TimestampResolution
+                       for path, mtime in self._dirs.items())
+        except OSError:
+            return False
+
+    def _isBinary(self, entry : os.DirEntry, ext : str) -> bool:
+        if CraftCore.compiler.isWindows:
+            return ext in {".dll", ".exe"}
+        if ext in {".so", ".dylib"}:
+            return True
+        if not entry.stat().st_mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH):
+            return False
+        signature = CraftImageScanner._MachO64 if CraftCore.compiler.isMacOS else CraftImageScanner._Elf
+        with open(entry.path, "rb") as f:
+            return f.read(len(signature)) == signature
+
+    def _isDebugSymbol(self, ext : str) -> bool:
+        if CraftCore.compiler.isMacOS:
+            return ext == ".dSYM"
+        if CraftCore.compiler.isMSVC():
+            return ext == ".pdb"
+        return ext in {".sym", ".debug"}
+
+    def _scan(self):
+        self._scanTime = int(time.time() * 10**9)
+        if not os.path.isdir(self.root):
+            return
+        dirs = [self.root]
+        while dirs:
+            path = dirs.pop()
+            self._dirs[path] = os.stat(path).st_mtime_ns
+            with os.scandir(path) as scan:
+                for entry in scan:
+                    ext = os.path.splitext(entry.name)[1]
+                    if entry.is_symlink():
+                        self.symlinks.append(entry.path)
+                    elif entry.is_dir():
+                        # the content of the debug symbols of mac is not of interest
+                        if CraftCore.compiler.isMacOS and ext == ".dSYM":
+                            self.debugSymbols.append(entry.path)
+                        else:
+                            dirs.append(entry.path)
+                    elif entry.is_file():
+                        self.files.append(entry.path)
+                        if ext in CraftImageScanner.PatchableFile:
+                            self.patchable.append(entry.path)
+                        elif self._isDebugSymbol(ext):
+                            self.debugSymbols.append(entry.path)
+                        elif self._isBinary(entry, ext):
+                            self.binaries.append(entry.path)
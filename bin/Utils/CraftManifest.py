@@ -2,22 +2,27 @@ import collections
 import datetime
 import json
 import os
-import shutil
 from pathlib import Path
 from typing import List
 
 from CraftCore import CraftCore
+from Utils.CraftArchive import CraftArchive
 import utils
 
 
 class CraftManifestEntryFile(object):
-    def __init__(self, fileName : str, checksum : str, version : str="") -> None:
+    def __init__(self, fileName : str, checksum : str, version : str="", codec : str=None) -> None:
         self.fileName = fileName
         self.checksum = checksum
         self.date = datetime.datetime.utcnow()
         self.version = version
         self.buildPrefix = CraftCore.standardDirs.craftRoot()
         self.configHash = None
+        # how the file was compressed, older manifests don't provide it
+        self.codec = codec or CraftArchive.codecFromFileName(fileName)
+        # the files of the archive with their digests, stored next to the archive
+        self.fileList = None
+        self.fileListChecksum = None
 
         if CraftCore.compiler.isWindows:
             self.fileName = self.fileName.replace("\\", "/")
@@ -30,6 +35,9 @@ class CraftManifestEntryFile(object):
         out.version = data.get("version", "")
         out.buildPrefix = data.get("buildPrefix", None)
         out.configHash = data.get("configHash", None)
+        out.codec = data.get("codec", out.codec)
+        out.fileList = data.get("fileList", None)
+        out.fileListChecksum = data.get("fileListChecksum", None)
         return out
 
     def toJson(self) -> dict:
@@ -37,8 +45,14 @@ class CraftManifestEntryFile(object):
             "fileName"      : self.fileName,
             "checksum"      : self.checksum,
             "date"          : self.date.strftime(CraftManifest._TIME_FORMAT),
-            "version"       : self.version
+            "version"       : self.version,
+            "codec"         : self.codec
         }
+        if self.fileList:
+            data.update({
+                "fileList"          : self.fileList,
+                "fileListChecksum"  : self.fileListChecksum
+            })
         if self.configHash:
             data.update({
                 "buildPrefix"   : self.buildPrefix,
@@ -57,6 +71,19 @@ class CraftManifestEntry(object):
         entry.files = sorted([CraftManifestEntryFile.fromJson(fileData) for fileData in data["files"]], key=lambda x:x.date, reverse=True)
         return entry
 
+    @staticmethod
+    def fromJsonLines(name : str, lines : [dict]):
+        """ creates an entry from the lines of a sharded manifest, the same file might be listed multiple times """
+        files = {}
+        for fileData in lines:
+            f = CraftManifestEntryFile.fromJson(fileData)
+            key = (f.fileName, f.checksum)
+            if key not in files or files[key].date < f.date:
+                files[key] = f
+        entry = CraftManifestEntry(name)
+        entry.files = sorted(files.values(), key=lambda x:x.date, reverse=True)
+        return entry
+
     def toJson(self) -> dict:
         return {"name":self.name, "files": [x.toJson() for x in collections.OrderedDict.fromkeys(self.files)]}
 
@@ -72,7 +99,17 @@ class CraftManifestEntry(object):
         return self.files[0] if self.files else None
 
 class CraftManifest(object):
+    """
+    The manifest of a cache, stored in two formats.
+
+    Version 1: manifest.json, a single document containing all compilers and packages.
+    Version 2: manifest/<compiler>/<package>.jsonl, one file per compiler and package with one
+               CraftManifestEntryFile per line, new files are appended.
+               manifest/index.json marks a directory or repository as sharded.
+    """
     _TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+    # parsed version 1 manifests of remote repositories
+    _remoteManifests = {}
 
     def __init__(self):
         self.date = datetime.datetime.utcnow()
@@ -83,6 +120,10 @@ class CraftManifest(object):
     def version() -> int:
         return 1
 
+    @staticmethod
+    def shardedVersion() -> int:
+        return 2
+
     @staticmethod
     def _migrate0(data : dict):
         manifest = CraftManifest()
@@ -137,7 +178,6 @@ class CraftManifest(object):
 
     def dump(self, cacheFilePath):
         cacheFilePath = Path(cacheFilePath)
-        cacheFilePathTimed = cacheFilePath.parent / f"{cacheFilePath.stem}-{self.date.strftime('%Y%m%dT%H%M%S')}{cacheFilePath.suffix}"
         self.date = datetime.datetime.utcnow()
         if self.origin:
             CraftCore.log.info(f"Updating cache manifest from: {self.origin} in: {cacheFilePath}")
@@ -146,7 +186,117 @@ class CraftManifest(object):
         cacheFilePath.parent.mkdir(parents=True, exist_ok=True)
         with open(cacheFilePath, "wt") as cacheFile:
             json.dump(self, cacheFile, sort_keys=True, indent=2, default=lambda x:x.toJson())
-        shutil.copy2(cacheFilePath, cacheFilePathTimed)
+
+    @staticmethod
+    def _location(location : str, name : str) -> str:
+        if os.path.isdir(location):
+            return os.path.join(location, *name.split("/"))
+        return utils.urljoin(location, name)
+
+    @staticmethod
+    def _shardName(package : str, compiler : str) -> str:
+        return f"manifest/{compiler}/{package}.jsonl"
+
+    @staticmethod
+    def isSharded(location : str) -> bool:
+        """ whether location, a local directory or a url, contains a version 2 manifest """
+        index = CraftManifest._location(location, "manifest/index.json")
+        if os.path.isdir(location):
+            return os.path.isfile(index)
+        return CraftCore.cache.cacheJsonFromUrl(index).get("version", None) == CraftManifest.shardedVersion()
+
+    @staticmethod
+    def getEntry(location : str, package : str, compiler : str=None) -> CraftManifestEntry:
+        """
+        Returns the entry of package from the manifest in location, a local directory or a url.
+        In a sharded manifest only the file of the package is read.
+        """
+        if not compiler:
+            compiler = str(CraftCore.compiler)
+        if CraftManifest.isSharded(location):
+            shard = CraftManifest._location(location, CraftManifest._shardName(package, compiler))
+            if os.path.isdir(location):
+                lines = []
+                if os.path.isfile(shard):
+                    with open(shard, "rt", encoding="UTF-8") as f:
+                        lines = [json.loads(line) for line in f if line.strip()]
+            else:
+                lines = CraftCore.cache.cacheJsonLinesFromUrl(shard)
+            return CraftManifestEntry.fromJsonLines(package, lines)
+
+        manifestFile = CraftManifest._location(location, "manifest.json")
+        if os.path.isdir(location):
+            if not os.path.isfile(manifestFile):
+                return CraftManifestEntry(package)
+            with open(manifestFile, "rt", encoding="UTF-8") as f:
+                manifest = CraftManifest.fromJson(json.load(f))
+        else:
+            if manifestFile not in CraftManifest._remoteManifests:
+                CraftManifest._remoteManifests[manifestFile] = CraftManifest.fromJson(CraftCore.cache.cacheJsonFromUrl(manifestFile))
+            manifest = CraftManifest._remoteManifests[manifestFile]
+        return manifest.get(package, compiler)
+
+    @staticmethod
+    def writeEntry(directory : str, entry : CraftManifestEntry, compiler : str=None):
+        """ replaces the file of entry in the sharded manifest in directory """
+        if not compiler:
+            compiler = str(CraftCore.compiler)
+        shard = Path(CraftManifest._location(directory, CraftManifest._shardName(entry.name, compiler)))
+        shard.parent.mkdir(parents=True, exist_ok=True)
+        tmp = shard.with_name(f"{shard.name}.tmp")
+        with open(tmp, "wt", encoding="UTF-8") as f:
+            # oldest first, like the appended files
+            for entryFile in reversed(entry.files):
+                f.write(json.dumps(entryFile.toJson(), sort_keys=True) + "\n")
+        os.replace(tmp, shard)
+
+    @staticmethod
+    def migrate(directory : str):
+        """ converts the version 1 manifest in directory to the sharded format, the version 1 manifest is kept """
+        index = Path(CraftManifest._location(directory, "manifest/index.json"))
+        if index.is_file():
+            return
+        manifestFile = os.path.join(directory, "manifest.json")
+        if os.path.isfile(manifestFile):
+            CraftCore.log.info(f"Migrating {manifestFile} to the version {CraftManifest.shardedVersion()} manifest")
+            with open(manifestFile, "rt", encoding="UTF-8") as f:
+                manifest = CraftManifest.fromJson(json.load(f))
+            for compiler, packages in manifest.packages.items():
+                for entry in packages.values():
+                    if entry.files:
+                        CraftManifest.writeEntry(directory, entry, compiler)
+        index.parent.mkdir(parents=True, exist_ok=True)
+        with open(index, "wt", encoding="UTF-8") as f:
+            json.dump({"version": CraftManifest.shardedVersion(), "date": datetime.datetime.utcnow().strftime(CraftManifest._TIME_FORMAT)}, f)
+
+    @staticmethod
+    def addEntryFile(directory : str, package : str, entryFile : CraftManifestEntryFile, compiler : str=None, urls : [str]=None):
+        """
+        Appends entryFile to the sharded manifest in directory.
+        If the package isn't part of the manifest yet, the entries from the manifests at urls are copied first.
+        """
+        if not compiler:
+            compiler = str(CraftCore.compiler)
+        CraftManifest.migrate(directory)
+        shard = Path(CraftManifest._location(directory, CraftManifest._shardName(package, compiler)))
+        if not shard.is_file():
+            files = []
+            for url in CraftManifest._defaultUrls(urls):
+                files.extend(CraftManifest.getEntry(url, package, compiler).files)
+            if files:
+                entry = CraftManifestEntry(package)
+                entry.files = sorted(files, key=lambda x:x.date, reverse=True)
+                CraftManifest.writeEntry(directory, entry, compiler)
+        CraftCore.log.info(f"Adding {entryFile.fileName} to the cache manifest in: {directory}")
+        shard.parent.mkdir(parents=True, exist_ok=True)
+        with open(shard, "at", encoding="UTF-8") as f:
+            f.write(json.dumps(entryFile.toJson(), sort_keys=True) + "\n")
+
+    @staticmethod
+    def _defaultUrls(urls : [str]=None) -> [str]:
+        if not urls and ("ContinuousIntegration", "RepositoryUrl") in CraftCore.settings:
+            urls = [CraftCore.settings.get("ContinuousIntegration", "RepositoryUrl").rstrip("/")]
+        return urls or []
 
     @staticmethod
     def load(manifestFileName : str, urls : [str]=None):
@@ -156,8 +306,7 @@ class CraftManifest(object):
         TODO: in that case we are merging all repositories so we should also merge the cache files
         """
         old = None
-        if not urls and ("ContinuousIntegration", "RepositoryUrl") in CraftCore.settings:
-            urls = [CraftCore.settings.get("ContinuousIntegration", "RepositoryUrl").rstrip("/")]
+        urls = CraftManifest._defaultUrls(urls)
         if urls:
             old = CraftManifest()
             for url in urls:
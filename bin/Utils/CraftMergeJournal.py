@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+
+from CraftCore import CraftCore
+from CraftOS.osutils import OsUtils
+
+
+class CraftMergeJournal(object):
+    """
+    Swaps a staged image into the craft root.
+    Every step is recorded in the install database, so an interrupted merge can be
+    rolled back, or if the database was already updated, finished on the next run.
+
+    The states of a journal are:
+    staging:    the image is copied to the staging dir, the craft root is untouched
+    swapping:   the files are moved between the staging dir and the craft root
+    committed:  the database contains the new file list, only the cleanup is missing
+    """
+    _recovered = False
+
+    def __init__(self, journalId : int, stagingDir : str, files : [(str, bool, bool)]=None):
+        self.journalId = journalId
+        self.stagingDir = stagingDir
+        self.files = files or []
+
+    @property
+    def imageDir(self) -> str:
+        return os.path.join(self.stagingDir, "image")
+
+    @property
+    def backupDir(self) -> str:
+        return os.path.join(self.stagingDir, "backup")
+
+    @staticmethod
+    def stagingRoot() -> str:
+        # must be on the same file system as the craft root so we can rename the files
+        return os.path.join(CraftCore.standardDirs.craftRoot(), ".merge")
+
+    @staticmethod
+    def begin(package) -> "CraftMergeJournal":
+        CraftMergeJournal.recover()
+        os.makedirs(CraftMergeJournal.stagingRoot(), exist_ok=True)
+        stagingDir = tempfile.mkdtemp(prefix=f"{package.name}-", dir=CraftMergeJournal.stagingRoot())
+        return CraftMergeJournal(CraftCore.installdb.addMergeJournal(package, stagingDir), stagingDir)
+
+    def swap(self, stagedFiles : [str], removedFiles : [str]) -> bool:
+        """
+        Move the stagedFiles from the staging dir to the craft root,
+        the replaced files and the removedFiles are moved to the backup dir.
+        All paths are relative to the craft root.
+        """
+        root = CraftCore.standardDirs.craftRoot()
+        stagedFiles = set(stagedFiles)
+        for filename in stagedFiles | set(removedFiles):
+            target = os.path.join(root, filename)
+            backup = os.path.lexists(target)
+            if backup and os.path.isdir(target) and not os.path.islink(target):
+                CraftCore.log.error(f"Can't replace the directory {target} with a file")
+                self.rollback()
+                return False
+            self.files.append((filename, filename in stagedFiles, backup))
+        CraftCore.installdb.addMergeJournalFiles(self.journalId, self.files, "swapping")
+        try:
+            for filename, _, backup in self.files:
+                if backup:
+                    dest = os.path.join(self.backupDir, filename)
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    os.replace(os.path.join(root, filename), dest)
+            for filename, staged, _ in self.files:
+                if staged:
+                    dest = os.path.join(root, filename)
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    os.replace(os.path.join(self.imageDir, filename), dest)
+        except Exception as e:
+            CraftCore.log.error(f"Failed to merge {self.stagingDir}", exc_info=e)
+            self.rollback()
+            return False
+        return True
+
+    def commit(self):
+        """ commits the pending changes of the install database together with the journal and cleans up """
+        CraftCore.installdb.setMergeJournalState(self.journalId, "committed")
+        self._finish()
+
+    def rollback(self):
+        """ restores the craft root and drops the pending changes of the install database """
+        CraftCore.log.debug(f"Rolling back the merge of {self.stagingDir}")
+        CraftCore.installdb.connection.rollback()
+        root = CraftCore.standardDirs.craftRoot()
+        for filename, staged, _ in self.files:
+            target = os.path.join(root, filename)
+            # the file was moved in if it's no longer in the staging dir
+            if staged and not os.path.lexists(os.path.join(self.imageDir, filename)) and os.path.lexists(target):
+                OsUtils.rm(target, True)
+        for filename, _, backup in self.files:
+            source = os.path.join(self.backupDir, filename)
+            if backup and os.path.lexists(source):
+                target = os.path.join(root, filename)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(source, target)
+        self._close()
+
+    def _finish(self):
+        root = CraftCore.standardDirs.craftRoot()
+        CraftCore.installdb.removeDigests([os.path.join(self.backupDir, filename) for filename, staged, backup in self.files
+                                           if backup and os.path.lexists(os.path.join(self.backupDir, filename))])
+        for filename, staged, _ in self.files:
+            if not staged:
+                containingDir = os.path.dirname(os.path.join(root, filename))
+                if os.path.isdir(containingDir) and not os.listdir(containingDir):
+                    CraftCore.log.debug(f"Delete empty dir {containingDir}")
+                    os.rmdir(containingDir)
+        self._close()
+
+    def _close(self):
+        shutil.rmtree(self.stagingDir, ignore_errors=True)
+        stagingRoot = CraftMergeJournal.stagingRoot()
+        if os.path.isdir(stagingRoot) and not os.listdir(stagingRoot):
+            os.rmdir(stagingRoot)
+        CraftCore.installdb.removeMergeJournal(self.journalId)
+
+    @staticmethod
+    def recover():
+        """ finish or roll back the merges that were interrupted, only done once per process """
+        if CraftMergeJournal._recovered:
+            return
+        CraftMergeJournal._recovered = True
+        for journalId, packagePath, stagingDir, state in CraftCore.installdb.getMergeJournals():
+            journal = CraftMergeJournal(journalId, stagingDir, CraftCore.installdb.getMergeJournalFiles(journalId))
+            if state == "committed":
+                CraftCore.log.info(f"Finishing the interrupted merge of {packagePath}")
+                journal._finish()
+            else:
+                CraftCore.log.warning(f"Rolling back the interrupted merge of {packagePath}")
+                journal.rollback()
@@ -0,0 +1,161 @@
+import concurrent.futures
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from CraftCore import CraftCore
+from Utils import GetFiles
+
+
+class CraftMirrors(object):
+    """
+    Orders mirrors by the latency and throughput of their hosts.
+    The measurements are stored in the CraftCache, hosts we know nothing about are probed.
+    With [General]MirrorRace the first bytes of a file are requested from the two best mirrors
+    and the file is downloaded from the one that answered first.
+    """
+    ProbeTimeout = 5
+    RaceBytes = 64 * 1024
+    # the size used to weight the throughput against the latency
+    ReferenceSize = 16 * 1024 * 1024
+    # smaller downloads say more about the latency than about the throughput
+    MinThroughputSize = 1024 * 1024
+
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _host(url : str) -> str:
+        """ returns the host of a remote url, None for local paths """
+        parsedUrl = urllib.parse.urlparse(url)
+        if parsedUrl.scheme not in {"http", "https"}:
+            return None
+        return f"{parsedUrl.scheme}://{parsedUrl.netloc}"
+
+    @staticmethod
+    def _stats(host : str) -> dict:
+        return CraftCore.cache.mirrorStats.setdefault(host, {"latency": None, "throughput": None, "failures": 0})
+
+    @staticmethod
+    def _average(old : float, new : float) -> float:
+        return new if old is None else (old + new) / 2
+
+    @staticmethod
+    def record(url : str, latency : float=None, size : int=None, seconds : float=None, failed : bool=False):
+        """ record a request to url """
+        host = CraftMirrors._host(url)
+        if not host:
+            return
+        with CraftMirrors._lock:
+            stats = CraftMirrors._stats(host)
+            if failed:
+                stats["failures"] += 1
+                return
+            stats["failures"] = 0
+            if latency is not None:
+                stats["latency"] = CraftMirrors._average(stats["latency"], latency)
+            if size and seconds and size >= CraftMirrors.MinThroughputSize:
+                stats["throughput"] = CraftMirrors._average(stats["throughput"], size / seconds)
+
+    @staticmethod
+    def probe(url : str) -> bool:
+        """ measure the latency of the host of url """
+        start = time.perf_counter()
+        try:
+            request = urllib.request.Request(url, method="HEAD", headers={"User-Agent": "Craft"})
+            with urllib.request.urlopen(request, timeout=CraftMirrors.ProbeTimeout):
+                pass
+        except urllib.error.HTTPError:
+            # the host is reachable
+            pass
+        except Exception as e:
+            CraftCore.log.debug(f"Failed to probe {url}: {e}")
+            CraftMirrors.record(url, failed=True)
+            return False
+        CraftMirrors.record(url, latency=time.perf_counter() - start)
+        return True
+
+    @staticmethod
+    def _score(url : str) -> (bool, float):
+        host = CraftMirrors._host(url)
+        if not host:
+            # local files are always preferred
+            return False, -1
+        stats = CraftMirrors._stats(host)
+        score = stats["latency"] or 0
+        if stats["throughput"]:
+            score += CraftMirrors.ReferenceSize / stats["throughput"]
+        return stats["failures"] > 0, score
+
+    @staticmethod
+    def sort(urls : [str]) -> [str]:
+        """ returns urls ordered from the fastest to the slowest mirror, unreachable mirrors are moved to the end """
+        urls = list(urls)
+        if len(urls) < 2 or not CraftCore.settings.getboolean("General", "MirrorSelection", False) or CraftCore.settings.getboolean("General", "WorkOffline", False):
+            return urls
+        with CraftMirrors._lock:
+            unknown = {}
+            for url in urls:
+                host = CraftMirrors._host(url)
+                if host and host not in CraftCore.cache.mirrorStats:
+                    unknown.setdefault(host, url)
+        if unknown:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(unknown)) as executor:
+                list(executor.map(CraftMirrors.probe, unknown.values()))
+        with CraftMirrors._lock:
+            out = sorted(urls, key=CraftMirrors._score)
+        if out != urls:
+            CraftCore.log.debug(f"Mirror order: {out}")
+        return out
+
+    @staticmethod
+    def _firstBytes(url : str) -> bool:
+        start = time.perf_counter()
+        try:
+            request = urllib.request.Request(url, headers={"User-Agent": "Craft", "Range": f"bytes=0-{CraftMirrors.RaceBytes - 1}"})
+            with urllib.request.urlopen(request, timeout=CraftMirrors.ProbeTimeout) as response:
+                response.read(CraftMirrors.RaceBytes)
+        except Exception as e:
+            CraftCore.log.debug(f"Failed to request {url}: {e}")
+            CraftMirrors.record(url, failed=True)
+            return False
+        CraftMirrors.record(url, latency=time.perf_counter() - start)
+        return True
+
+    @staticmethod
+    def race(urls : [str]) -> str:
+        """ returns the url that delivered the first bytes first, or None if all failed """
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(urls))
+        try:
+            futures = {executor.submit(CraftMirrors._firstBytes, url): url for url in urls}
+            for future in concurrent.futures.as_completed(futures):
+                if future.result():
+                    return futures[future]
+        finally:
+            # the slower requests finish in the background and still update the statistics
+            executor.shutdown(wait=False)
+        return None
+
+    @staticmethod
+    def getFile(urls : [str], destdir : str, filename : str, fetch=GetFiles.getFile) -> bool:
+        """ download filename from the best of the mirrors urls, the others are used as fallback """
+        urls = CraftMirrors.sort(urls)
+        if (len(urls) > 1 and CraftCore.settings.getboolean("General", "MirrorRace", False)
+                and all(CraftMirrors._host(url) for url in urls[:2])):
+            winner = CraftMirrors.race(urls[:2])
+            if winner and winner != urls[0]:
+                urls.remove(winner)
+                urls.insert(0, winner)
+        path = os.path.join(destdir, filename)
+        measure = not os.path.exists(path)
+        for url in urls:
+            start = time.perf_counter()
+            if fetch(url, destdir, filename):
+                if measure and os.path.isfile(path):
+                    CraftMirrors.record(url, size=os.path.getsize(path), seconds=time.perf_counter() - start)
+                return True
+            CraftMirrors.record(url, failed=True)
+            CraftCore.log.debug(f"Failed to download {url}, trying the next mirror")
+        return False
@@ -0,0 +1,143 @@
+import concurrent.futures
+import hashlib
+import json
+import lzma
+import os
+import shutil
+import stat
+import tempfile
+
+from CraftCore import CraftCore
+from CraftOS.osutils import OsUtils
+from Utils import CraftHash, GetFiles
+from Utils.CraftCopyEngine import CraftCopyEngine
+
+
+class CraftObjectStore(object):
+    """
+    A content addressed store for the files of the chunked binary caches.
+    Every file is stored once, xz compressed, as objects/<first two digits of the digest>/<digest>.
+    A package is described by an index listing its files with their digests, so successive builds
+    of a package share the files that didn't change and a restore only downloads the missing objects.
+    """
+    IndexVersion = 1
+
+    def __init__(self, root : str):
+        self.root = root
+
+    def objectPath(self, digest : str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    @staticmethod
+    def objectUrl(url : str, digest : str) -> str:
+        return f"{url}/{digest[:2]}/{digest}"
+
+    def _addObject(self, path : str, digest : str, level : int, mode : int) -> bool:
+        dest = self.objectPath(digest)
+        if os.path.exists(dest):
+            return False
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest))
+        with os.fdopen(fd, "wb") as out, open(path, "rb") as src, lzma.open(out, "wb", preset=level) as compressed:
+            shutil.copyfileobj(src, compressed, 1024 * 1024)
+        # mkstemp creates the file only readable by us, the store is published
+        os.chmod(tmp, mode)
+        os.replace(tmp, dest)
+        return True
+
+    def createIndex(self, sourceDir : str, indexFile : str, jobs : int=None, level : int=None) -> bool:
+        """ add the files of sourceDir to the store and write the index describing sourceDir to indexFile """
+        if not jobs:
+            jobs = int(CraftCore.settings.get("Packager", "CompressionJobs", str(os.cpu_count() or 1)))
+        if level is None:
+            level = int(CraftCore.settings.get("Packager", "CompressionLevel", "") or 6)
+        dirs, files = CraftCopyEngine.listTree(sourceDir)
+        links = [f for f in files if os.path.islink(f)]
+        files = [f for f in files if not os.path.islink(f)]
+        digests = CraftHash.digestFiles(files, CraftHash.HashAlgorithm.SHA256, jobs=jobs)
+
+        def relPath(path):
+            return os.path.relpath(path, sourceDir).replace(os.sep, "/")
+
+        index = {"version": CraftObjectStore.IndexVersion,
+                 "codec": "xz",
+                 "dirs": [relPath(d) for d in dirs],
+                 "files": [],
+                 "links": [[relPath(f), os.readlink(f)] for f in links]}
+        for f in files:
+            st = os.stat(f)
+            index["files"].append([relPath(f), digests[f], stat.S_IMODE(st.st_mode), st.st_mtime])
+        # the mode of a file created with open, the umask can only be read by setting it
+        umask = os.umask(0o022)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+                added = sum(executor.map(lambda f: self._addObject(f, digests[f], level, mode), files))
+        except Exception as e:
+            CraftCore.log.error(f"Failed to add {sourceDir} to {self.root}", exc_info=e)
+            return False
+        CraftCore.log.info(f"Added {added} of {len(files)} files to {self.root}")
+        os.makedirs(os.path.dirname(indexFile), exist_ok=True)
+        with open(indexFile, "wt", encoding="UTF-8") as f:
+            json.dump(index, f, sort_keys=True)
+        return True
+
+    def _fetchObject(self, digest : str, url : str) -> bool:
+        if os.path.exists(self.objectPath(digest)):
+            return True
+        if not url:
+            CraftCore.log.error(f"The object {digest} is missing in {self.root}")
+            return False
+        for _ in range(3):
+            if GetFiles.prefetchFile(CraftObjectStore.objectUrl(url, digest), os.path.dirname(self.objectPath(digest)), digest):
+                return True
+        CraftCore.log.error(f"Failed to fetch {CraftObjectStore.objectUrl(url, digest)}")
+        return False
+
+    def _extractObject(self, digest : str, dest : str, mode : int, mtime : float) -> bool:
+        hash = hashlib.sha256()
+        with lzma.open(self.objectPath(digest), "rb") as src, open(dest, "wb") as out:
+            for block in iter(lambda: src.read(1024 * 1024), b""):
+                hash.update(block)
+                out.write(block)
+        if hash.hexdigest() != digest:
+            CraftCore.log.error(f"The object {digest} is corrupted, removing it")
+            OsUtils.rm(self.objectPath(digest), True)
+            return False
+        os.chmod(dest, mode)
+        os.utime(dest, (mtime, mtime))
+        return True
+
+    def restore(self, indexFile : str, destDir : str, url : str=None, jobs : int=None) -> bool:
+        """ recreate the directory described by indexFile in destDir, missing objects are downloaded from url """
+        with open(indexFile, "rt", encoding="UTF-8") as f:
+            index = json.load(f)
+        if index.get("version") != CraftObjectStore.IndexVersion:
+            CraftCore.log.error(f"Unsupported index version {index.get('version')} in {indexFile}")
+            return False
+        if not jobs:
+            jobs = int(CraftCore.settings.get("General", "DownloadConnections", "4"))
+
+        missing = {digest for _, digest, _, _ in index["files"] if not os.path.exists(self.objectPath(digest))}
+        CraftCore.log.info(f"Restoring {len(index['files'])} files, {len(missing)} objects need to be downloaded")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            if not all(executor.map(lambda digest: self._fetchObject(digest, url), missing)):
+                return False
+
+        for d in index["dirs"]:
+            os.makedirs(os.path.join(destDir, d), exist_ok=True)
+        for name, _, _, _ in index["files"]:
+            os.makedirs(os.path.dirname(os.path.join(destDir, name)), exist_ok=True)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+                if not all(executor.map(lambda f: self._extractObject(f[1], os.path.join(destDir, f[0]), f[2], f[3]), index["files"])):
+                    return False
+            for name, target in index["links"]:
+                link = os.path.join(destDir, name)
+                os.makedirs(os.path.dirname(link), exist_ok=True)
+                os.symlink(target, link)
+        except Exception as e:
+            CraftCore.log.error(f"Failed to restore {indexFile}", exc_info=e)
+            return False
+        return True
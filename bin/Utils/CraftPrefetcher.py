@@ -0,0 +1,61 @@
+import concurrent.futures
+
+from CraftCore import CraftCore
+
+
+class CraftPrefetcher(object):
+    """Downloads the sources or binary caches of the upcoming packages while the current one is build"""
+
+    def __init__(self, packages, lookahead : int=None, jobs : int=None):
+        self.packages = list(packages)
+        self.lookahead = lookahead if lookahead is not None else int(CraftCore.settings.get("General", "PrefetchPackages", "0"))
+        jobs = jobs if jobs is not None else int(CraftCore.settings.get("General", "PrefetchJobs", "2"))
+        self._futures = {}
+        self._executor = None
+        if self.lookahead > 0 and jobs > 0:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="CraftPrefetcher")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    @staticmethod
+    def _prefetch(package, instance) -> bool:
+        try:
+            if not instance.prefetch():
+                CraftCore.log.debug(f"Failed to prefetch {package}")
+                return False
+        except Exception as e:
+            CraftCore.log.debug(f"Failed to prefetch {package}: {e}", exc_info=e)
+            return False
+        return True
+
+    def _schedule(self, package):
+        if package in self._futures or package.isIgnored():
+            return
+        # the blueprint must be initialised in the main thread
+        instance = package.instance
+        CraftCore.log.debug(f"Prefetching {package}")
+        self._futures[package] = self._executor.submit(CraftPrefetcher._prefetch, package, instance)
+
+    def advance(self, package):
+        """Prefetch the packages following package and wait for a prefetch of package that is still in progress"""
+        if not self._executor or package not in self.packages:
+            return
+        index = self.packages.index(package)
+        for p in self.packages[index + 1: index + 1 + self.lookahead]:
+            self._schedule(p)
+        future = self._futures.pop(package, None)
+        if future and not future.done():
+            CraftCore.log.info(f"Waiting for the prefetch of {package}")
+            concurrent.futures.wait([future])
+
+    def shutdown(self):
+        if self._executor:
+            for future in self._futures.values():
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._futures = {}
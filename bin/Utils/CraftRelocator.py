@@ -0,0 +1,87 @@
+import concurrent.futures
+import mmap
+import os
+import re
+from pathlib import Path
+
+import utils
+from CraftCore import CraftCore
+
+
+class CraftRelocator(object):
+    """
+    Replaces the prefixes a package was built with in its files.
+    All prefixes are matched by one expression, the separators of a match are kept in the replacement.
+    """
+    # larger files are mapped instead of being read
+    MmapThreshold = 16 * 1024 * 1024
+    _Separator = re.compile(rb"[/\\]+")
+
+    def __init__(self, oldPaths : [str], newPath : str):
+        oldPaths = sorted({Path(x).as_posix() for x in oldPaths}, key=len, reverse=True)
+        for oldPath in oldPaths:
+            assert os.path.isabs(oldPath)
+        # allow front and back slashes, the parts are escaped separately as python 3.6 escapes / too
+        self._pattern = re.compile(b"|".join(rb"[/\\]+".join(re.escape(part.encode()) for part in x.split("/")) for x in oldPaths))
+        # a file without the longest part of any of the prefixes can't contain a match
+        self._needles = {max(re.split(r"/+", x), key=len).encode() for x in oldPaths}
+        self._newPath = Path(newPath).as_posix().encode()
+
+    def _replace(self, match) -> bytes:
+        separator = CraftRelocator._Separator.search(match.group(0))
+        return self._newPath.replace(b"/", separator.group(0) if separator else b"/")
+
+    def _relocate(self, content, fileName : str) -> bytes:
+        """ returns the relocated content or None if it is unchanged """
+        if not any(content.find(needle) != -1 for needle in self._needles):
+            return None
+        replacements = {}
+
+        def replace(match):
+            new = self._replace(match)
+            replacements[match.group(0)] = new
+            return new
+
+        content = self._pattern.sub(replace, content)
+        changed = False
+        for old, new in replacements.items():
+            if old != new:
+                changed = True
+                CraftCore.log.info(f"Patching {fileName}: replacing {old} with {new}")
+            else:
+                CraftCore.log.debug(f"Skip Patching {fileName}:  prefix is unchanged {new}")
+        return content if changed else None
+
+    def relocateFile(self, fileName : str) -> bool:
+        """ returns whether the file was changed """
+        size = os.path.getsize(fileName)
+        if not size:
+            return False
+        with open(fileName, "rb") as f:
+            if size >= CraftRelocator.MmapThreshold:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                    content = self._relocate(content, fileName)
+            else:
+                content = self._relocate(f.read(), fileName)
+        if content is None:
+            return False
+        with utils.makeTemporaryWritable(fileName):
+            with open(fileName, "wb") as f:
+                f.write(content)
+        return True
+
+    def relocate(self, files : [str], jobs : int=None) -> bool:
+        files = list(files)
+        for fileName in files:
+            if not os.path.exists(fileName):
+                CraftCore.log.warning(f"File {fileName} not found.")
+                return False
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+                patched = [f for f, changed in zip(files, executor.map(self.relocateFile, files)) if changed]
+        except Exception as e:
+            CraftCore.log.error("Failed to relocate the files", exc_info=e)
+            return False
+        if patched:
+            CraftCore.log.info(f"Relocated {len(patched)} of {len(files)} files, {sum(os.path.getsize(f) for f in patched)} bytes patched")
+        return True
@@ -0,0 +1,105 @@
+import hashlib
+import os
+import queue
+import shutil
+import tarfile
+import tempfile
+import threading
+
+import utils
+from CraftCore import CraftCore
+from CraftOS.osutils import OsUtils
+from Utils import CraftHash, GetFiles
+from Utils.CraftArchive import CraftArchive
+from Utils.CraftDownloader import CraftDownloader
+
+
+class CraftStreamUnpacker(object):
+    """
+    Extracts a tar archive while it is downloaded and computes its digest on the way.
+    The blocks are passed to the extraction thread through a bounded queue,
+    so a slow extraction throttles the download instead of buffering the archive in memory.
+    """
+    def __init__(self, destdir : str, algorithm : CraftHash.HashAlgorithm=CraftHash.HashAlgorithm.SHA256):
+        self.destdir = destdir
+        self.algorithm = algorithm
+        self._hash = getattr(hashlib, algorithm.name.lower())()
+        self._queue = queue.Queue(maxsize=64)
+        self._buffer = b""
+        self._offset = 0
+        self._eof = False
+        self._error = None
+        self._thread = threading.Thread(target=self._extract, name="CraftStreamUnpacker", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def canStream(url : str, filename : str) -> bool:
+        return (CraftCore.settings.getboolean("General", "StreamUnpack", False)
+                and GetFiles.useNativeDownloader(url)
+                and CraftArchive.isTarArchive(filename)
+                and (not OsUtils.isWin() or OsUtils.supportsSymlinks()))
+
+    def read(self, size : int=-1) -> bytes:
+        """ called by tarfile from the extraction thread """
+        out = []
+        while size != 0:
+            if self._offset >= len(self._buffer):
+                block = None if self._eof else self._queue.get()
+                if block is None:
+                    self._eof = True
+                    break
+                self._buffer, self._offset = block, 0
+            end = len(self._buffer) if size < 0 else self._offset + size
+            piece = self._buffer[self._offset:end]
+            self._offset += len(piece)
+            if size > 0:
+                size -= len(piece)
+            out.append(piece)
+        return b"".join(out)
+
+    def _extract(self):
+        try:
+            with tarfile.open(fileobj=self, mode="r|*") as tar:
+                CraftArchive.extractTar(tar, self.destdir)
+        except Exception as e:
+            self._error = e
+        finally:
+            # consume the rest, so the download isn't blocked
+            while not self._eof:
+                self._eof = self._queue.get() is None
+
+    def write(self, block : bytes):
+        self._hash.update(block)
+        self._queue.put(block)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+    def close(self) -> bool:
+        """ waits for the extraction to finish """
+        self._queue.put(None)
+        self._thread.join()
+        if self._error:
+            CraftCore.log.error(f"Failed to extract the stream to {self.destdir}: {self._error}")
+            return False
+        return True
+
+    @staticmethod
+    def getFile(url : str, destdir : str, filename : str, workdir : str, algorithm : CraftHash.HashAlgorithm=CraftHash.HashAlgorithm.SHA256) -> bool:
+        """ download url to destdir/filename and extract it into workdir at the same time
+        the digest of the archive is remembered, so checking it doesn't read the archive again """
+        utils.createDir(workdir)
+        # extract to a temporary dir, so a failed download doesn't leave half of the files in workdir
+        tmpdir = tempfile.mkdtemp(prefix=".stream-", dir=workdir)
+        try:
+            unpacker = CraftStreamUnpacker(tmpdir, algorithm)
+            CraftCore.log.info(f"Downloading and unpacking {url}")
+            downloaded = CraftDownloader.instance().download(url, destdir, filename, sinks=[unpacker.write])
+            if not unpacker.close() or not downloaded:
+                return False
+            CraftHash.addKnownDigest(os.path.join(destdir, filename), algorithm, unpacker.hexdigest())
+            if OsUtils.isWin() and not utils.replaceSymlinksWithCopies(tmpdir):
+                return False
+            return utils.mergeTree(tmpdir, workdir)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
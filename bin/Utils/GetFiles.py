@@ -27,15 +27,25 @@
 
 from CraftCore import CraftCore
 from CraftDebug import deprecated
+from Utils.CraftDownloader import CraftDownloader
 import utils
 
 import io
 import os
 import urllib
+import urllib.request
 import subprocess
 import sys
 import re
 
+def useNativeDownloader(url) -> bool:
+    """ whether url is downloaded with the CraftDownloader """
+    # the native downloader doesn't support proxies, leave them to wget and curl
+    return (urllib.parse.urlparse(url).scheme in {"http", "https"}
+            and CraftCore.settings.getboolean("General", "NativeDownloader", False)
+            and not urllib.request.getproxies())
+
+
 def getFile(url, destdir, filename='', quiet=None) -> bool:
     """download file from 'url' into 'destdir'"""
     if quiet is None:
@@ -56,6 +66,9 @@ def getFile(url, destdir, filename='', quiet=None) -> bool:
     elif pUrl.scheme == "minio":
         return minioGet(pUrl.netloc + pUrl.path, destdir, filename)
 
+    if useNativeDownloader(url):
+        return CraftDownloader.instance().download(url, destdir, filename, quiet)
+
     # curl and wget basically only work when we have a cert store on windows
     if not CraftCore.compiler.isWindows or os.path.exists(os.path.join(CraftCore.standardDirs.etcDir(), "cacert.pem")):
         if not CraftCore.settings.getboolean("General", "NoWget"):
@@ -95,6 +108,23 @@ def getFile(url, destdir, filename='', quiet=None) -> bool:
     return True
 
 
+def prefetchFile(url, destdir, filename='') -> bool:
+    """download file from 'url' into 'destdir' without any output, used to download files in the background
+    the file is only moved to its final location once the download succeeded"""
+    if not filename:
+        filename = os.path.basename(urllib.parse.urlparse(url).path)
+    dest = os.path.join(destdir, filename)
+    if os.path.exists(dest):
+        return True
+    utils.createDir(os.path.dirname(dest))
+    tmpName = f"{filename}.prefetch"
+    if not getFile(url, destdir, tmpName, quiet=True):
+        utils.deleteFile(os.path.join(destdir, tmpName))
+        return False
+    os.replace(os.path.join(destdir, tmpName), dest)
+    return True
+
+
 def curlFile(url, destdir, filename, quiet):
     """download file with curl from 'url' into 'destdir', if filename is given to the file specified"""
     curl = CraftCore.cache.findApplication("curl")
@@ -54,19 +54,43 @@ class VersionInfo(object):
         self._data = None
         self.__include = None
 
+    @staticmethod
+    def _findVersionIni(package) -> str:
+        """ returns the version.ini next to the blueprint or in one of its parent directories """
+        filePath = OsUtils.toUnixPath(package.filePath)
+        while True:
+            if filePath in CraftPackageObject.rootDirectories():
+                return None
+            ini = OsUtils.toUnixPath(os.path.join(filePath, "version.ini"))
+            if os.path.exists(ini):
+                return ini
+            parent = os.path.dirname(filePath)
+            if parent == filePath:
+                return None
+            filePath = parent
+
+    @staticmethod
+    def versionIniFiles(package) -> [str]:
+        """ returns the version.ini used by package followed by the files it includes """
+        out = []
+        fileName = VersionInfo._findVersionIni(package)
+        while fileName and fileName not in out and os.path.exists(fileName):
+            out.append(fileName)
+            config = configparser.ConfigParser()
+            config.read(fileName)
+            if "General" not in config or "include" not in config["General"]:
+                break
+            includePath = config["General"]["include"]
+            if not os.path.isabs(includePath):
+                includePath = os.path.join(os.path.dirname(fileName), includePath)
+            fileName = OsUtils.toUnixPath(includePath)
+        return out
+
     @property
     def data(self):
         if not self._data:
             if not self._fileName:
-                filePath = OsUtils.toUnixPath(self.package.filePath)
-                while True:
-                    if filePath in CraftPackageObject.rootDirectories():
-                        break
-                    ini = OsUtils.toUnixPath(os.path.join(filePath, "version.ini"))
-                    if os.path.exists(ini):
-                        self._fileName = ini
-                        break
-                    filePath = os.path.dirname(filePath)
+                self._fileName = VersionInfo._findVersionIni(self.package)
             if not self._fileName:
                 self._data = VersionInfo.VersionInfoData()
             else:
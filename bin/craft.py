@@ -124,6 +124,9 @@ def main(timer):
                         default=int(CraftCore.settings.get("CraftDebug", "Verbose", "0")),
                         help=" verbose: increases the verbose level of craft. Default is 1. verbose level 1 contains some notes from craft, all output of cmake, make and other programs that are used.\
                           verbose level 2a dds an option VERBOSE=1 to make and craft is more verbose highest level is verbose level 3.")
+    parser.add_argument("--jobs", action="store", type=int,
+                        default=int(CraftCore.settings.get("Compile", "PackageJobs", "1")),
+                        help="The number of packages that are built in parallel. A package is built as soon as all of its dependencies are installed.")
     parser.add_argument("-i", "--ignoreInstalled", action="store_true",
                         help="ignore install: using this option will install a package over an existing install. This can be useful if you want to check some new code and your last build isn't that old.")
     parser.add_argument("--resolve-deps", action="store", help="Similar to -i, all dependencies will be resolved and the action is applied on them")
@@ -142,6 +145,7 @@ def main(timer):
 
     actionHandler = ActionHandler(parser)
     for x in sorted(["fetch", "fetch-binary", "unpack", "configure", ("compile",{"help":"Same as --configure --make"}), "make",
+                     ("cleanimage", {"help":argparse.SUPPRESS}),
                      "install", "install-deps", "qmerge", "post-qmerge", "post-install", "package", "unmerge", "test", "createpatch",
                      ("install-to-desktop", {"help":argparse.SUPPRESS}),
                      ("create-download-cache", {"help":argparse.SUPPRESS}),
@@ -256,15 +256,11 @@ class infoclass(object):
         for key, url in list(self.targets.items()):
             if url.endswith("/"):
                 url = url[:-1]
-            json = CraftCore.cache.cacheJsonFromUrl(f"{url}/manifest.json")
-            if not json:
-                raise BlueprintException("Failed to load manifest", package)
-            manifest = CraftManifest.CraftManifest.fromJson(json)
-            if packageName not in manifest.packages[f"windows-mingw_{CraftCore.compiler.bits}-gcc"]:
+            data = CraftManifest.CraftManifest.getEntry(url, packageName, compiler=f"windows-mingw_{CraftCore.compiler.bits}-gcc").latest
+            if not data:
                 del self.targets[key]
                 CraftCore.log.warning(f"Failed to find {packageName} on {url}")
                 continue
-            data = manifest.packages[f"windows-mingw_{CraftCore.compiler.bits}-gcc"][packageName].latest
             self.targets[key] = f"{url}/{data.fileName}"
             self.targetDigests[key] = ([data.checksum], CraftHash.HashAlgorithm.SHA256)
             if targetInstallPath:
@@ -284,8 +280,7 @@ class infoclass(object):
 
         if url.endswith("/"):
                 url = url[:-1]
-        manifest = CraftManifest.CraftManifest.fromJson(CraftCore.cache.cacheJsonFromUrl(f"{url}/manifest.json"))
-        latest = manifest.packages[f"windows-mingw_{CraftCore.compiler.bits}-gcc"][packagePath].latest
+        latest = CraftManifest.CraftManifest.getEntry(url, packagePath, compiler=f"windows-mingw_{CraftCore.compiler.bits}-gcc").latest
         self.targets[latest.version] = f"{url}/{latest.fileName}"
         self.targetDigests[latest.version] = ([latest.checksum], CraftHash.HashAlgorithm.SHA256)
         self.defaultTarget = latest.version
@@ -148,6 +148,19 @@ class UserOptions(object):
             out.append((key, atr))
         return ", ".join([f"{x}={y}" for x, y in sorted(out)])
 
+    def settingsSignature(self) -> str:
+        """returns a string representing all settings that apply to the package, including the inherited ones"""
+        _instance = UserOptions.instance()
+        out = []
+        parts = self._package.path.split("/")
+        for i in range(1, len(parts) + 1):
+            path = "/".join(parts[:i])
+            if _instance.settings.has_section(path):
+                out.append(f"[{path}]{sorted(_instance.settings.items(path, raw=True))}")
+            if path in _instance.packageOptions:
+                out.append(f"{path}: {sorted(_instance.packageOptions[path].items())}")
+        return "\n".join(out)
+
     def configHash(self):
         tmp = []
         for key, option in sorted(UserOptions.instance().registeredOptions[self._package.path].items()):
@@ -1,12 +1,21 @@
+import http.server
 import os
+import socketserver
 import tempfile
+import threading
 import unittest
+import urllib.parse
 
 import CraftConfig
 import CraftStandardDirs
 from CraftCore import CraftCore
 import InstallDB
 
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    # http.server.ThreadingHTTPServer needs python 3.7
+    daemon_threads = True
+
+
 class CraftTestBase(unittest.TestCase):
     def setUp(self):
         CraftCore.debug.setVerbose(int(os.getenv("CRAFT_TEST_VERBOSITY")))
@@ -29,3 +38,23 @@ class CraftTestBase(unittest.TestCase):
         CraftCore.installdb.connection.close()
         del CraftCore.installdb
         del self.kdeRoot
+
+    def startHttpServer(self, handler=http.server.SimpleHTTPRequestHandler, directory : str=None) -> str:
+        """ runs a local http server until the test is finished and returns its url
+            if directory is set the SimpleHTTPRequestHandler serves its content instead of the working dir """
+        if directory:
+            class Handler(handler):
+                def translate_path(self, path):
+                    # the directory argument of the handler needs python 3.7
+                    parts = urllib.parse.unquote(urllib.parse.urlsplit(path).path).split("/")
+                    return os.path.join(directory, *[x for x in parts if x and x not in {".", ".."}])
+        else:
+            Handler = handler
+        server = _ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+        self.addCleanup(stop)
+        return f"http://127.0.0.1:{server.server_port}"
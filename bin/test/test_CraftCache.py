@@ -0,0 +1,22 @@
+import os
+from unittest import mock
+
+import CraftTestBase
+from CraftCore import CraftCore
+from Utils.CraftCache import CraftCache
+
+
+class CraftCacheTest(CraftTestBase.CraftTestBase):
+    def test_save(self):
+        self.addCleanup(setattr, CraftCore, "cache", CraftCore.cache)
+        CraftCore.cache = CraftCache()
+        CraftCore.cache.mirrorStats = {"http://mirror": {"failures": 1}}
+        CraftCache._save()
+        self.assertEqual(CraftCache._loadInstance().mirrorStats, {"http://mirror": {"failures": 1}})
+
+        # a failed save keeps the previous cache and doesn't leave a temporary file behind
+        CraftCore.cache.mirrorStats = {}
+        with mock.patch("os.replace", side_effect=OSError("disk full")):
+            CraftCache._save()
+        self.assertEqual(CraftCache._loadInstance().mirrorStats, {"http://mirror": {"failures": 1}})
+        self.assertEqual([x for x in os.listdir(os.path.dirname(CraftCache._cacheFile())) if x.startswith("cache.pickle")], ["cache.pickle"])
@@ -0,0 +1,137 @@
+import hashlib
+import http.server
+import io
+import os
+import re
+import tarfile
+
+import CraftTestBase
+from Utils import CraftHash
+from Utils.CraftDownloader import CraftDownloader
+from Utils.CraftStreamUnpacker import CraftStreamUnpacker
+
+
+class CraftDownloaderTest(CraftTestBase.CraftTestBase):
+    def setUp(self):
+        super().setUp()
+        self.files = {}
+        self.requests = []
+        self.connections = set()
+        test = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                test.connections.add(self.client_address)
+                test.requests.append((self.path, self.headers.get("Range")))
+                if self.path == "/redirect":
+                    self.send_response(302)
+                    self.send_header("Location", "/data")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                data = test.files.get(self.path)
+                if data is None:
+                    self.send_error(404)
+                    return
+                match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+                if match:
+                    start = int(match.group(1))
+                    end = int(match.group(2)) if match.group(2) else len(data) - 1
+                    if start >= len(data):
+                        self.send_response(416)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+                    data = data[start:end + 1]
+                else:
+                    self.send_response(200)
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.url = self.startHttpServer(Handler)
+        self.downloader = CraftDownloader(connections=4)
+        self.destDir = self.kdeRoot.name
+
+    def tearDown(self):
+        self.downloader.close()
+        super().tearDown()
+
+    def _read(self, name):
+        with open(os.path.join(self.destDir, name), "rb") as f:
+            return f.read()
+
+    def test_download(self):
+        self.files["/data"] = os.urandom(3 * 1024 * 1024 + 17)
+        self.files["/data.sha256"] = hashlib.sha256(self.files["/data"]).hexdigest().encode()
+        self.assertEqual(self.downloader.download(f"{self.url}/redirect", self.destDir, "data", quiet=True), True)
+        self.assertEqual(self.downloader.download(f"{self.url}/data.sha256", self.destDir, "data.sha256", quiet=True), True)
+        self.assertEqual(self._read("data"), self.files["/data"])
+        self.assertEqual(self._read("data.sha256"), self.files["/data.sha256"])
+        # all requests used the same connection
+        self.assertEqual(len(self.connections), 1)
+        # the digest was computed during the download
+        self.assertEqual(CraftHash._knownDigest(os.path.join(self.destDir, "data"), CraftHash.HashAlgorithm.SHA256),
+                         self.files["/data.sha256"].decode())
+        self.assertEqual(CraftHash.checkFilesDigests(self.destDir, ["data"], digestAlgorithm=CraftHash.HashAlgorithm.SHA256), True)
+
+        self.assertEqual(self.downloader.download(f"{self.url}/missing", self.destDir, "missing", quiet=True), False)
+        self.assertFalse(os.path.exists(os.path.join(self.destDir, "missing")))
+
+    def test_resume(self):
+        self.files["/data"] = os.urandom(1024 * 1024)
+        with open(os.path.join(self.destDir, "data.part"), "wb") as f:
+            f.write(self.files["/data"][:1000])
+        self.assertEqual(self.downloader.download(f"{self.url}/data", self.destDir, "data", quiet=True), True)
+        self.assertEqual(self.requests, [("/data", "bytes=1000-")])
+        self.assertEqual(self._read("data"), self.files["/data"])
+        self.assertFalse(os.path.exists(os.path.join(self.destDir, "data.part")))
+        self.assertEqual(CraftHash.digestFile(os.path.join(self.destDir, "data")), hashlib.sha256(self.files["/data"]).hexdigest())
+
+    def test_chunks(self):
+        self.files["/data"] = os.urandom(CraftDownloader.ChunkThreshold + 3)
+        self.assertEqual(self.downloader.download(f"{self.url}/data", self.destDir, "data", quiet=True), True)
+        self.assertEqual(len([r for r in self.requests if r[1]]), 4)
+        self.assertEqual(self._read("data"), self.files["/data"])
+
+    def test_streamUnpack(self):
+        content = os.urandom(3 * 1024 * 1024)
+        with io.BytesIO() as archive:
+            with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+                info = tarfile.TarInfo("src/data")
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+            self.files["/src.tar.gz"] = archive.getvalue()
+        workDir = os.path.join(self.destDir, "work")
+        self.assertEqual(CraftStreamUnpacker.getFile(f"{self.url}/src.tar.gz", self.destDir, "src.tar.gz", workDir), True)
+        self.assertEqual(self._read("src.tar.gz"), self.files["/src.tar.gz"])
+        self.assertEqual(os.listdir(workDir), ["src"])
+        with open(os.path.join(workDir, "src", "data"), "rb") as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(CraftHash._knownDigest(os.path.join(self.destDir, "src.tar.gz"), CraftHash.HashAlgorithm.SHA256),
+                         hashlib.sha256(self.files["/src.tar.gz"]).hexdigest())
+
+        self.files["/broken.tar.gz"] = self.files["/src.tar.gz"][:100000]
+        self.assertEqual(CraftStreamUnpacker.getFile(f"{self.url}/broken.tar.gz", self.destDir, "broken.tar.gz", workDir), False)
+        self.assertEqual(os.listdir(workDir), ["src"])
+
+    def test_failingSink(self):
+        self.files["/data"] = os.urandom(3 * 1024 * 1024)
+
+        def sink(block):
+            raise OSError("disk full")
+
+        self.assertEqual(self.downloader.download(f"{self.url}/data", self.destDir, "data", quiet=True, sinks=[sink]), False)
+        # the unread response is not left on a pooled connection
+        self.assertEqual(self.downloader._pool, {})
+        self.assertEqual(self.downloader.download(f"{self.url}/data", self.destDir, "data", quiet=True), True)
+        self.assertEqual(self._read("data"), self.files["/data"])
+        self.assertEqual(len(self.connections), 2)
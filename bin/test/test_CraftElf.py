@@ -0,0 +1,17 @@
+import sys
+
+import CraftTestBase
+import utils
+from CraftCore import CraftCore
+from Utils.CraftElf import CraftElf
+
+
+class CraftElfTest(CraftTestBase.CraftTestBase):
+    def test_read(self):
+        if not CraftCore.compiler.isLinux:
+            return
+        elf = CraftElf.read(sys.executable)
+        self.assertTrue(any(x.startswith("libc.") for x in elf.needed), elf.needed)
+        self.assertIs(CraftElf.read(sys.executable), elf)
+        self.assertEqual(utils.getLibraryDeps(sys.executable), elf.needed)
+        self.assertEqual(CraftElf.read(__file__), None)
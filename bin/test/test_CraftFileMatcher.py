@@ -0,0 +1,66 @@
+import os
+import random
+import re
+import time
+import unittest
+from pathlib import Path
+
+import CraftTestBase
+from Packager.CollectionPackagerBase import PackagerLists
+from Utils.CraftFileMatcher import CraftFileMatcher
+
+
+class CraftFileMatcherTest(CraftTestBase.CraftTestBase):
+    def test_match(self):
+        patterns = [re.compile(r"(^manifest/.*$|^.*\.cmake$|^bin/qmake(\.exe)?$|^lib/[^/]*\.dll$|^bin/data/icons/breeze$)", re.IGNORECASE),
+                    re.compile(r"^$"),
+                    re.compile(r"foo(bar|baz)\d"),
+                    re.compile(r".*\.framework(/.*)*/Headers(/.*)*")]
+        matcher = CraftFileMatcher(patterns)
+        for path in ["manifest/foo.json", "Manifest/foo", "lib/cmake/Foo/FooConfig.CMAKE", "bin/qmake", "bin/qmake.exe", "bin/qmake.exe2",
+                     "lib/foo.dll", "lib/foo/bar.dll", "bin/data/icons/breeze", "bin/data/icons/breeze/foo", "share/foobaz1", "share/foobaz",
+                     "lib/Qt.framework/Versions/5/Headers/qt.h", "bin/app", ""]:
+            self.assertEqual(matcher.match(path), any(x.search(path) for x in patterns), path)
+
+    def _image(self, files):
+        """ a synthetic image with the layout of an application stack """
+        random.seed(42)
+        dirs = ["bin", "lib", "lib/plugins/imageformats", "lib/qml/QtQuick/Controls", "include/KF5/KIOCore", "share/locale/de/LC_MESSAGES",
+                "share/icons/breeze/actions/22", "share/icons/oxygen/128x128/apps", "share/doc/HTML/en/okular", "lib/cmake/KF5Config",
+                "share/applications", "share/kxmlgui5/okular", "lib/Qt.framework/Versions/5/Headers", "mkspecs/features", "manifest"]
+        suffixes = [".so", ".h", ".cmake", ".png", ".svg", ".mo", ".qml", ".docbook", ".desktop", ".rc", "", ".pc", ".a", ".dll", ".exe"]
+        return [f"{random.choice(dirs)}/file{i}{random.choice(suffixes)}" for i in range(files)]
+
+    def test_packagerLists(self):
+        # the default lists of the CollectionPackagerBase give the same result as searching the patterns one after another
+        patterns = PackagerLists.defaultBlacklist() + PackagerLists.defaultWhitelist()
+        matcher = CraftFileMatcher(patterns)
+        for path in self._image(5000):
+            self.assertEqual(matcher.match(path), any(x.search(path) for x in patterns), path)
+
+    @unittest.skipUnless(os.environ.get("CRAFT_BENCHMARK"), "set CRAFT_BENCHMARK=1 to time the packager filter")
+    def test_benchmarkPackagerLists(self):
+        image = self._image(200000)
+        patterns = PackagerLists.defaultBlacklist() + PackagerLists.defaultWhitelist()
+
+        # like utils.regexFileFilter did before
+        def regexFileFilter(path):
+            relFilePath = Path(f"/image/{path}").relative_to("/image").as_posix()
+            return any(pattern.search(relFilePath) for pattern in patterns)
+
+        start = time.perf_counter()
+        expected = [regexFileFilter(path) for path in image]
+        relativeToTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.assertEqual([any(pattern.search(path) for pattern in patterns) for path in image], expected)
+        regexTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        matcher = CraftFileMatcher(patterns)
+        result = [matcher.match(path) for path in image]
+        matcherTime = time.perf_counter() - start
+
+        self.assertEqual(result, expected)
+        print(f"\n{len(image)} files, {sum(expected)} matches: "
+              f"regex with relative_to: {relativeToTime:.2f}s, regex: {regexTime:.2f}s, matcher: {matcherTime:.2f}s")
@@ -1,3 +1,4 @@
+import hashlib
 import io
 import os
 import random
@@ -67,3 +68,41 @@ class TestAPI(CraftHashTest):
         for algorithm in algorithms:
             self.assertEquals(os.path.exists(self.tmpFile + algorithm.fileEnding()), True)
 
+
+    def test_digestFiles(self):
+        paths = [self.tmpFile]
+        # the last one is large enough to be mapped
+        for i, size in enumerate([0, 1, 1024 * 1024, 3 * 1024 * 1024 + 1, 17 * 1024 * 1024]):
+            path = os.path.join(self.tmpDir.name, f"tmpFile{i}")
+            with open(path, "wb") as f:
+                f.write(os.urandom(size))
+            paths.append(path)
+        digests = CraftHash.digestFiles(paths, CraftHash.HashAlgorithm.SHA256)
+        self.assertEqual(digests[self.tmpFile], "4fc1e96dc5ecf625efe228fce1b0964b6302cfa4d4fb2bb8d16c665d23f6ff30")
+        for path in paths:
+            with open(path, "rb") as f:
+                self.assertEqual(digests[path], hashlib.sha256(f.read()).hexdigest())
+
+    def test_knownDigest(self):
+        path = os.path.join(self.tmpDir.name, "known")
+        with open(path, "wb") as f:
+            f.write(b"a" * 1024)
+        CraftHash.addKnownDigest(path, CraftHash.HashAlgorithm.SHA256, "known")
+        self.assertEqual(CraftHash.digestFile(path), "known")
+
+        # same size and the old mtime, but the content changed
+        stat = os.stat(path)
+        with open(path, "wb") as f:
+            f.write(b"b" * 1024)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(CraftHash.digestFile(path), hashlib.sha256(b"b" * 1024).hexdigest())
+
+        # the file was replaced by another one
+        CraftHash.addKnownDigest(path, CraftHash.HashAlgorithm.SHA256, "known")
+        stat = os.stat(path)
+        other = os.path.join(self.tmpDir.name, "other")
+        with open(other, "wb") as f:
+            f.write(b"c" * 1024)
+        os.utime(other, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(other, path)
+        self.assertEqual(CraftHash.digestFile(path), hashlib.sha256(b"c" * 1024).hexdigest())
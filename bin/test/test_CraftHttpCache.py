@@ -0,0 +1,56 @@
+import http.server
+import os
+import tempfile
+
+import CraftTestBase
+from CraftCore import CraftCore
+from Utils.CraftHttpCache import CraftHttpCache
+
+
+class CraftHttpCacheTest(CraftTestBase.CraftTestBase):
+    def setUp(self):
+        super().setUp()
+        self.served = tempfile.TemporaryDirectory()
+        self.requests = []
+        test = self
+
+        class Handler(http.server.SimpleHTTPRequestHandler):
+            def send_head(self):
+                # SimpleHTTPRequestHandler only answers conditional requests since python 3.7
+                path = self.translate_path(self.path)
+                if os.path.isfile(path) and self.headers.get("If-Modified-Since") == self.date_time_string(int(os.path.getmtime(path))):
+                    self.send_response(304)
+                    self.end_headers()
+                    return None
+                return super().send_head()
+
+            def log_message(self, format, *args):
+                test.requests.append((self.path, args[1]))
+
+        self.url = self.startHttpServer(Handler, directory=self.served.name)
+
+    def tearDown(self):
+        del self.served
+        super().tearDown()
+
+    def test_get(self):
+        cacheDir = os.path.join(self.kdeRoot.name, "http-cache")
+        with open(os.path.join(self.served.name, "manifest.json"), "wt") as f:
+            f.write("{}")
+        CraftCore.settings.set("General", "HttpCacheTtl", "0")
+        CraftCore.settings.set("General", "HttpCacheNegativeTtl", "0")
+        cache = CraftHttpCache(cacheDir)
+        self.assertEqual(cache.get(f"{self.url}/manifest.json"), b"{}")
+        # reused in the same process
+        self.assertEqual(cache.get(f"{self.url}/manifest.json"), b"{}")
+        self.assertEqual(self.requests, [("/manifest.json", "200")])
+
+        # a new process revalidates the expired entry
+        self.assertEqual(CraftHttpCache(cacheDir).get(f"{self.url}/manifest.json"), b"{}")
+        self.assertEqual(self.requests[-1], ("/manifest.json", "304"))
+
+        # a missing file is retried once the negative entry expired
+        self.assertEqual(cache.get(f"{self.url}/missing.json"), None)
+        with open(os.path.join(self.served.name, "missing.json"), "wt") as f:
+            f.write("[]")
+        self.assertEqual(cache.get(f"{self.url}/missing.json"), b"[]")
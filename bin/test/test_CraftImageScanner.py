@@ -0,0 +1,37 @@
+import os
+import tempfile
+
+import CraftTestBase
+from CraftCore import CraftCore
+from Utils.CraftImageScanner import CraftImageScanner
+
+
+class CraftImageScannerTest(CraftTestBase.CraftTestBase):
+    def test_scan(self):
+        if not CraftCore.compiler.isLinux:
+            return
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "bin"))
+            os.makedirs(os.path.join(tmp, "lib", "pkgconfig"))
+            files = {"bin/app": b"\x7fELF" + b"\0" * 16, "bin/script": b"#!/bin/sh\n", "lib/libfoo.so": b"",
+                     "lib/libfoo.so.sym": b"", "lib/pkgconfig/foo.pc": b"prefix=/foo\n"}
+            for name, content in files.items():
+                with open(os.path.join(tmp, name), "wb") as f:
+                    f.write(content)
+            os.chmod(os.path.join(tmp, "bin", "app"), 0o755)
+            os.chmod(os.path.join(tmp, "bin", "script"), 0o755)
+            os.symlink("libfoo.so", os.path.join(tmp, "lib", "libfoo.so.1"))
+
+            for root, dirs, _ in os.walk(tmp):
+                for d in dirs + [root]:
+                    os.utime(os.path.join(root, d), (0, 0))
+            image = CraftImageScanner.scan(tmp)
+            self.assertEqual(sorted(image.binaries), [os.path.join(tmp, "bin", "app"), os.path.join(tmp, "lib", "libfoo.so")])
+            self.assertEqual(image.patchable, [os.path.join(tmp, "lib", "pkgconfig", "foo.pc")])
+            self.assertEqual(image.debugSymbols, [os.path.join(tmp, "lib", "libfoo.so.sym")])
+            self.assertEqual(image.symlinks, [os.path.join(tmp, "lib", "libfoo.so.1")])
+            self.assertIs(CraftImageScanner.scan(tmp), image)
+
+            with open(os.path.join(tmp, "bin", "other.so"), "wb") as f:
+                pass
+            self.assertEqual(len(CraftImageScanner.scan(tmp).binaries), 3)
@@ -0,0 +1,40 @@
+import json
+import os
+import tempfile
+
+import CraftTestBase
+from CraftCore import CraftCore
+from Utils.CraftManifest import CraftManifest, CraftManifestEntryFile
+
+
+class CraftManifestTest(CraftTestBase.CraftTestBase):
+    def test_migrate(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            manifest = CraftManifest()
+            manifest.get("libs/foo").addFile("foo-1.7z", "abc", version="1")
+            manifest.get("libs/foo").addFile("foo-2.7z", "def", version="2")
+            manifest.get("libs/bar", compiler="all").addFile("bar.tar.xz", "ghi", version="1")
+            manifest.dump(os.path.join(tmp, "manifest.json"))
+            self.assertFalse(CraftManifest.isSharded(tmp))
+            self.assertEqual(CraftManifest.getEntry(tmp, "libs/foo").latest.fileName, "foo-2.7z")
+
+            CraftManifest.migrate(tmp)
+            self.assertTrue(CraftManifest.isSharded(tmp))
+            self.assertEqual([x.fileName for x in CraftManifest.getEntry(tmp, "libs/foo").files], ["foo-2.7z", "foo-1.7z"])
+            self.assertEqual(CraftManifest.getEntry(tmp, "libs/bar", compiler="all").latest.checksum, "ghi")
+            self.assertEqual(CraftManifest.getEntry(tmp, "libs/bar", compiler="all").latest.codec, "tar.xz")
+            self.assertEqual(CraftManifest.getEntry(tmp, "libs/bar").files, [])
+
+            CraftManifest.addEntryFile(tmp, "libs/foo", CraftManifestEntryFile("foo-3.7z", "jkl", version="3"))
+            baz = CraftManifestEntryFile("baz-1.7z", "mno", version="1", codec="tar.zst")
+            baz.fileList = "baz-1.7z.filelist.json"
+            baz.fileListChecksum = "pqr"
+            CraftManifest.addEntryFile(tmp, "libs/baz", baz)
+            self.assertEqual([x.version for x in CraftManifest.getEntry(tmp, "libs/foo").files], ["3", "2", "1"])
+            self.assertEqual(CraftManifest.getEntry(tmp, "libs/baz").latest.fileName, "baz-1.7z")
+            self.assertEqual(CraftManifest.getEntry(tmp, "libs/baz").latest.codec, "tar.zst")
+            self.assertEqual(CraftManifest.getEntry(tmp, "libs/baz").latest.fileListChecksum, "pqr")
+            self.assertEqual(CraftManifest.getEntry(tmp, "libs/foo").latest.fileList, None)
+            shard = os.path.join(tmp, "manifest", str(CraftCore.compiler), "libs", "foo.jsonl")
+            with open(shard, "rt") as f:
+                self.assertEqual(json.loads(f.readlines()[-1])["fileName"], "foo-3.7z")
@@ -0,0 +1,65 @@
+import http.server
+import os
+import time
+
+import CraftTestBase
+from CraftCore import CraftCore
+from Utils.CraftMirrors import CraftMirrors
+
+
+class CraftMirrorsTest(CraftTestBase.CraftTestBase):
+    def setUp(self):
+        super().setUp()
+        self.requests = []
+        CraftCore.settings.set("General", "MirrorSelection", "True")
+        CraftCore.cache.mirrorStats = {}
+        self.fast = self._startServer(0)
+        self.slow = self._startServer(0.5)
+
+    def _startServer(self, delay):
+        test = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def _respond(self, body):
+                time.sleep(delay)
+                test.requests.append((self.server.server_port, self.command))
+                self.send_response(200)
+                self.send_header("Content-Length", "4")
+                self.end_headers()
+                if body:
+                    self.wfile.write(b"data")
+
+            def do_HEAD(self):
+                self._respond(False)
+
+            def do_GET(self):
+                self._respond(True)
+
+            def log_message(self, format, *args):
+                pass
+
+        return self.startHttpServer(Handler)
+
+    def test_sort(self):
+        unreachable = "http://127.0.0.1:1"
+        self.assertEqual(CraftMirrors.sort([unreachable, f"{self.slow}/a", f"{self.fast}/a"]),
+                         [f"{self.fast}/a", f"{self.slow}/a", unreachable])
+        # the results are cached
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(CraftMirrors.sort([f"{self.slow}/b", f"{self.fast}/b"]), [f"{self.fast}/b", f"{self.slow}/b"])
+        self.assertEqual(len(self.requests), 2)
+
+    def test_race(self):
+        self.assertEqual(CraftMirrors.race([f"{self.slow}/a", f"{self.fast}/a"]), f"{self.fast}/a")
+
+    def test_getFile(self):
+        fetched = []
+
+        def fetch(url, destdir, filename):
+            fetched.append(url)
+            return url.startswith(self.slow)
+
+        self.assertEqual(CraftMirrors.getFile([f"{self.slow}/a", f"{self.fast}/a"], self.kdeRoot.name, "a", fetch=fetch), True)
+        # the fast mirror is tried first, the slow one is the fallback
+        self.assertEqual(fetched, [f"{self.fast}/a", f"{self.slow}/a"])
+        self.assertEqual(CraftCore.cache.mirrorStats[self.fast]["failures"], 1)
@@ -0,0 +1,55 @@
+import os
+import tempfile
+
+import CraftTestBase
+from CraftOS.OsDetection import OsDetection
+from Utils.CraftObjectStore import CraftObjectStore
+
+
+class CraftObjectStoreTest(CraftTestBase.CraftTestBase):
+    def _writeImage(self, image, version):
+        os.makedirs(os.path.join(image, "bin"))
+        os.makedirs(os.path.join(image, "share", "empty"))
+        with open(os.path.join(image, "bin", "app"), "wb") as f:
+            f.write(b"app" * 1000 + version)
+        os.chmod(os.path.join(image, "bin", "app"), 0o755)
+        for name in ["a", "b"]:
+            with open(os.path.join(image, "share", name), "wb") as f:
+                f.write(b"shared data")
+        if OsDetection.isUnix():
+            os.symlink("bin/app", os.path.join(image, "app"))
+
+    def _objects(self, store):
+        return sum(len(files) for _, _, files in os.walk(store.root))
+
+    def test_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            remote = CraftObjectStore(os.path.join(tmp, "remote", "objects"))
+            for version in [b"1", b"2"]:
+                image = os.path.join(tmp, f"image{version.decode()}")
+                self._writeImage(image, version)
+                self.assertEqual(remote.createIndex(image, os.path.join(tmp, "remote", f"index{version.decode()}.json")), True)
+            # the unchanged files are stored once
+            self.assertEqual(self._objects(remote), 3)
+            if OsDetection.isUnix():
+                # the objects are readable like any other file we create
+                umask = os.umask(0o022)
+                os.umask(umask)
+                for root, _, files in os.walk(remote.root):
+                    for name in files:
+                        self.assertEqual(os.stat(os.path.join(root, name)).st_mode & 0o777, 0o666 & ~umask)
+
+            url = f"{self.startHttpServer(directory=os.path.join(tmp, 'remote'))}/objects"
+            local = CraftObjectStore(os.path.join(tmp, "local", "objects"))
+            dest = os.path.join(tmp, "restored1")
+            self.assertEqual(local.restore(os.path.join(tmp, "remote", "index1.json"), dest, url=url), True)
+            self.assertEqual(self._objects(local), 2)
+            self.assertEqual(local.restore(os.path.join(tmp, "remote", "index2.json"), os.path.join(tmp, "restored2"), url=url), True)
+            self.assertEqual(self._objects(local), 3)
+
+            with open(os.path.join(dest, "bin", "app"), "rb") as f:
+                self.assertEqual(f.read(), b"app" * 1000 + b"1")
+            self.assertTrue(os.path.isdir(os.path.join(dest, "share", "empty")))
+            if OsDetection.isUnix():
+                self.assertEqual(os.access(os.path.join(dest, "bin", "app"), os.X_OK), True)
+                self.assertEqual(os.readlink(os.path.join(dest, "app")), "bin/app")
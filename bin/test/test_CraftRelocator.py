@@ -0,0 +1,24 @@
+import os
+import tempfile
+
+import CraftTestBase
+from Utils.CraftRelocator import CraftRelocator
+
+
+class CraftRelocatorTest(CraftTestBase.CraftTestBase):
+    def test_relocate(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            files = {"a.pc": b"prefix=/old/root\nlibdir=/old/root/lib\n",
+                     "b.cmake": b"set(_IMPORT_PREFIX \"\\\\old\\\\root\")\n/c/old/root/bin",
+                     "c.txt": b"nothing to see here"}
+            for name, content in files.items():
+                with open(os.path.join(tmp, name), "wb") as f:
+                    f.write(content)
+            relocator = CraftRelocator(["/old/root", "/c/old/root"], "/new")
+            self.assertEqual(relocator.relocate([os.path.join(tmp, x) for x in files]), True)
+            expected = {"a.pc": b"prefix=/new\nlibdir=/new/lib\n",
+                        "b.cmake": b"set(_IMPORT_PREFIX \"\\\\new\")\n/new/bin",
+                        "c.txt": b"nothing to see here"}
+            for name, content in expected.items():
+                with open(os.path.join(tmp, name), "rb") as f:
+                    self.assertEqual(f.read(), content, name)
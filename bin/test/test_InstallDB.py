@@ -33,10 +33,15 @@
 
 """ Functional tests for InstallDB """
 
+import os
+from unittest import mock
+
 import CraftTestBase
 
 import InstallDB
 from Blueprints.CraftPackageObject import *
+from Utils import CraftHash
+from Utils.CraftMergeJournal import CraftMergeJournal
 
 
 class TestAPI(CraftTestBase.CraftTestBase):
@@ -48,3 +53,73 @@ class TestAPI(CraftTestBase.CraftTestBase):
         package.addFiles(dict().fromkeys(['test', 'test1', 'test2'], 'empty hash'))
         package.install()
         self.assertEquals(CraftCore.installdb.isInstalled(packageInstance, '1.4.0'), True)
+
+    def test_getInstalledVersions(self):
+        packageInstance = CraftPackageObject.get('craft/craft-core')
+        CraftCore.installdb.addInstalled(packageInstance, '1.4.0', revision="abc", cacheVersion="2").install()
+        installed = CraftCore.installdb.getInstalledVersions([packageInstance, CraftPackageObject.get('craft/craft-blueprints-kde')])
+        self.assertEqual(installed, {'craft/craft-core': [('1.4.0', 'abc', '2')]})
+
+    def test_schema(self):
+        cursor = CraftCore.installdb.connection.cursor()
+        cursor.execute('''PRAGMA user_version;''')
+        self.assertEqual(cursor.fetchall()[0][0], InstallDB.InstallDB.SCHEMA_VERSION)
+        cursor.execute('''PRAGMA journal_mode;''')
+        self.assertEqual(cursor.fetchall()[0][0], "wal")
+        cursor.execute('''EXPLAIN QUERY PLAN SELECT filename FROM fileList WHERE packageId=?;''', (1,))
+        self.assertIn("fileList_packageId", str(cursor.fetchall()))
+
+    def test_digestFiles(self):
+        path = os.path.join(self.kdeRoot.name, "hashed")
+        with open(path, "wt") as f:
+            f.write("foo")
+        digest = CraftCore.installdb.digestFiles([path])[path]
+        self.assertEqual(digest, CraftHash.digestFile(path))
+        # the file is unchanged, the stored digest is used
+        with mock.patch("Utils.CraftHash.digestFiles", wraps=CraftHash.digestFiles) as digestFiles:
+            self.assertEqual(CraftCore.installdb.digestFiles([path])[path], digest)
+        self.assertNotIn(path, [x for call in digestFiles.call_args_list for x in call[0][0]])
+        stat = os.stat(path)
+        # same size and mtime, but the ctime reveals the modification
+        with open(path, "wt") as f:
+            f.write("bar")
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(CraftCore.installdb.digestFiles([path])[path], CraftHash.digestFile(path))
+
+    def test_mergeJournal(self):
+        packageInstance = CraftPackageObject.get('craft/craft-core')
+        root = CraftCore.standardDirs.craftRoot()
+
+        def write(path, content):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wt") as f:
+                f.write(content)
+
+        def read(path):
+            with open(path, "rt") as f:
+                return f.read()
+
+        write(os.path.join(root, "bin", "old"), "old")
+        write(os.path.join(root, "bin", "shared"), "old")
+        for state in ["swapping", "committed"]:
+            journal = CraftMergeJournal.begin(packageInstance)
+            write(os.path.join(journal.imageDir, "bin", "shared"), "new")
+            write(os.path.join(journal.imageDir, "bin", "new"), "new")
+            self.assertEqual(journal.swap([os.path.join("bin", "shared"), os.path.join("bin", "new")], [os.path.join("bin", "old")]), True)
+            self.assertEqual(read(os.path.join(root, "bin", "shared")), "new")
+            self.assertFalse(os.path.exists(os.path.join(root, "bin", "old")))
+            CraftCore.installdb.setMergeJournalState(journal.journalId, state)
+
+            # simulate an interrupted merge
+            CraftMergeJournal._recovered = False
+            CraftMergeJournal.recover()
+            self.assertEqual(CraftCore.installdb.getMergeJournals(), [])
+            self.assertFalse(os.path.exists(journal.stagingDir))
+            if state == "swapping":
+                self.assertEqual(read(os.path.join(root, "bin", "shared")), "old")
+                self.assertEqual(read(os.path.join(root, "bin", "old")), "old")
+                self.assertFalse(os.path.exists(os.path.join(root, "bin", "new")))
+            else:
+                self.assertEqual(read(os.path.join(root, "bin", "shared")), "new")
+                self.assertEqual(read(os.path.join(root, "bin", "new")), "new")
+                self.assertFalse(os.path.exists(os.path.join(root, "bin", "old")))
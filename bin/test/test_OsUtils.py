@@ -1,15 +1,24 @@
+import gzip
+import io
 import os
+import random
 import subprocess
+import tarfile
 import tempfile
 import time
 import threading
 import unittest
+import zipfile
+import zlib
+from unittest import mock
 
 import CraftTestBase
 import utils
 from CraftCore import CraftCore
 from CraftOS.osutils import OsUtils, LockFile
 from CraftOS.OsDetection import OsDetection
+from Utils.CraftArchive import CraftArchive
+from Utils.CraftCopyEngine import CraftCopyEngine
 
 
 class OsUtilsTest(CraftTestBase.CraftTestBase):
@@ -63,5 +72,226 @@ class OsUtilsTest(CraftTestBase.CraftTestBase):
                print("locked lock2")
             print("end")
 
+    def test_copyDir(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            dest = os.path.join(tmp, "dest")
+            os.makedirs(os.path.join(src, "a", "b"))
+            with open(os.path.join(src, "a", "b", "data"), "wb") as f:
+                f.write(os.urandom(1024 * 1024 + 1))
+            with open(os.path.join(src, "text"), "wt") as f:
+                f.write("foo")
+            if OsDetection.isUnix():
+                os.symlink("a", os.path.join(src, "link"))
+            for linkOnly in [False, True]:
+                copiedFiles = []
+                self.assertEqual(utils.copyDir(src, dest, linkOnly=linkOnly, copiedFiles=copiedFiles), True)
+                self.assertEqual(len(copiedFiles), 3 if OsDetection.isUnix() else 2)
+                for name in [os.path.join("a", "b", "data"), "text"]:
+                    with open(os.path.join(src, name), "rb") as f1, open(os.path.join(dest, name), "rb") as f2:
+                        self.assertEqual(f1.read(), f2.read())
+                if OsDetection.isUnix():
+                    self.assertEqual(os.readlink(os.path.join(dest, "link")), "a")
+
+    def test_copyEngineLinkOnly(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            names = ["a", "b", "c"]
+            for name in names:
+                with open(os.path.join(tmp, name), "wt") as f:
+                    f.write(name)
+            devices = (os.stat(tmp).st_dev, os.stat(tmp).st_dev)
+            CraftCopyEngine._noReflink.discard(devices)
+            engine = CraftCopyEngine(linkOnly=True)
+            self.assertEqual(engine.copyFile(os.path.join(tmp, "a"), os.path.join(tmp, "a.out")), True)
+            if devices not in CraftCopyEngine._noReflink:
+                # the file system supports reflinks
+                return
+            # once a reflink failed the files are linked right away
+            with mock.patch.object(CraftCopyEngine, "_reflink", side_effect=AssertionError("no reflink expected")):
+                self.assertEqual(engine.copyFiles([(os.path.join(tmp, x), os.path.join(tmp, f"{x}.out")) for x in names[1:]]), True)
+            self.assertEqual(engine.methods, {"hardlink": 3})
+            for name in names:
+                self.assertTrue(os.path.samefile(os.path.join(tmp, name), os.path.join(tmp, f"{name}.out")))
+
+    def test_compressTarGz(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            os.makedirs(os.path.join(src, "bin"))
+            content = os.urandom(100 * 1024) + b"craft" * 20000
+            with open(os.path.join(src, "bin", "data"), "wb") as f:
+                f.write(content)
+            archive = os.path.join(tmp, "src.tar.gz")
+            with mock.patch.object(CraftArchive._ParallelGzipWriter, "BlockSize", 16 * 1024):
+                self.assertEqual(CraftArchive.compressTarGz(archive, src, jobs=4), True)
+            # every block is a gzip member of its own
+            members = 0
+            with open(archive, "rb") as f:
+                data = f.read()
+            while data:
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                decompressor.decompress(data)
+                data = decompressor.unused_data
+                members += 1
+            self.assertGreater(members, 1)
+            with gzip.open(archive, "rb") as f:
+                self.assertEqual(tarfile.open(fileobj=io.BytesIO(f.read())).extractfile("bin/data").read(), content)
+            with tarfile.open(archive, "r:gz") as tar:
+                self.assertEqual(tar.getnames(), ["bin", "bin/data"])
+                self.assertEqual(tar.extractfile("bin/data").read(), content)
+            # the workers are stopped on errors as well
+            threads = threading.active_count()
+            with mock.patch.object(CraftArchive._ParallelGzipWriter, "BlockSize", 16 * 1024), \
+                    mock.patch.object(CraftArchive._ParallelGzipWriter, "close", side_effect=OSError("disk full")):
+                self.assertEqual(CraftArchive.compressTarGz(os.path.join(tmp, "broken.tar.gz"), src, jobs=4), False)
+            self.assertEqual(threading.active_count(), threads)
+
+    def test_compress(self):
+        codecs = ["tar.gz", "tar.xz"]
+        if CraftCore.cache.findApplication("zstd"):
+            codecs.append("tar.zst")
+        if CraftCore.cache.findApplication("7za"):
+            codecs += ["tar.7z", "7z"]
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            os.makedirs(os.path.join(src, "bin"))
+            content = os.urandom(1024) * 64
+            with open(os.path.join(src, "bin", "data"), "wb") as f:
+                f.write(content)
+            for codec in codecs:
+                archive = os.path.join(tmp, f"src.{codec}")
+                self.assertEqual(utils.compress(archive, src), True, codec)
+                dest = os.path.join(tmp, f"{codec}.out")
+                self.assertEqual(utils.unpackFile(tmp, os.path.basename(archive), dest), True, codec)
+                with open(os.path.join(dest, "bin", "data"), "rb") as f:
+                    self.assertEqual(f.read(), content, codec)
+
+    @unittest.skipUnless(os.environ.get("CRAFT_BENCHMARK_IMAGE"), "set CRAFT_BENCHMARK_IMAGE to an image dir to compare the codecs")
+    def test_benchmarkCompress(self):
+        # ratio and speed of the codecs of utils.compress on a real image dir
+        image = os.environ["CRAFT_BENCHMARK_IMAGE"]
+        imageSize = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(image)
+                        for f in files if not os.path.islink(os.path.join(root, f)))
+        print(f"\n{image}: {imageSize / 1024 / 1024:.1f} MiB")
+        codecs = ["tar.gz", "tar.xz"]
+        if CraftCore.cache.findApplication("zstd"):
+            codecs.append("tar.zst")
+        if CraftCore.cache.findApplication("7za"):
+            codecs += ["tar.7z", "7z"]
+        for jobs in sorted({1, os.cpu_count() or 1}):
+            CraftCore.settings.set("Packager", "CompressionJobs", str(jobs))
+            for codec in codecs:
+                with tempfile.TemporaryDirectory() as tmp:
+                    archive = os.path.join(tmp, f"image.{codec}")
+                    start = time.perf_counter()
+                    self.assertEqual(utils.compress(archive, image), True, codec)
+                    compressTime = time.perf_counter() - start
+                    start = time.perf_counter()
+                    self.assertEqual(utils.unpackFile(tmp, os.path.basename(archive), os.path.join(tmp, "out")), True, codec)
+                    unpackTime = time.perf_counter() - start
+                    size = os.path.getsize(archive)
+                    print(f"{codec:8} jobs: {jobs:2} ratio: {imageSize / size:5.2f} "
+                          f"compress: {compressTime:6.2f}s ({imageSize / compressTime / 1024 / 1024:6.1f} MiB/s) "
+                          f"unpack: {unpackTime:6.2f}s")
+
+    def test_unpackArchive(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            os.makedirs(os.path.join(src, "bin"))
+            with open(os.path.join(src, "bin", "tool"), "wt") as f:
+                f.write("#!/bin/sh")
+            os.chmod(os.path.join(src, "bin", "tool"), 0o755)
+            if OsDetection.isUnix():
+                os.symlink("bin/tool", os.path.join(src, "link"))
+            tarName = os.path.join(tmp, "src.tar.xz")
+            with tarfile.open(tarName, "w:xz") as tar:
+                tar.add(src, arcname="src")
+            zipName = os.path.join(tmp, "src.zip")
+            with zipfile.ZipFile(zipName, "w", zipfile.ZIP_DEFLATED) as archive:
+                archive.write(os.path.join(src, "bin", "tool"), "src/bin/tool")
+            for archive in [tarName, zipName]:
+                dest = os.path.join(tmp, os.path.basename(archive) + ".out")
+                self.assertEqual(CraftArchive.extract(archive, dest), True)
+                with open(os.path.join(dest, "src", "bin", "tool"), "rt") as f:
+                    self.assertEqual(f.read(), "#!/bin/sh")
+                if OsDetection.isUnix():
+                    self.assertEqual(os.access(os.path.join(dest, "src", "bin", "tool"), os.X_OK), True)
+            if OsDetection.isUnix():
+                self.assertEqual(os.readlink(os.path.join(tmp, "src.tar.xz.out", "src", "link")), "bin/tool")
+
+    def test_unpackArchiveLikeTar(self):
+        if not CraftCore.cache.findApplication("tar"):
+            return
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "src")
+            for i in range(50):
+                path = os.path.join(src, f"dir{i % 4}", f"file{i}")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(os.urandom(i * 1024))
+            for ext, mode in [(".tar.gz", "w:gz"), (".tar.xz", "w:xz")]:
+                archive = os.path.join(tmp, f"src{ext}")
+                with tarfile.open(archive, mode) as tar:
+                    tar.add(src, arcname="src")
+                native = os.path.join(tmp, f"native{ext}")
+                self.assertEqual(CraftArchive.extract(archive, native), True)
+                reference = os.path.join(tmp, f"tar{ext}")
+                os.makedirs(reference)
+                self.assertEqual(subprocess.run(["tar", "-xf", archive, "-C", reference]).returncode, 0)
+                for root, _, files in os.walk(os.path.join(reference, "src")):
+                    for name in files:
+                        path = os.path.join(root, name)
+                        with open(path, "rb") as f1, open(os.path.join(native, os.path.relpath(path, reference)), "rb") as f2:
+                            self.assertEqual(f1.read(), f2.read())
+                self.assertEqual(sum(len(files) for _, _, files in os.walk(native)), 50)
+
+    @unittest.skipUnless(os.environ.get("CRAFT_BENCHMARK"), "set CRAFT_BENCHMARK=1 to time the unpacking")
+    def test_benchmarkUnpack(self):
+        # the timings of the in process extraction against 7za and tar, NativeUnpackThreshold is based on them
+        # name -> (number of files, size of a file)
+        layouts = {"small": (50, 4 * 1024), "medium": (2000, 16 * 1024), "large": (16, 8 * 1024 * 1024)}
+
+        def createTree(root, files, size):
+            words = [bytes(random.choice("abcdefghijklmnopqrstuvwxyz") * random.randint(1, 12), "ascii") for _ in range(4096)]
+            for i in range(files):
+                path = os.path.join(root, f"dir{i % 16}", f"file{i}")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    data = b" ".join(random.choice(words) for _ in range(size // 6))
+                    f.write(data[:size])
+
+        def measure(func, archive):
+            with tempfile.TemporaryDirectory() as dest:
+                start = time.perf_counter()
+                self.assertEqual(func(archive, dest), True)
+                return time.perf_counter() - start
+
+        random.seed(42)
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, (files, size) in layouts.items():
+                source = os.path.join(tmp, name)
+                createTree(source, files, size)
+                archives = []
+                for ext, mode in [(".tar.gz", "w:gz"), (".tar.xz", "w:xz")]:
+                    archive = os.path.join(tmp, name + ext)
+                    with tarfile.open(archive, mode) as tar:
+                        tar.add(source, arcname=name)
+                    archives.append(archive)
+                archive = os.path.join(tmp, name + ".zip")
+                with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zip:
+                    for root, _, fileNames in os.walk(source):
+                        for fileName in fileNames:
+                            path = os.path.join(root, fileName)
+                            zip.write(path, os.path.relpath(path, tmp))
+                archives.append(archive)
+
+                for archive in archives:
+                    results = [("native", measure(CraftArchive.extract, archive))]
+                    if CraftCore.cache.findApplication("7za"):
+                        results.append(("7za", measure(lambda x, dest: utils.un7zip(x, dest, os.path.splitext(x)[1]), archive)))
+                    if CraftCore.cache.findApplication("tar") and not archive.endswith(".zip"):
+                        results.append(("tar", measure(lambda x, dest: subprocess.run(["tar", "-xf", x, "-C", dest]).returncode == 0, archive)))
+                    timings = ", ".join(f"{backend}: {seconds * 1000:.1f}ms" for backend, seconds in results)
+                    print(f"\n{os.path.basename(archive)} ({os.path.getsize(archive) / 1024 / 1024:.2f} MiB): {timings}")
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,93 @@
+import json
+import os
+import tarfile
+import tempfile
+
+import CraftTestBase
+from Blueprints.CraftPackageObject import CraftPackageObject
+from CraftCore import CraftCore
+from Utils import CraftHash
+from Utils.CraftManifest import CraftManifestEntryFile
+
+
+class PackageBaseTest(CraftTestBase.CraftTestBase):
+    def _write(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wt") as f:
+            f.write(content)
+
+    def test_directCacheInstall(self):
+        CraftCore.settings.set("Packager", "DirectCacheInstall", "True")
+        CraftCore.settings.set("Packager", "CacheDir", os.path.join(self.kdeRoot.name, "cache"))
+        package = CraftPackageObject.get("dev-utils/7zip")
+        instance = package.instance
+        root = CraftCore.standardDirs.craftRoot()
+        cacheDir = instance.cacheLocation()
+        os.makedirs(cacheDir, exist_ok=True)
+        with tempfile.TemporaryDirectory() as image:
+            self._write(os.path.join(image, "bin", "7za"), "7za")
+            self._write(os.path.join(image, "share", "doc", "7zip.txt"), "doc")
+            archive = os.path.join(cacheDir, "7zip.tar.gz")
+            with tarfile.open(archive, "w:gz") as tar:
+                for name in ["bin", "share"]:
+                    tar.add(os.path.join(image, name), arcname=name)
+            fileList = instance._createFileList(archive, image)
+
+        latest = CraftManifestEntryFile(os.path.basename(archive), CraftHash.digestFile(archive), version=instance.version, codec="tar.gz")
+        latest.fileList = os.path.basename(fileList)
+        latest.fileListChecksum = CraftHash.digestFile(fileList)
+        self.assertTrue(instance._unpackBinaryCache(cacheDir, latest, archive))
+        # nothing is extracted to the image dir
+        self.assertFalse(os.path.exists(instance.imageDir()))
+        self.assertTrue(instance.installBinaryCache())
+
+        with open(fileList, "rt", encoding="UTF-8") as f:
+            expected = sorted(tuple(x) for x in json.load(f)["files"])
+        self.assertEqual(sorted(x[1] for x in expected),
+                         sorted(CraftHash.HashAlgorithm.SHA256.stringPrefix() + CraftHash.digestString(x, CraftHash.HashAlgorithm.SHA256) for x in ["7za", "doc"]))
+        installed = CraftCore.installdb.getInstalledPackages(package)
+        self.assertEqual(len(installed), 1)
+        self.assertEqual(installed[0].getCacheVersion(), instance.cacheVersion())
+        self.assertEqual(sorted(installed[0].getFilesWithHashes()), expected)
+        for filename, _ in expected:
+            self.assertTrue(os.path.isfile(os.path.join(root, filename)))
+
+        # the digests of the extracted files are taken from the file list
+        cursor = CraftCore.installdb.connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM hashStore;")
+        self.assertEqual(cursor.fetchall()[0][0], len(expected))
+        paths = [os.path.join(root, filename) for filename, _ in expected]
+        digests = CraftCore.installdb.digestFiles(paths, CraftHash.HashAlgorithm.SHA256)
+        self.assertEqual(sorted(CraftHash.HashAlgorithm.SHA256.stringPrefix() + digests[x] for x in paths), sorted(x[1] for x in expected))
+
+    def test_incrementalMerge(self):
+        CraftCore.settings.set("General", "IncrementalMerge", "True")
+        CraftCore.settings.set("General", "UseHardlinks", "True")
+        package = CraftPackageObject.get("dev-utils/7zip")
+        instance = package.instance
+        root = CraftCore.standardDirs.craftRoot()
+        image = instance.imageDir()
+        self._write(os.path.join(image, "bin", "7za"), "7za")
+        self._write(os.path.join(image, "share", "unchanged"), "unchanged")
+        self._write(os.path.join(image, "share", "vanished"), "vanished")
+        self.assertTrue(instance.qmerge())
+        unchanged = os.stat(os.path.join(root, "share", "unchanged"))
+
+        self._write(os.path.join(image, "bin", "7za"), "new 7za")
+        self._write(os.path.join(image, "share", "new"), "new")
+        os.remove(os.path.join(image, "share", "vanished"))
+        fileList, toCopy, toUnmerge = instance._incrementalMergePlan(CraftCore.installdb.getInstalledPackages(package))
+        self.assertEqual(sorted(x[0] for x in fileList), [os.path.join("bin", "7za"), os.path.join("share", "new"), os.path.join("share", "unchanged")])
+        self.assertEqual(sorted(toCopy), [os.path.join("bin", "7za"), os.path.join("share", "new")])
+        self.assertEqual(sorted(x[0] for x in toUnmerge), [os.path.join("bin", "7za"), os.path.join("share", "vanished")])
+
+        self.assertTrue(instance.qmerge())
+        self.assertFalse(os.path.exists(os.path.join(root, "share", "vanished")))
+        with open(os.path.join(root, "bin", "7za"), "rt") as f:
+            self.assertEqual(f.read(), "new 7za")
+        # the unchanged file is not touched, the new files are linked as requested by UseHardlinks
+        self.assertEqual(os.stat(os.path.join(root, "share", "unchanged")).st_mtime_ns, unchanged.st_mtime_ns)
+        self.assertTrue(os.path.samefile(os.path.join(root, "share", "new"), os.path.join(image, "share", "new")))
+        installed = CraftCore.installdb.getInstalledPackages(package)
+        self.assertEqual(len(installed), 1)
+        self.assertEqual(sorted(installed[0].getFilesWithHashes()), sorted(fileList))
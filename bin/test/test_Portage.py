@@ -1,4 +1,7 @@
 import importlib
+import os
+import tempfile
+from unittest import mock
 
 import CraftConfig
 import CraftTestBase
@@ -28,3 +31,23 @@ class TestAPI(CraftBlueprintTest):
 
     def test_msvc2015_x64(self):
         self.blueprintTest("windows-msvc2015_64-cl")
+
+    def test_metaDataKey(self):
+        package = CraftPackageObject.CraftPackageObject.get("dev-utils/7zip")
+        with tempfile.TemporaryDirectory() as tmp:
+            blueprintDir = os.path.join(tmp, "category", "7zip")
+            os.makedirs(blueprintDir)
+            with mock.patch.object(package, "filePath", blueprintDir):
+                keys = [package._metaDataKey()]
+                # the targets of a blueprint might be defined in a version.ini of a parent dir
+                with open(os.path.join(tmp, "category", "version.ini"), "wt") as f:
+                    f.write("[General]\ntags = 1.0\ninclude = ../common.ini\n")
+                keys.append(package._metaDataKey())
+                with open(os.path.join(tmp, "category", "version.ini"), "wt") as f:
+                    f.write("[General]\ntags = 1.1\ninclude = ../common.ini\n")
+                keys.append(package._metaDataKey())
+                with open(os.path.join(tmp, "common.ini"), "wt") as f:
+                    f.write("[General]\ntarballs = 1.1\n")
+                keys.append(package._metaDataKey())
+                self.assertEqual(package._metaDataKey(), keys[-1])
+        self.assertEqual(len(set(keys)), len(keys))
@@ -0,0 +1,102 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+import CraftTestBase
+import CraftStandardDirs
+import utils
+from CraftCore import CraftCore
+
+
+class UtilsTest(CraftTestBase.CraftTestBase):
+    def _binaries(self, tmp, count):
+        source = os.path.join(tmp, "main.c")
+        with open(source, "wt") as f:
+            f.write("int main() { return 0; }\n")
+        out = []
+        for i in range(count):
+            binary = os.path.join(tmp, f"app{i}")
+            subprocess.check_call(["gcc", "-g", "-o", binary, source])
+            out.append(binary)
+        return out
+
+    def test_stripFiles(self):
+        if not CraftCore.compiler.isLinux or not shutil.which("gcc"):
+            return
+        with tempfile.TemporaryDirectory() as tmp:
+            binaries = self._binaries(tmp, 4)
+            sizes = [os.path.getsize(x) for x in binaries]
+            self.assertTrue(utils.stripFiles(binaries))
+            for binary, size in zip(binaries, sizes):
+                self.assertLess(os.path.getsize(binary), size)
+                self.assertTrue(os.path.exists(f"{binary}.sym"))
+
+    def test_stripCache(self):
+        if not CraftCore.compiler.isLinux or not shutil.which("gcc"):
+            return
+        CraftCore.settings.set("Compile", "StripCache", "True")
+        CraftCore.settings.set("Paths", "DOWNLOADDIR", os.path.join(self.kdeRoot.name, "download"))
+        CraftCore.standardDirs = CraftStandardDirs.CraftStandardDirs(self.kdeRoot.name)
+        with tempfile.TemporaryDirectory() as tmp:
+            binary, = self._binaries(tmp, 1)
+            unstripped = f"{binary}.unstripped"
+            shutil.copyfile(binary, unstripped)
+
+            with mock.patch("utils.system", wraps=utils.system) as system:
+                self.assertTrue(utils.strip(binary))
+                self.assertEqual(system.call_count, 3)
+            with open(binary, "rb") as f:
+                stripped = f.read()
+            with open(f"{binary}.sym", "rb") as f:
+                symbols = f.read()
+            self.assertTrue(os.path.isdir(os.path.join(self.kdeRoot.name, "download", "strip-cache")))
+
+            # the same binary is taken from the cache
+            os.remove(f"{binary}.sym")
+            shutil.copyfile(unstripped, binary)
+            with mock.patch("utils.system", wraps=utils.system) as system:
+                self.assertTrue(utils.strip(binary))
+                self.assertEqual(system.call_count, 0)
+            with open(binary, "rb") as f:
+                self.assertEqual(f.read(), stripped)
+            with open(f"{binary}.sym", "rb") as f:
+                self.assertEqual(f.read(), symbols)
+
+            # a changed binary is stripped again
+            os.remove(f"{binary}.sym")
+            with open(unstripped, "ab") as f:
+                f.write(b"\0")
+            shutil.copyfile(unstripped, binary)
+            with mock.patch("utils.system", wraps=utils.system) as system:
+                self.assertTrue(utils.strip(binary))
+                self.assertEqual(system.call_count, 3)
+
+    def test_stripFilesBundle(self):
+        # the binaries of a bundle share one dSYM, they must not be stripped at the same time
+        CraftCore.settings.set("Compile", "Jobs", "4")
+        files = ["/foo.framework/Versions/A/foo", "/foo.framework/Versions/A/Helpers/bar", "/foo.framework/Versions/A/Helpers/baz", "/bin/tool"]
+        lock = threading.Lock()
+        active = set()
+        stripped = []
+
+        def strip(fileName):
+            symFile = utils._stripSymbolFile(Path(fileName))[0]
+            with lock:
+                self.assertNotIn(symFile, active)
+                active.add(symFile)
+            time.sleep(0.05)
+            with lock:
+                active.remove(symFile)
+                stripped.append(fileName)
+            return True
+
+        with mock.patch("CraftCompiler.CraftCompiler.isMacOS", new_callable=mock.PropertyMock, return_value=True):
+            self.assertEqual(utils._stripSymbolFile(Path(files[0])), (Path("/foo.framework.dSYM"), True))
+            with mock.patch("utils.strip", side_effect=strip):
+                self.assertTrue(utils.stripFiles(files))
+        self.assertEqual(sorted(stripped), sorted(files))
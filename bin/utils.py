@@ -26,11 +26,13 @@
 # OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
 # SUCH DAMAGE.
 
+import concurrent.futures
 import configparser
 import contextlib
 import glob
 import inspect
 import io
+import multiprocessing
 import os
 import re
 import shlex
@@ -46,6 +48,10 @@ from Blueprints.CraftVersion import CraftVersion
 from CraftCore import CraftCore
 from CraftDebug import deprecated
 from CraftOS.osutils import OsUtils
+from Utils import CraftHash
+from Utils.CraftArchive import CraftArchive
+from Utils.CraftCopyEngine import CraftCopyEngine
+from Utils.CraftElf import CraftElf
 
 
 def abstract():
@@ -64,8 +70,9 @@ def unpackFiles(downloaddir, filenames, workdir):
     return True
 
 
-def unpackFile(downloaddir, filename, workdir):
-    """unpack file specified by 'filename' from 'downloaddir' into 'workdir'"""
+def unpackFile(downloaddir, filename, workdir, codec : str=None):
+    """unpack file specified by 'filename' from 'downloaddir' into 'workdir'
+    codec is the codec recorded in the manifest of a binary cache, by default it is derived from the file name"""
     CraftCore.log.debug(f"unpacking this file: {filename}")
     if not filename:
         return True
@@ -79,6 +86,14 @@ def unpackFile(downloaddir, filename, workdir):
         CraftCore.log.warning("Please enable Windows 10 development mode to enable support for symlinks.\n"
                               "This will enable faster extractions.\n"
                               "https://docs.microsoft.com/en-us/windows/uwp/get-started/enable-your-device-for-development")
+    if (codec or CraftArchive.codecFromFileName(filename)) == "tar.zst":
+        return unZstd(os.path.join(downloaddir, filename), workdir)
+    # for small archives starting 7za takes longer than extracting them in process
+    nativeThreshold = int(CraftCore.settings.get("General", "NativeUnpackThreshold", "0")) * 1024 * 1024
+    if CraftArchive.canExtract(filename) and (os.path.getsize(os.path.join(downloaddir, filename)) < nativeThreshold
+                                              or not CraftCore.cache.findApplication("7za")):
+        return (CraftArchive.extract(os.path.join(downloaddir, filename), workdir)
+                and (not OsUtils.isWin() or not CraftArchive.isTarArchive(filename) or replaceSymlinksWithCopies(workdir)))
     if CraftCore.cache.findApplication("7za"):
         # we use tar on linux not 7z, don't use tar on windows as it skips symlinks
         # test it with breeze-icons
@@ -133,13 +148,29 @@ def un7zip(fileName, destdir, flag=None):
     # While 7zip supports symlinks cmake 3.8.0 does not support symlinks
     return system(command, displayProgress=True, **kw) and (not resolveSymlinks or replaceSymlinksWithCopies(destdir))
 
-def compress(archive : str, source : str) -> bool:
+def unZstd(fileName, destdir):
+    zstd = CraftCore.cache.findApplication("zstd")
+    if not zstd:
+        CraftCore.log.error(f"Can't unpack {fileName}, zstd is not installed")
+        return False
+    createDir(destdir)
+    pipe = subprocess.Popen([zstd, "-d", "-c", "-q", fileName], stdout=subprocess.PIPE)
+    return (system([CraftCore.cache.findApplication("tar"), "--directory", destdir, "-xf", "-"], pipeProcess=pipe)
+            and (not OsUtils.isWin() or replaceSymlinksWithCopies(destdir)))
+
+def compress(archive : str, source : str, codec : str=None) -> bool:
+    """ create archive from source, the codec defaults to the one matching the file name, see CraftArchive.Codecs """
     ciMode = CraftCore.settings.getboolean("ContinuousIntegration", "Enabled", False)
+    jobs = int(CraftCore.settings.get("Packager", "CompressionJobs", str(os.cpu_count() or 1)))
+    level = CraftCore.settings.get("Packager", "CompressionLevel", "")
+
     def __7z(archive, source):
         archive = Path(archive)
         app = CraftCore.cache.findApplication("7za")
         kw = {}
-        flags = []
+        flags = [f"-mmt{jobs}"]
+        if level:
+            flags.append(f"-mx{level}")
         if archive.suffix in {".appxsym", ".appxupload"}:
             flags.append("-tzip")
         if not ciMode and CraftCore.cache.checkCommandOutputFor(app, "-bs"):
@@ -160,18 +191,32 @@ def compress(archive : str, source : str) -> bool:
             command += [os.path.join(source, "*")]
         return system(command, displayProgress=True, **kw)
 
-    def __xz(archive, source):
-        command = ["tar", "-cJf", archive, "-C"]
+    def __tarSource(source):
         if os.path.isfile(source):
-            command += [source]
-        else:
-            command += [source, "."]
-        return system(command)
+            return ["-C", os.path.dirname(source), os.path.basename(source)]
+        return ["-C", source, "."]
 
+    def __xz(archive, source):
+        # xz compresses in blocks on multiple threads
+        env = dict(os.environ)
+        env["XZ_DEFAULTS"] = f"-T{jobs}" + (f" -{level}" if level else "")
+        return system(["tar", "-cJf", archive] + __tarSource(source), env=env)
+
+    def __zstd(archive, source):
+        tar = CraftCore.cache.findApplication("tar")
+        pipe = subprocess.Popen([tar, "-cf", "-"] + __tarSource(source), stdout=subprocess.PIPE)
+        return system([CraftCore.cache.findApplication("zstd"), f"-T{jobs}", f"-{level or 9}", "-q", "-o", archive], pipeProcess=pipe)
+
+    codec = codec or CraftArchive.codecFromFileName(archive)
     createDir(os.path.dirname(archive))
     if os.path.isfile(archive):
         deleteFile(archive)
-    if CraftCore.compiler.isUnix and archive.endswith(".tar.xz"):
+    CraftCore.log.debug(f"Compressing {source} to {archive} with {codec}")
+    if codec == "tar.gz":
+        return CraftArchive.compressTarGz(archive, source, jobs, int(level) if level else None)
+    elif codec == "tar.zst":
+        return __zstd(archive, source)
+    elif CraftCore.compiler.isUnix and codec == "tar.xz":
         return __xz(archive, source)
     else:
         return __7z(archive, source)
@@ -482,25 +527,7 @@ def copyFile(src : Path, dest : Path, linkOnly=CraftCore.settings.getboolean("Ge
         dest = dest / src.name
     else:
         createDir(dest.parent)
-    if os.path.lexists(dest):
-        CraftCore.log.warning(f"Overriding:\t{dest} with\n\t\t{src}")
-        if src == dest:
-            CraftCore.log.error(f"Can't copy a file into itself {src}=={dest}")
-            return False
-        OsUtils.rm(dest, True)
-    # don't link to links
-    if linkOnly and not os.path.islink(src):
-        try:
-            os.link(src, dest)
-            return True
-        except:
-            CraftCore.log.warning("Failed to create hardlink %s for %s" % (dest, src))
-    try:
-        shutil.copy2(src, dest, follow_symlinks=False)
-    except Exception as e:
-        CraftCore.log.error(f"Failed to copy file:\n{src} to\n{dest}", exc_info=e)
-        return False
-    return True
+    return CraftCopyEngine(linkOnly=linkOnly, jobs=1).copyFile(src, dest)
 
 
 def copyDir(srcdir, destdir, linkOnly=CraftCore.settings.getboolean("General", "UseHardlinks", False), copiedFiles=None):
@@ -511,43 +538,13 @@ def copyDir(srcdir, destdir, linkOnly=CraftCore.settings.getboolean("General", "
     if not srcdir.exists():
         CraftCore.log.warning(f"copyDir called. srcdir: {srcdir} does not exists")
         return True
-    destdir = Path(destdir)
-    if not destdir.exists():
-        createDir(destdir)
-
-    try:
-        with os.scandir(srcdir) as scan:
-            for entry in scan:
-                dest = destdir / Path(entry.path).parent.relative_to(srcdir) / entry.name
-                if entry.is_dir():
-                    if entry.is_symlink():
-                    # copy the symlinks without resolving them
-                        if not copyFile(entry.path, dest, linkOnly=False):
-                            return False
-                        if copiedFiles is not None:
-                            copiedFiles.append(str(dest))
-                    else:
-                        if not copyDir(entry.path, dest, copiedFiles=copiedFiles, linkOnly=linkOnly):
-                            return False
-                else:
-                    # symlinks to files are included in `files`
-                    if not copyFile(entry.path, dest,linkOnly=linkOnly):
-                        return False
-                    if copiedFiles is not None:
-                        copiedFiles.append(str(dest))
-    except Exception as e:
-        CraftCore.log.error(f"Failed to copy dir:\n{srcdir} to\n{destdir}", exc_info=e)
-        return False
-    return True
+    return CraftCopyEngine(linkOnly=linkOnly).copyTree(srcdir, destdir, copiedFiles=copiedFiles)
 
 def globCopyDir(srcDir : str, destDir : str, pattern : [str], linkOnly=CraftCore.settings.getboolean("General", "UseHardlinks", False)) -> bool:
     files = []
     for p in pattern:
         files.extend(glob.glob(os.path.join(srcDir, p), recursive=True))
-    for f in files:
-        if not copyFile(f, os.path.join(destDir, os.path.relpath(f, srcDir)), linkOnly=linkOnly):
-            return False
-    return True
+    return CraftCopyEngine(linkOnly=linkOnly).copyFiles([(f, os.path.join(destDir, os.path.relpath(f, srcDir))) for f in files])
 
 def mergeTree(srcdir, destdir):
     """ moves directory from @p srcdir to @p destdir
@@ -958,13 +955,24 @@ def getLibraryDeps(path):
             match = infoRe.match(line)
             if match:
                 deps.append(match[1])
+    elif CraftCore.compiler.isLinux or CraftCore.compiler.isFreeBSD:
+        elf = CraftElf.read(path)
+        if elf:
+            deps = list(elf.needed)
     return deps
 
 
+def relativeEntryPath(filename : os.DirEntry, root : str) -> str:
+    """ the path of an entry found by filterDirectoryContent relative to root, with linux style seperators """
+    # the entries are found by joining the names to root, so we can cut it off
+    relFilePath = filename.path[len(str(root).rstrip("/\\")) + 1:]
+    if os.sep != "/":
+        relFilePath = relFilePath.replace(os.sep, "/")
+    return relFilePath
+
 def regexFileFilter(filename : os.DirEntry, root : str, patterns : [re]=None) -> bool:
     """ return False if file does not match pattern"""
-    # use linux style seperators
-    relFilePath = Path(filename.path).relative_to(root).as_posix()
+    relFilePath = relativeEntryPath(filename, root)
     for pattern in patterns:
         if pattern.search(relFilePath):
             CraftCore.log.debug(f"regExDirFilter: {relFilePath} matches: {pattern.pattern}")
@@ -1073,20 +1081,7 @@ def strip(fileName):
         return True
 
     fileName = Path(fileName)
-    isBundle = False
-    if CraftCore.compiler.isMacOS:
-        bundleDir = list(filter(lambda x: x.name.endswith(".framework") or x.name.endswith(".app"), fileName.parents))
-        if bundleDir:
-            suffix = ""
-            # if we are a .app in a .framework we put the smbols in the same location
-            if len(bundleDir) > 1:
-                suffix = f"-{'.'.join([x.name for x in reversed(bundleDir[0:-1])])}"
-            isBundle = True
-            symFile = Path(f"{bundleDir[-1]}{suffix}.dSYM")
-        else:
-            symFile = Path(f"{fileName}.dSYM")
-    else:
-        symFile = Path(f"{fileName}.sym")
+    symFile, isBundle = _stripSymbolFile(fileName)
 
     if not isBundle and symFile.exists():
         return True
@@ -1098,9 +1093,66 @@ def strip(fileName):
         return (system(["dsymutil", fileName, "-o", symFile]) and
                 system(["strip", "-x", "-S", fileName]))
     else:
-        return (system(["objcopy", "--only-keep-debug", fileName, symFile]) and
+        cacheDir = _stripCacheDir(fileName)
+        if cacheDir and (cacheDir / fileName.name).exists():
+            CraftCore.log.debug(f"Using the cached stripped binary {cacheDir / fileName.name}")
+            with makeTemporaryWritable(fileName):
+                shutil.copyfile(cacheDir / fileName.name, fileName)
+            shutil.copyfile(cacheDir / symFile.name, symFile)
+            return True
+        if not (system(["objcopy", "--only-keep-debug", fileName, symFile]) and
                 system(["strip", "--strip-debug", "--strip-unneeded", fileName]) and
-                system(["objcopy", "--add-gnu-debuglink", symFile, fileName]))
+                system(["objcopy", "--add-gnu-debuglink", symFile, fileName])):
+            return False
+        if cacheDir:
+            # stripping the same binary in parallel is fine, the first result is kept
+            cacheDir.parent.mkdir(parents=True, exist_ok=True)
+            tmpDir = Path(tempfile.mkdtemp(dir=cacheDir.parent))
+            shutil.copyfile(fileName, tmpDir / fileName.name)
+            shutil.copyfile(symFile, tmpDir / symFile.name)
+            try:
+                os.rename(tmpDir, cacheDir)
+            except OSError:
+                rmtree(tmpDir)
+        return True
+
+
+def _stripSymbolFile(fileName : Path) -> (Path, bool):
+    """ returns the file the debug symbols of fileName are stored in and whether it is shared by a bundle """
+    if CraftCore.compiler.isMacOS:
+        bundleDir = list(filter(lambda x: x.name.endswith(".framework") or x.name.endswith(".app"), fileName.parents))
+        if bundleDir:
+            suffix = ""
+            # if we are a .app in a .framework we put the smbols in the same location
+            if len(bundleDir) > 1:
+                suffix = f"-{'.'.join([x.name for x in reversed(bundleDir[0:-1])])}"
+            return Path(f"{bundleDir[-1]}{suffix}.dSYM"), True
+        return Path(f"{fileName}.dSYM"), False
+    return Path(f"{fileName}.sym"), False
+
+
+def _stripCacheDir(fileName : Path) -> Path:
+    """ the stripped binaries and their symbols are cached by the digest of the unstripped binary
+        the name is part of the key as it is referenced by the debug link """
+    if not CraftCore.settings.getboolean("Compile", "StripCache", False):
+        return None
+    digest = CraftHash.digestFile(fileName, CraftHash.HashAlgorithm.SHA256)
+    return Path(CraftCore.standardDirs.downloadDir()) / "strip-cache" / digest[:2] / f"{digest}-{fileName.name}"
+
+
+def stripFiles(fileNames : [str]) -> bool:
+    """ strip the files in parallel, the work is done by the external tools
+        the binaries of a bundle share their symbol file, they are stripped one after another """
+    groups = {}
+    for fileName in fileNames:
+        groups.setdefault(_stripSymbolFile(Path(fileName))[0], []).append(fileName)
+
+    def stripGroup(group):
+        return all(strip(fileName) for fileName in group)
+
+    jobs = int(CraftCore.settings.get("Compile", "Jobs", multiprocessing.cpu_count()))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        return all(list(executor.map(stripGroup, groups.values())))
 
 
 def urljoin(root, path):